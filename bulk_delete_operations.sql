@@ -3,5 +3,6 @@ DELETE FROM data.country_stat WHERE load_id = X;
 DELETE FROM data.asn_neighbour WHERE load_id = X;
 DELETE FROM data.country_traffic WHERE load_id = X;
 DELETE FROM data.country_internet_quality WHERE load_id = X;
+DELETE FROM data.etl_checkpoint WHERE load_id = X;
 DELETE FROM data.etl_load WHERE load_id = X;
 
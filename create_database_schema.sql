@@ -91,6 +91,209 @@ CREATE SCHEMA source;
 
 ALTER SCHEMA source OWNER TO ozi;
 
+--
+-- Name: bump_dataset_version(character varying, character varying[]); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.bump_dataset_version(p_dataset character varying, p_countries character varying[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+-- Mark the data of p_countries in p_dataset as changed, so that caches of
+-- the dashboard built from it are rebuilt. Called in the loading transaction.
+BEGIN
+    INSERT INTO data.dataset_version (dataset, country_iso2, version, updated)
+    SELECT DISTINCT p_dataset, country, 1, CURRENT_TIMESTAMP
+      FROM unnest(p_countries) AS country
+    ON CONFLICT (dataset, country_iso2)
+    DO UPDATE SET version = dataset_version.version + 1, updated = EXCLUDED.updated;
+END;
+$$;
+
+
+ALTER FUNCTION data.bump_dataset_version(p_dataset character varying, p_countries character varying[]) OWNER TO ozi;
+
+--
+-- Name: detach_monthly_partitions(text, timestamp without time zone); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.detach_monthly_partitions(p_table text, p_before timestamp without time zone) RETURNS SETOF text
+    LANGUAGE plpgsql
+    AS $_$
+-- Detach the monthly partitions of data.<p_table> that end on or before
+-- p_before. The detached tables are kept, to be archived and dropped.
+DECLARE
+    v_partition text;
+BEGIN
+    FOR v_partition IN
+        SELECT c.relname
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = format('data.%I', p_table)::regclass
+           AND c.relname ~ ('^' || p_table || '_p[0-9]{6}$')
+           AND to_date(right(c.relname, 6), 'YYYYMM') + interval '1 month' <= p_before
+         ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE data.%I DETACH PARTITION data.%I', p_table, v_partition);
+        RETURN NEXT v_partition;
+    END LOOP;
+END;
+$_$;
+
+
+ALTER FUNCTION data.detach_monthly_partitions(p_table text, p_before timestamp without time zone) OWNER TO ozi;
+
+--
+-- Name: ensure_monthly_partitions(text, timestamp without time zone, timestamp without time zone); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.ensure_monthly_partitions(p_table text, p_from timestamp without time zone, p_to timestamp without time zone) RETURNS integer
+    LANGUAGE plpgsql
+    AS $_$
+-- Create the monthly partitions data.<p_table>_pYYYYMM covering p_from..p_to.
+-- Rows of those months already in the default partition are moved into the
+-- new partition. Returns the number of partitions created.
+DECLARE
+    v_month timestamp without time zone := date_trunc('month', p_from);
+    v_column text;
+    v_partition text;
+    v_created integer := 0;
+BEGIN
+    SELECT a.attname INTO v_column
+      FROM pg_partitioned_table p
+      JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+     WHERE p.partrelid = format('data.%I', p_table)::regclass;
+
+    WHILE v_month <= p_to LOOP
+        v_partition := p_table || '_p' || to_char(v_month, 'YYYYMM');
+        IF to_regclass(format('data.%I', v_partition)) IS NULL THEN
+            -- Concurrent loaders may need the same month
+            PERFORM pg_advisory_xact_lock(hashtext('data.' || p_table));
+        END IF;
+        IF to_regclass(format('data.%I', v_partition)) IS NULL THEN
+            EXECUTE format('CREATE TABLE data.%I (LIKE data.%I INCLUDING DEFAULTS)', v_partition, p_table);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM data.%I WHERE %I >= $1 AND %I < $2 RETURNING *) '
+                'INSERT INTO data.%I SELECT * FROM moved',
+                p_table || '_default', v_column, v_column, v_partition)
+                USING v_month, v_month + interval '1 month';
+            EXECUTE format(
+                'ALTER TABLE data.%I ATTACH PARTITION data.%I FOR VALUES FROM (%L) TO (%L)',
+                p_table, v_partition, v_month, v_month + interval '1 month');
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_month + interval '1 month';
+    END LOOP;
+    RETURN v_created;
+END;
+$_$;
+
+
+ALTER FUNCTION data.ensure_monthly_partitions(p_table text, p_from timestamp without time zone, p_to timestamp without time zone) OWNER TO ozi;
+
+--
+-- Name: refresh_connectivity_summary(character varying, timestamp without time zone[]); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.refresh_connectivity_summary(p_country character varying DEFAULT NULL::character varying, p_dates timestamp without time zone[] DEFAULT NULL::timestamp without time zone[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $_$
+-- Recompute the connectivity summary tables for the ASNs of p_country and
+-- the dates p_dates. NULL stands for all countries / all dates.
+DECLARE
+    v_filter text := 'TRUE';
+BEGIN
+    -- One refresh at a time, the ETL workers and refersh_views.sql delete and
+    -- insert the same rows
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF p_country IS NOT NULL THEN
+        v_filter := v_filter || ' AND asn_country = $1';
+    END IF;
+    IF p_dates IS NOT NULL THEN
+        v_filter := v_filter || ' AND %I = ANY ($2)';
+    END IF;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_country '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share '
+        'FROM data.v_connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_distinct '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_share_pct '
+        'FROM data.v_connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_asn_top10 '
+        'SELECT an_asn, an_date, asn_country, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share, rn '
+        'FROM data.v_connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+
+    PERFORM data.bump_dataset_version('connectivity_index_distinct',
+        CASE WHEN p_country IS NULL
+             THEN ARRAY(SELECT DISTINCT asn_country FROM data.connectivity_index_distinct)
+             ELSE ARRAY[p_country] END);
+END;
+$_$;
+
+
+ALTER FUNCTION data.refresh_connectivity_summary(p_country character varying, p_dates timestamp without time zone[]) OWNER TO ozi;
+
+--
+-- Name: refresh_current_asn(integer[]); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.refresh_current_asn(p_asns integer[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+-- Refresh vm_current_asn after loading the ASNs p_asns if the country of one
+-- of them changed or is new, and recompute the connectivity summaries of the
+-- dates on which the changed ASNs have neighbours.
+DECLARE
+    v_changed integer[];
+    v_dates timestamp without time zone[];
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF (SELECT ispopulated FROM pg_matviews
+         WHERE schemaname = 'data' AND matviewname = 'vm_current_asn') THEN
+        SELECT array_agg(c.asn_id) INTO v_changed
+          FROM (SELECT DISTINCT ON (a_ripe_id) a_ripe_id AS asn_id, a_country_iso2 AS asn_country
+                  FROM data.asn
+                 WHERE a_ripe_id = ANY (p_asns)
+                 ORDER BY a_ripe_id, a_date DESC) c
+          LEFT JOIN data.vm_current_asn m ON m.asn_id = c.asn_id
+         WHERE m.asn_country IS DISTINCT FROM c.asn_country;
+        IF v_changed IS NULL THEN
+            RETURN;
+        END IF;
+        REFRESH MATERIALIZED VIEW CONCURRENTLY data.vm_current_asn;
+    ELSE
+        v_changed := p_asns;
+        REFRESH MATERIALIZED VIEW data.vm_current_asn;
+    END IF;
+
+    SELECT array_agg(DISTINCT an_date) INTO v_dates
+      FROM data.asn_neighbour
+     WHERE an_asn = ANY (v_changed) OR an_neighbour = ANY (v_changed);
+    IF v_dates IS NOT NULL THEN
+        PERFORM data.refresh_connectivity_summary(NULL, v_dates);
+    END IF;
+END;
+$$;
+
+
+ALTER FUNCTION data.refresh_current_asn(p_asns integer[]) OWNER TO ozi;
+
 --
 -- Name: set_timestamps(); Type: FUNCTION; Schema: data; Owner: ozi
 --
@@ -170,11 +373,21 @@ CREATE TABLE data.asn_neighbour (
     an_v4_peers integer,
     an_v6_peers integer,
     load_id integer
-);
+)
+PARTITION BY RANGE (an_date);
 
 
 ALTER TABLE data.asn_neighbour OWNER TO ozi;
 
+--
+-- Name: asn_neighbour_default; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.asn_neighbour_default PARTITION OF data.asn_neighbour DEFAULT;
+
+
+ALTER TABLE data.asn_neighbour_default OWNER TO ozi;
+
 --
 -- Name: asn_neighbour_an_id_seq; Type: SEQUENCE; Schema: data; Owner: ozi
 --
@@ -197,6 +410,58 @@ ALTER SEQUENCE data."asn_neighbour_an_id_seq" OWNER TO ozi;
 ALTER SEQUENCE data."asn_neighbour_an_id_seq" OWNED BY data.asn_neighbour."an_id";
 
 
+--
+-- Name: connectivity_index_by_asn_top10; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.connectivity_index_by_asn_top10 (
+    an_asn bigint NOT NULL,
+    an_date timestamp without time zone NOT NULL,
+    asn_country character varying(2) NOT NULL,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_neighbours_share double precision,
+    rn bigint
+);
+
+
+ALTER TABLE data.connectivity_index_by_asn_top10 OWNER TO ozi;
+
+--
+-- Name: connectivity_index_by_country; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.connectivity_index_by_country (
+    asn_country character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    asn_count bigint,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_neighbours_share double precision
+);
+
+
+ALTER TABLE data.connectivity_index_by_country OWNER TO ozi;
+
+--
+-- Name: connectivity_index_distinct; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.connectivity_index_distinct (
+    asn_country character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    asn_count bigint,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_share_pct double precision
+);
+
+
+ALTER TABLE data.connectivity_index_distinct OWNER TO ozi;
+
 --
 -- Name: country; Type: TABLE; Schema: data; Owner: ozi
 --
@@ -294,11 +559,21 @@ CREATE TABLE data.country_stat (
     cs_v6_prefixes_stats integer,
     cs_asns_stats integer,
     load_id integer
-);
+)
+PARTITION BY RANGE (cs_stats_timestamp);
 
 
 ALTER TABLE data.country_stat OWNER TO ozi;
 
+--
+-- Name: country_stat_default; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.country_stat_default PARTITION OF data.country_stat DEFAULT;
+
+
+ALTER TABLE data.country_stat_default OWNER TO ozi;
+
 --
 -- Name: country_stat_cs_id_seq; Type: SEQUENCE; Schema: data; Owner: ozi
 --
@@ -374,6 +649,35 @@ ALTER SEQUENCE data.country_traffic_cr_id_seq OWNER TO ozi;
 ALTER SEQUENCE data.country_traffic_cr_id_seq OWNED BY data.country_traffic.cr_id;
 
 
+--
+-- Name: dataset_version; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.dataset_version (
+    dataset character varying(64) NOT NULL,
+    country_iso2 character varying(2) NOT NULL,
+    version bigint NOT NULL,
+    updated timestamp without time zone NOT NULL
+);
+
+
+ALTER TABLE data.dataset_version OWNER TO ozi;
+
+--
+-- Name: etl_checkpoint; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.etl_checkpoint (
+    task character varying(32) NOT NULL,
+    country_iso2 character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    load_id integer NOT NULL,
+    completed timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+
+ALTER TABLE data.etl_checkpoint OWNER TO ozi;
+
 --
 -- Name: etl_load; Type: TABLE; Schema: data; Owner: ozi
 --
@@ -623,7 +927,8 @@ CREATE VIEW data.v_connectivity_index_distinct AS
             v_asn_neighbour.an_date,
             v_asn_neighbour.asn_country,
             v_asn_neighbour.is_foreign_neighbour
-           FROM data.v_asn_neighbour) deduplicated
+           FROM data.v_asn_neighbour
+          WHERE (v_asn_neighbour.asn_country IS NOT NULL)) deduplicated
   GROUP BY asn_country, an_date;
 
 
@@ -816,10 +1121,10 @@ CREATE MATERIALIZED VIEW data.vm_asn_neighbour AS
 ALTER MATERIALIZED VIEW data.vm_asn_neighbour OWNER TO ozi;
 
 --
--- Name: vm_connectivity_index_by_asn_top10; Type: MATERIALIZED VIEW; Schema: data; Owner: ozi
+-- Name: vm_connectivity_index_by_asn_top10; Type: VIEW; Schema: data; Owner: ozi
 --
 
-CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10 AS
+CREATE VIEW data.vm_connectivity_index_by_asn_top10 AS
  SELECT an_asn,
     an_date,
     asn_country,
@@ -828,17 +1133,16 @@ CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10 AS
     total_neighbour_count,
     foreign_neighbours_share,
     rn
-   FROM data.v_connectivity_index_by_asn_top10
-  WITH NO DATA;
+   FROM data.connectivity_index_by_asn_top10;
 
 
-ALTER MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10 OWNER TO ozi;
+ALTER VIEW data.vm_connectivity_index_by_asn_top10 OWNER TO ozi;
 
 --
--- Name: vm_connectivity_index_by_country; Type: MATERIALIZED VIEW; Schema: data; Owner: ozi
+-- Name: vm_connectivity_index_by_country; Type: VIEW; Schema: data; Owner: ozi
 --
 
-CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_country AS
+CREATE VIEW data.vm_connectivity_index_by_country AS
  SELECT asn_country,
     date,
     asn_count,
@@ -846,11 +1150,10 @@ CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_country AS
     local_neighbour_count,
     total_neighbour_count,
     foreign_neighbours_share
-   FROM data.v_connectivity_index_by_country
-  WITH NO DATA;
+   FROM data.connectivity_index_by_country;
 
 
-ALTER MATERIALIZED VIEW data.vm_connectivity_index_by_country OWNER TO ozi;
+ALTER VIEW data.vm_connectivity_index_by_country OWNER TO ozi;
 
 --
 -- Name: api_response; Type: TABLE; Schema: source; Owner: ozi
@@ -901,7 +1204,7 @@ ALTER TABLE ONLY data.asn ALTER COLUMN a_id SET DEFAULT nextval('data.asn_a_id_s
 -- Name: asn_neighbour an_id; Type: DEFAULT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.asn_neighbour ALTER COLUMN "an_id" SET DEFAULT nextval('data."asn_neighbour_an_id_seq"'::regclass);
+ALTER TABLE data.asn_neighbour ALTER COLUMN "an_id" SET DEFAULT nextval('data."asn_neighbour_an_id_seq"'::regclass);
 
 
 --
@@ -922,7 +1225,7 @@ ALTER TABLE ONLY data.country_internet_quality ALTER COLUMN ci_id SET DEFAULT ne
 -- Name: country_stat cs_id; Type: DEFAULT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.country_stat ALTER COLUMN cs_id SET DEFAULT nextval('data.country_stat_cs_id_seq'::regclass);
+ALTER TABLE data.country_stat ALTER COLUMN cs_id SET DEFAULT nextval('data.country_stat_cs_id_seq'::regclass);
 
 
 --
@@ -950,8 +1253,8 @@ ALTER TABLE ONLY source.api_response ALTER COLUMN ar_id SET DEFAULT nextval('sou
 -- Name: asn_neighbour asn_neighbour_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.asn_neighbour
-    ADD CONSTRAINT asn_neighbour_pkey PRIMARY KEY ("an_id");
+ALTER TABLE data.asn_neighbour
+    ADD CONSTRAINT asn_neighbour_pkey PRIMARY KEY ("an_id", an_date);
 
 
 --
@@ -970,6 +1273,30 @@ ALTER TABLE ONLY data.country_internet_quality
     ADD CONSTRAINT country_internet_quality_pkey PRIMARY KEY (ci_id);
 
 
+--
+-- Name: connectivity_index_by_asn_top10 connectivity_index_by_asn_top10_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.connectivity_index_by_asn_top10
+    ADD CONSTRAINT connectivity_index_by_asn_top10_pkey PRIMARY KEY (asn_country, an_date, an_asn);
+
+
+--
+-- Name: connectivity_index_by_country connectivity_index_by_country_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.connectivity_index_by_country
+    ADD CONSTRAINT connectivity_index_by_country_pkey PRIMARY KEY (asn_country, date);
+
+
+--
+-- Name: connectivity_index_distinct connectivity_index_distinct_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.connectivity_index_distinct
+    ADD CONSTRAINT connectivity_index_distinct_pkey PRIMARY KEY (asn_country, date);
+
+
 --
 -- Name: country country_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
 --
@@ -982,8 +1309,8 @@ ALTER TABLE ONLY data.country
 -- Name: country_stat country_stat_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.country_stat
-    ADD CONSTRAINT country_stat_pkey PRIMARY KEY (cs_id);
+ALTER TABLE data.country_stat
+    ADD CONSTRAINT country_stat_pkey PRIMARY KEY (cs_id, cs_stats_timestamp);
 
 
 --
@@ -1002,6 +1329,22 @@ ALTER TABLE ONLY data.country_traffic
     ADD CONSTRAINT country_traffic_pkey PRIMARY KEY (cr_id);
 
 
+--
+-- Name: dataset_version dataset_version_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.dataset_version
+    ADD CONSTRAINT dataset_version_pkey PRIMARY KEY (dataset, country_iso2);
+
+
+--
+-- Name: etl_checkpoint etl_checkpoint_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.etl_checkpoint
+    ADD CONSTRAINT etl_checkpoint_pkey PRIMARY KEY (task, country_iso2, date);
+
+
 --
 -- Name: etl_load etl_load_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
 --
@@ -1046,6 +1389,97 @@ CREATE INDEX idx_asn_ripe_date ON data.asn USING btree (a_ripe_id, a_date DESC);
 CREATE INDEX idx_asn_ripe_id ON data.asn USING btree (a_ripe_id);
 
 
+--
+-- Name: idx_asn_neighbour_asn_date; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_asn_neighbour_asn_date ON data.asn_neighbour USING btree (an_asn, an_date);
+
+
+--
+-- Name: idx_asn_neighbour_load_id; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_asn_neighbour_load_id ON data.asn_neighbour USING btree (load_id);
+
+
+--
+-- Name: idx_asn_neighbour_date; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_asn_neighbour_date ON data.asn_neighbour USING btree (an_date, an_asn, an_neighbour) WHERE ((an_type)::text = ANY (ARRAY[('left'::character varying)::text, ('right'::character varying)::text]));
+
+
+--
+-- Name: idx_connectivity_index_distinct_date; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_connectivity_index_distinct_date ON data.connectivity_index_distinct USING btree (date);
+
+
+--
+-- Name: idx_country_stat_load_id; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_country_stat_load_id ON data.country_stat USING btree (load_id);
+
+
+--
+-- Name: idx_country_stat_resolution_timestamp; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_country_stat_resolution_timestamp ON data.country_stat USING btree (cs_stats_resolution, cs_stats_timestamp);
+
+
+--
+-- Name: idx_vm_asn_neighbour_date; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE INDEX idx_vm_asn_neighbour_date ON data.vm_asn_neighbour USING btree (an_date);
+
+
+--
+-- Name: uq_asn_natural_key; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_asn_natural_key ON data.asn USING btree (a_country_iso2, a_date, a_ripe_id);
+
+
+--
+-- Name: uq_asn_neighbour_natural_key; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_asn_neighbour_natural_key ON data.asn_neighbour USING btree (an_asn, an_neighbour, an_date, an_type) NULLS NOT DISTINCT;
+
+
+--
+-- Name: uq_country_internet_quality_natural_key; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_country_internet_quality_natural_key ON data.country_internet_quality USING btree (ci_country_iso2, ci_date);
+
+
+--
+-- Name: uq_country_stat_natural_key; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_country_stat_natural_key ON data.country_stat USING btree (cs_country_iso2, cs_stats_resolution, cs_stats_timestamp);
+
+
+--
+-- Name: uq_country_traffic_natural_key; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_country_traffic_natural_key ON data.country_traffic USING btree (cr_country_iso2, cr_date);
+
+
+--
+-- Name: uq_vm_current_asn_asn_id; Type: INDEX; Schema: data; Owner: ozi
+--
+
+CREATE UNIQUE INDEX uq_vm_current_asn_asn_id ON data.vm_current_asn USING btree (asn_id);
+
+
 --
 -- Name: asn trigger_set_timestamps_asn; Type: TRIGGER; Schema: data; Owner: ozi
 --
@@ -1107,7 +1541,7 @@ ALTER TABLE ONLY data.asn
 -- Name: asn_neighbour asn_neighbour_load_id_fkey; Type: FK CONSTRAINT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.asn_neighbour
+ALTER TABLE data.asn_neighbour
     ADD CONSTRAINT asn_neighbour_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
 
 
@@ -1123,7 +1557,7 @@ ALTER TABLE ONLY data.country_internet_quality
 -- Name: country_stat country_stat_load_id_fkey; Type: FK CONSTRAINT; Schema: data; Owner: ozi
 --
 
-ALTER TABLE ONLY data.country_stat
+ALTER TABLE data.country_stat
     ADD CONSTRAINT country_stat_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
 
 
@@ -1143,6 +1577,14 @@ ALTER TABLE ONLY data.country_traffic
     ADD CONSTRAINT country_traffic_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
 
 
+--
+-- Name: etl_checkpoint etl_checkpoint_load_id_fkey; Type: FK CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.etl_checkpoint
+    ADD CONSTRAINT etl_checkpoint_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
+
+
 --
 -- Name: DATABASE ozi_db2; Type: ACL; Schema: -; Owner: postgres
 --
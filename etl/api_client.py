@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from json import loads
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept open per host; requests beyond that wait for a free connection
+HTTP_POOL_SIZE = int(os.getenv("OZI_HTTP_POOL_SIZE", "10"))
+
+# Attempts of an API call, waiting between them for a random time of up to
+# BACKOFF_BASE_SECONDS * 2 ** attempt (at most BACKOFF_MAX_SECONDS), or for
+# the Retry-After of the response
+API_RETRIES = int(os.getenv("OZI_API_RETRIES", "5"))
+API_TIMEOUT_SECONDS = float(os.getenv("OZI_API_TIMEOUT", "60"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OZI_API_BACKOFF_BASE", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OZI_API_BACKOFF_MAX", "60"))
+# Consecutive failures after which the calls to a host are paused, and for how long
+CIRCUIT_FAILURES = int(os.getenv("OZI_API_CIRCUIT_FAILURES", "10"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("OZI_API_CIRCUIT_OPEN", "30"))
+# Answers meaning the host is overloaded or briefly unavailable
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class IncompleteResponse(ValueError):
+    """A JSON answer rejected by the accept check of get_json"""
+
+
+def create_session(pool_maxsize=HTTP_POOL_SIZE):
+    """
+    Create a keep-alive session whose connection pool is shared by all threads.
+
+    With pool_block=True the pool size is also a hard limit of parallel
+    connections per host, so a session never opens more than pool_maxsize
+    sockets to the same API.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,  # number of hosts to keep pools for
+        pool_maxsize=pool_maxsize,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+class TokenBucket:
+    """
+    Lets at most `rate` calls start per second on average, with bursts of up
+    to `burst` calls after an idle period. A rate of 0 disables the limit.
+
+    With shared=True the bucket is kept in shared memory, so that processes
+    started after its creation (e.g. a ProcessPoolExecutor given the bucket in
+    its initargs) draw from the same tokens.
+    """
+
+    def __init__(self, rate, burst=1, shared=False):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # [tokens, time of the last refill]
+        if shared:
+            self.state = multiprocessing.Array("d", [self.burst, time.monotonic()])
+            self.lock = self.state.get_lock()
+        else:
+            self.state = [self.burst, time.monotonic()]
+            self.lock = threading.Lock()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens = min(self.burst, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if tokens >= 1:
+                    self.state[0] = tokens - 1
+                    return
+                self.state[0] = tokens
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+
+def backoff_delay(attempt):
+    # "Full jitter": spreads the retries of many threads instead of syncing them
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Pauses all calls to a host after CIRCUIT_FAILURES consecutive failures,
+    or for the Retry-After of a 429. Once the pause is over a single call goes
+    through; if it fails again, the next pause is twice as long.
+
+    Callers wait for the end of the pause instead of failing, since a failed
+    call is a missing day of data for the ETL.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.condition = threading.Condition()
+        self.failures = 0
+        self.open_until = 0.0
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.probing = False
+
+    def wait(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.open_until:
+                    self.condition.wait(self.open_until - now)
+                elif self.failures >= CIRCUIT_FAILURES and self.probing:
+                    self.condition.wait(API_TIMEOUT_SECONDS)
+                else:
+                    # Closed, or the first call after the pause
+                    self.probing = self.failures >= CIRCUIT_FAILURES
+                    return
+
+    def record_success(self):
+        with self.condition:
+            if self.failures >= CIRCUIT_FAILURES:
+                print(f"\n{self.host}: responding again, resuming calls")
+            self.failures = 0
+            self.open_seconds = CIRCUIT_OPEN_SECONDS
+            self.probing = False
+            self.condition.notify_all()
+
+    def record_failure(self, retry_after=None):
+        with self.condition:
+            self.failures += 1
+            pause = None
+            if self.probing:
+                self.open_seconds = min(self.open_seconds * 2, BACKOFF_MAX_SECONDS * 10)
+                pause = self.open_seconds
+            elif self.failures == CIRCUIT_FAILURES:
+                pause = self.open_seconds
+            if retry_after:
+                pause = max(pause or 0.0, retry_after)
+            self.probing = False
+            if pause:
+                self.open_until = max(self.open_until, time.monotonic() + pause)
+                print(f"\n{self.host}: pausing calls for {pause:.0f}s after {self.failures} failures")
+            self.condition.notify_all()
+
+
+class AdaptiveConcurrency:
+    """
+    Limit of parallel calls to a host that grows by one per limit successful
+    calls and is halved when the host reports overload (additive increase,
+    multiplicative decrease), between 1 and max_limit.
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max(max_limit, 1)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, overloaded):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not overloaded:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif now - self.last_decrease >= 1:
+                # The calls started together fail together, decrease once for them
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+            self.condition.notify_all()
+
+
+class ApiClient:
+    """
+    Session shared by all threads calling one API, retrying failed calls with
+    backoff, with a CircuitBreaker and an AdaptiveConcurrency per host, and an
+    optional rate limiter (e.g. a TokenBucket) spacing out the calls.
+    """
+
+    def __init__(self, session, rate_limiter=None, max_concurrency=HTTP_POOL_SIZE, retries=API_RETRIES):
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (CircuitBreaker(host), AdaptiveConcurrency(self.max_concurrency))
+            return self.hosts[host]
+
+    def get_json(self, url, params=None, headers=None, accept=None):
+        """
+        JSON answer of a GET request. Network errors, answers of RETRY_STATUS
+        and truncated JSON are retried; the error of the last attempt, or an
+        HTTPError for other 4xx/5xx answers, is raised. Answers for which
+        accept(data) is false are retried too, then IncompleteResponse is raised.
+        """
+        breaker, concurrency = self.host(url)
+        for attempt in range(self.retries):
+            last_attempt = attempt == self.retries - 1
+            breaker.wait()
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            retry_after = None
+            concurrency.acquire()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=API_TIMEOUT_SECONDS)
+                if response.status_code in RETRY_STATUS:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.raise_for_status()
+                data = loads(response.text)
+                if accept and not accept(data):
+                    raise IncompleteResponse(f"incomplete answer {response.text[:100]}")
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in RETRY_STATUS:
+                    # The host is up, the request is wrong
+                    concurrency.release(overloaded=False)
+                    breaker.record_success()
+                    raise
+                concurrency.release(overloaded=True)
+                breaker.record_failure(retry_after)
+                if last_attempt:
+                    raise
+                error = e
+            except requests.exceptions.RequestException as e:
+                # Connection errors and timeouts
+                concurrency.release(overloaded=True)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                error = e
+            except ValueError as e:
+                # Truncated, invalid or incomplete JSON
+                concurrency.release(overloaded=False)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                error = e
+            else:
+                concurrency.release(overloaded=False)
+                breaker.record_success()
+                return data
+
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            print(f"\n{url}: {error} - retrying in {delay:.1f}s ({self.retries - attempt - 1} attempts left)")
+            time.sleep(delay)
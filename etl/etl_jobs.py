@@ -1,3 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
 from load_to_database import BATCH_SIZE
 from extract_from_cloudflare_api import (
     get_cloudflare_traffic_for_country,
@@ -7,9 +11,12 @@ from extract_from_ripe_api import (
     get_country_asns,
     get_country_resource_stats,
     get_asn_neighbours,
+    MAX_CONCURRENT_REQUESTS,
 )
 
 BAR_LENGTH = 50
+# Disabled when several countries are processed in parallel
+SHOW_PROGRESS = True
 
 
 def display_progress(
@@ -20,6 +27,9 @@ def display_progress(
     stored_to_database,
     custom_msg="",
 ):
+    if not SHOW_PROGRESS:
+        return
+
     date_str = processed_until_date.strftime("%Y-%m-%d")
 
     progress = float(processed) / total
@@ -96,7 +106,7 @@ def get_stats_for_country(country_iso2, date_from, date_to, resolution):
         end=" ... ",
     )
     d = get_country_resource_stats(
-        country_iso2, resolution, date_from, save_mode="file"
+        country_iso2, resolution, date_from, date_to, save_mode="file"
     )
     if d:
         stats = d["data"].get("stats")
@@ -104,9 +114,45 @@ def get_stats_for_country(country_iso2, date_from, date_to, resolution):
         return stats
 
 
+def split_stats_by_day(stats, days):
+    """
+    Turn a country-resource-stats answer for a time window into one row per day.
+
+    RIPEstat merges consecutive days with identical values into one entry whose
+    timeline spans all of them, so each entry is repeated for every day it
+    covers. Only days in `days` (a set of dates) are kept, each at most once.
+    """
+    rows = {}
+    for item in stats or []:
+        for interval in item["timeline"]:
+            start = datetime.fromisoformat(interval["starttime"].replace("Z", ""))
+            end = datetime.fromisoformat(interval["endtime"].replace("Z", ""))
+
+            day = start.date()
+            while day == start.date() or datetime.combine(day, datetime.min.time()) < end:
+                if day in days and day not in rows:
+                    # Keep the original starttime for the first day of the interval
+                    starttime = (
+                        interval["starttime"]
+                        if day == start.date()
+                        else f"{day.isoformat()}T00:00:00"
+                    )
+                    rows[day] = {
+                        **item,
+                        "timeline": [{"starttime": starttime, "endtime": interval["endtime"]}],
+                    }
+                day += timedelta(days=1)
+
+    return [rows[day] for day in sorted(rows)]
+
+
 def get_list_of_asn_neighbours_for_country(
-    country_iso2, dates, batch_size, verbose=True
+    country_iso2, dates, batch_size, verbose=True, max_workers=None, failed=None
 ):
+    """
+    Yields batches of neighbours of the ASNs of a country, for every date.
+    (asn, date) pairs whose request failed are appended to failed, if given.
+    """
     total_number_of_dates = len(dates)
     neighbours_batch = []
     received_from_api = 0
@@ -115,37 +161,42 @@ def get_list_of_asn_neighbours_for_country(
     if verbose:
         display_progress(0, total_number_of_dates, dates[0], 0, 0)
 
-    while dates:
-        date = dates.pop(0)
-        for asn_list in get_list_of_asns_for_country(
-            country_iso2, [date], BATCH_SIZE, verbose=False
-        ):
-            counter = 0
-            for item in asn_list:
-                asn = item["asn"]
-                counter += 1
-                if verbose:
-                    display_progress(
-                        total_number_of_dates - len(dates) - 1,
-                        total_number_of_dates,
-                        date,
-                        received_from_api + len(neighbours_batch),
-                        stored_to_database,
-                        f"    asn {counter}/{len(asn_list)}",
-                    )
-
-                d = get_asn_neighbours(asn, date)
-                if d["data"]:
-                    for row in d["data"]["neighbours"]:
-                        row["asn_req"] = asn
-                        row["date"] = date.strftime("%Y-%m-%d")
-                        neighbours_batch.append(row)
-
-                if len(neighbours_batch) >= batch_size:
-                    yield neighbours_batch
-                    stored_to_database += len(neighbours_batch)
-                    received_from_api += len(neighbours_batch)
-                    neighbours_batch = []
+    with ThreadPoolExecutor(
+        max_workers=max_workers or MAX_CONCURRENT_REQUESTS
+    ) as executor:
+        while dates:
+            date = dates.pop(0)
+            for asn_list in get_list_of_asns_for_country(
+                country_iso2, [date], BATCH_SIZE, verbose=False
+            ):
+                asns = [item["asn"] for item in asn_list]
+                # map() returns responses in ASN order, so batches stay in date order
+                responses = executor.map(partial(get_asn_neighbours, date=date), asns)
+
+                for counter, (asn, d) in enumerate(zip(asns, responses), start=1):
+                    if verbose:
+                        display_progress(
+                            total_number_of_dates - len(dates) - 1,
+                            total_number_of_dates,
+                            date,
+                            received_from_api + len(neighbours_batch),
+                            stored_to_database,
+                            f"    asn {counter}/{len(asns)}",
+                        )
+
+                    if d is None and failed is not None:
+                        failed.append((asn, date))
+                    if d and d["data"]:
+                        for row in d["data"]["neighbours"]:
+                            row["asn_req"] = asn
+                            row["date"] = date.strftime("%Y-%m-%d")
+                            neighbours_batch.append(row)
+
+                    if len(neighbours_batch) >= batch_size:
+                        yield neighbours_batch
+                        stored_to_database += len(neighbours_batch)
+                        received_from_api += len(neighbours_batch)
+                        neighbours_batch = []
 
     if neighbours_batch:
         yield neighbours_batch
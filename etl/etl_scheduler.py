@@ -1,13 +1,52 @@
-import subprocess
+import json
 import threading
-import queue
 import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
 import yaml
 import os
 import sys
 
-MAX_PARALLEL_JOBS = 250
+from api_client import TokenBucket
+from country_lists import ALL_COUNTRIES
+from extract_from_cloudflare_api import RATE_LIMIT_PER_SECOND as CLOUDFLARE_RATE_LIMIT
+from extract_from_ripe_api import RATE_LIMIT_PER_SECOND as RIPE_RATE_LIMIT
+from main import STATS_1D_WINDOW_DAYS, generate_dates, split_dates_into_windows
+
+# Worker processes running tasks of the queue. Each keeps its own database
+# pool and HTTP sessions for all the tasks it runs
+MAX_PARALLEL_JOBS = int(os.getenv("OZI_SCHEDULER_WORKERS", "16"))
+
+# Resources used by the tasks, all of them write to the database. Tasks
+# without an entry use none
+TASK_RESOURCES = {
+    "ASNS": ("ripe", "db"),
+    "ASN_NEIGHBOURS": ("ripe", "db"),
+    "STATS_1D": ("ripe", "db"),
+    "STATS_5M": ("ripe", "db"),
+    "TRAFFIC": ("cloudflare", "db"),
+    "INTERNET_QUALITY": ("cloudflare", "db"),
+}
+# Tasks using a resource at the same time. Each RIPEstat task runs up to
+# OZI_RIPE_CONCURRENCY requests and each task holds its own database pool
+RESOURCE_BUDGETS = {
+    "ripe": max(int(os.getenv("OZI_SCHEDULER_RIPE_TASKS", "4")), 1),
+    "cloudflare": max(int(os.getenv("OZI_SCHEDULER_CLOUDFLARE_TASKS", "2")), 1),
+    "db": max(int(os.getenv("OZI_SCHEDULER_DB_TASKS", "4")), 1),
+}
+# Tasks are run as sub-tasks of one country and at most this many days, so
+# that a long backfill is spread over all workers
+CHUNK_DAYS = {
+    "ASNS": int(os.getenv("OZI_SCHEDULER_CHUNK_DAYS", "31")),
+    "ASN_NEIGHBOURS": int(os.getenv("OZI_SCHEDULER_CHUNK_DAYS", "31")),
+    "STATS_1D": STATS_1D_WINDOW_DAYS,
+}
+# Seconds between two rewrites of the YAML file from the journal of finished tasks
+COMPACT_INTERVAL = int(os.getenv("OZI_SCHEDULER_COMPACT_SECONDS", "60"))
 LOGS_DIR = "logs"
 SCHEDULER_LOG = "etl_scheduler.log"
 
@@ -49,91 +88,334 @@ def load_config(config_file):
 
 
 def save_config(config_file, config):
-    with open(config_file, "w") as f:
+    # Readers and a crash never see a half written file
+    tmp_file = f"{config_file}.tmp"
+    with open(tmp_file, "w") as f:
         yaml.dump(config, f, default_flow_style=False)
-
-
-def build_command(task):
-    cmd_parts = ["python3 main.py"]
+    os.replace(tmp_file, config_file)
+
+
+def task_key(task):
+    return json.dumps(task, sort_keys=True, default=str)
+
+
+class TaskJournal:
+    """
+    Finished tasks and sub-tasks of a YAML job file, appended one JSON line
+    each to <config_file>.journal instead of rewriting the YAML file per task.
+
+    compact() moves the journaled tasks from TASKS_QUEUE to TASKS_DONE of the
+    config, saves it and keeps only the sub-tasks of tasks still queued in the
+    journal, in time proportional to the queue, so it is only done every
+    COMPACT_INTERVAL seconds. A journal left behind by a crash is applied when
+    the scheduler starts again, and the sub-tasks it lists are not run again.
+    """
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.path = f"{config_file}.journal"
+        self.lock = threading.Lock()
+        self.last_compaction = time.monotonic()
+
+    def append(self, task, done_task, unit=None):
+        """
+        Record a finished task, or with unit, a finished sub-task of task
+        """
+        entry = {"task": task, "done": done_task}
+        if unit is not None:
+            entry["unit"] = unit
+        line = json.dumps(entry, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self):
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Last line torn by a crash, its task is run again
+                        log_message(f"Ignoring incomplete journal line: {line.strip()}")
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def compact(self, config):
+        """
+        Apply the finished tasks of the journal to config, save it and keep
+        only the sub-tasks of queued tasks in the journal. Returns the number
+        of tasks applied.
+        """
+        with self.lock:
+            entries = self.read()
+            tasks = [e for e in entries if "unit" not in e]
+            if tasks:
+                apply_journal(config, tasks)
+                save_config(self.config_file, config)
+            # Only rewritten once the config holding its tasks is saved
+            queued = {task_key(t) for t in config.get("TASKS_QUEUE") or []}
+            units = [e for e in entries if "unit" in e and task_key(e["task"]) in queued]
+            if units:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e, default=str) + "\n" for e in units)
+                os.replace(tmp_path, self.path)
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+            self.last_compaction = time.monotonic()
+            return len(tasks)
+
+    def compact_if_due(self, config):
+        if time.monotonic() - self.last_compaction >= COMPACT_INTERVAL:
+            self.compact(config)
+
+
+def journaled_units(entries):
+    """
+    Finished sub-tasks of the journal entries, as deques of their TASKS_DONE
+    entries keyed by (task key, sub-task key)
+    """
+    units = defaultdict(deque)
+    for entry in entries:
+        if "unit" in entry:
+            units[(task_key(entry["task"]), task_key(entry["unit"]))].append(entry["done"])
+    return units
+
+
+def apply_journal(config, entries):
+    queue = config.get("TASKS_QUEUE") or []
+    if config.get("TASKS_DONE") is None:
+        config["TASKS_DONE"] = []
+    done = config["TASKS_DONE"]
+    # Entries saved by a compaction that crashed before emptying the journal
+    done_keys = {task_key(t) for t in done}
+
+    queued = defaultdict(deque)
+    for i, task in enumerate(queue):
+        queued[task_key(task)].append(i)
+    removed = set()
+    for entry in entries:
+        if task_key(entry["done"]) in done_keys:
+            continue
+        indices = queued.get(task_key(entry["task"]))
+        if indices:
+            removed.add(indices.popleft())
+        done.append(entry["done"])
+        done_keys.add(task_key(entry["done"]))
+    config["TASKS_QUEUE"] = [task for i, task in enumerate(queue) if i not in removed]
+
+
+def build_args(task):
     # New structure doesn't have params wrapper
+    args = []
     for name, value in task.items():
-        if name == "task":
-            cmd_parts.append(f"--{name} {value}")
-        elif isinstance(value, list):
-            cmd_parts.append(f"--{name} {' '.join(value)}")
+        if value is False:
+            continue
+        args.append(f"--{name}")
+        if value is True:
+            continue  # flag, e.g. resume: true
+        if isinstance(value, list):
+            args.extend(str(v) for v in value)
         else:
-            cmd_parts.append(f"--{name} {value}")
-    return " ".join(cmd_parts)
-
+            args.append(str(value))
+    return args
 
-def worker(job_id, task_queue, config, config_file):
-    while True:
-        try:
-            task = task_queue.get(block=False)
-        except queue.Empty:
-            break
 
-        # Get process ID
-        process_id = os.getpid()
+def build_command(task):
+    return " ".join(["python3 main.py"] + build_args(task))
 
-        # Extract task parameters
-        task_code = task.get("task", "unknown")
-        countries = "-".join(task.get("countries", []))
-        date_from = task.get("date-from", "").replace("-", "")
-        date_to = task.get("date-to", "").replace("-", "")
-        resolution = task.get("date-resolution", "")
 
-        # Create log filename with the new pattern
-        log_filename = f"{process_id}_{task_code}_{countries}_{date_from}_{date_to}_{resolution}.log"
-        log_file = os.path.join(LOGS_DIR, log_filename)
+def parse_task_date(value):
+    return datetime.strptime(str(value), "%Y-%m-%d")
 
-        command = build_command(task)
-        task_name = task_code
-        log_message(f"Process {job_id} starting task: {task_name}")
 
-        done_task = task.copy()
-        done_task.update({"started": datetime.now().isoformat(), "command": command})
+def split_task(task):
+    """
+    Split a task of the YAML file into sub-tasks of one country and one chunk
+    of CHUNK_DAYS of its dates. Tasks that cannot be split, e.g. with invalid
+    arguments, are returned as they are, for main.py to report the error.
+    """
+    countries = task.get("countries")
+    if not countries:
+        return [task]
+    if countries[0] == "all":
+        countries = list(ALL_COUNTRIES.keys())
 
+    windows = [None]
+    if task.get("task") in CHUNK_DAYS:
         try:
-            with open(log_file, "w") as out:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    stdout=out,
-                    stderr=subprocess.STDOUT,
-                )
-
-            done_task["finished"] = datetime.now().isoformat()
-            done_task["status"] = "completed" if result.returncode == 0 else "failed"
-            status_msg = (
-                "✓ completed"
-                if result.returncode == 0
-                else f"✗ failed (code {result.returncode})"
+            dates = generate_dates(
+                parse_task_date(task.get("date-from")),
+                parse_task_date(task.get("date-to")),
+                task.get("date-resolution"),
             )
-            log_message(f"Process {job_id} finished task: {task_name} - {status_msg}")
-
-            if "TASKS_QUEUE" in config and task in config["TASKS_QUEUE"]:
-                config["TASKS_QUEUE"].remove(task)
-                if "TASKS_DONE" not in config:
-                    config["TASKS_DONE"] = []
-                config["TASKS_DONE"].append(done_task)
-                save_config(config_file, config)
-
-        except Exception as e:
-            done_task["finished"] = datetime.now().isoformat()
-            done_task["status"] = "failed"
-            done_task["error"] = str(e)
-            log_message(f"Process {job_id} error in task {task_name}: {str(e)}")
-
-            if "TASKS_QUEUE" in config and task in config["TASKS_QUEUE"]:
-                config["TASKS_QUEUE"].remove(task)
-                if "TASKS_DONE" not in config:
-                    config["TASKS_DONE"] = []
-                config["TASKS_DONE"].append(done_task)
-                save_config(config_file, config)
-
-        finally:
-            task_queue.task_done()
+        except ValueError:
+            return [task]
+        windows = split_dates_into_windows(dates, CHUNK_DAYS[task["task"]]) or [None]
+
+    units = []
+    for iso2 in countries:
+        for window in windows:
+            unit = dict(task, countries=[iso2])
+            if window:
+                unit["date-from"] = window[0].strftime("%Y-%m-%d")
+                unit["date-to"] = window[-1].strftime("%Y-%m-%d")
+            units.append(unit)
+    return units
+
+
+def task_days(task):
+    try:
+        return (parse_task_date(task.get("date-to")) - parse_task_date(task.get("date-from"))).days + 1
+    except ValueError:
+        return 1
+
+
+def merge_done_units(task, done_units):
+    """
+    Entry of TASKS_DONE for a task of the YAML file from its finished sub-tasks
+    """
+    done_task = task.copy()
+    failed = [u for u in done_units if u.get("status") != "completed"]
+    done_task.update({
+        "started": min(u.get("started", u["finished"]) for u in done_units),
+        "finished": max(u["finished"] for u in done_units),
+        "command": build_command(task),
+        "status": "failed" if failed else "completed",
+        "sub_tasks": len(done_units),
+    })
+    if failed:
+        done_task["failed_sub_tasks"] = [
+            f"{' '.join(u.get('countries', []))} {u.get('date-from', '')} {u.get('date-to', '')}".strip()
+            for u in failed
+        ]
+    return done_task
+
+
+etl_main = None
+
+
+def create_rate_limiters():
+    # Limits of the APIs for all the worker processes together, not per process
+    return {
+        "ripe": TokenBucket(RIPE_RATE_LIMIT, shared=True),
+        "cloudflare": TokenBucket(CLOUDFLARE_RATE_LIMIT, shared=True),
+    }
+
+
+def init_worker(rate_limiters):
+    """
+    Import the ETL once per worker process, so that the database pool and the
+    HTTP sessions created by its modules are reused by all tasks of the worker,
+    and make its API calls draw from the rate limits shared by all workers
+    """
+    global etl_main
+    if not isinstance(sys.stdout, Logger):
+        setup_logging()
+    import main as etl_main
+    import extract_from_cloudflare_api
+    import extract_from_ripe_api
+
+    extract_from_ripe_api.RIPE_CLIENT.rate_limiter = rate_limiters["ripe"]
+    extract_from_cloudflare_api.CLOUDFLARE_CLIENT.rate_limiter = rate_limiters["cloudflare"]
+
+
+def start_workers(process_count, rate_limiters):
+    return ProcessPoolExecutor(
+        max_workers=process_count,
+        initializer=init_worker,
+        initargs=(rate_limiters,),
+    )
+
+
+def task_resources(task):
+    return TASK_RESOURCES.get(task.get("task"), ())
+
+
+def queue_tasks(items):
+    """
+    Queue of (job_id, task) items waiting to run: one deque per set of
+    resources, each longest task first
+    """
+    pending = defaultdict(deque)
+    for item in sorted(items, key=lambda item: -task_days(item[1])):
+        pending[task_resources(item[1])].append(item)
+    return pending
+
+
+def take_startable_tasks(pending, in_use, slots):
+    """
+    Take from pending, longest first, up to slots tasks whose resources are
+    all within their budget, and count their resources in in_use. A task
+    blocked on a busy resource does not hold back the tasks using other
+    resources. Only the heads of the deques are looked at, so the cost does
+    not grow with the length of the queue.
+    """
+    started = []
+    while len(started) < slots:
+        startable = [
+            tasks for resources, tasks in pending.items()
+            if tasks and all(in_use[r] < RESOURCE_BUDGETS[r] for r in resources)
+        ]
+        if not startable:
+            break
+        item = max(startable, key=lambda tasks: task_days(tasks[0][1])).popleft()
+        for r in task_resources(item[1]):
+            in_use[r] += 1
+        started.append(item)
+    return started
+
+
+def run_task(job_id, task):
+    """
+    Run one task of the queue in a worker process, with its output written to
+    its own log file. Returns the task with its status for TASKS_DONE.
+    """
+    # Get process ID
+    process_id = os.getpid()
+
+    # Extract task parameters
+    task_code = task.get("task", "unknown")
+    countries = "-".join(task.get("countries", []))
+    date_from = task.get("date-from", "").replace("-", "")
+    date_to = task.get("date-to", "").replace("-", "")
+    resolution = task.get("date-resolution", "")
+
+    # Create log filename with the new pattern
+    log_filename = f"{process_id}_{task_code}_{countries}_{date_from}_{date_to}_{resolution}.log"
+    log_file = os.path.join(LOGS_DIR, log_filename)
+
+    task_name = f"{task_code} {countries} {task.get('date-from', '')} {task.get('date-to', '')}".strip()
+    log_message(f"Process {process_id} starting task {job_id}: {task_name}")
+
+    done_task = task.copy()
+    done_task.update({"started": datetime.now().isoformat(), "command": build_command(task)})
+
+    try:
+        with open(log_file, "w") as out, redirect_stdout(out), redirect_stderr(out):
+            try:
+                returncode = etl_main.main(build_args(task))
+            except SystemExit as e:
+                # argparse exits on invalid arguments
+                returncode = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+        done_task["status"] = "completed" if not returncode else "failed"
+        status_msg = "✓ completed" if not returncode else f"✗ failed (code {returncode})"
+    except Exception as e:
+        done_task["status"] = "failed"
+        done_task["error"] = str(e)
+        status_msg = f"✗ error: {e}"
+
+    done_task["finished"] = datetime.now().isoformat()
+    log_message(f"Process {process_id} finished task {job_id}: {task_name} - {status_msg}")
+    return done_task
 
 
 def main():
@@ -150,6 +432,10 @@ def main():
     log_message(f"Starting ETL task scheduler using config: {config_file}")
     ensure_logs_dir()
     config = load_config(config_file)
+    journal = TaskJournal(config_file)
+    recovered = journal.compact(config)
+    if recovered:
+        log_message(f"Recovered {recovered} finished tasks from {journal.path}")
 
     if "TASKS_QUEUE" not in config or not config["TASKS_QUEUE"]:
         log_message("No tasks found in the TASKS_QUEUE section")
@@ -158,24 +444,89 @@ def main():
     total_tasks = len(config["TASKS_QUEUE"])
     log_message(f"Found {total_tasks} tasks to process")
 
-    task_queue = queue.Queue()
-    for task in config["TASKS_QUEUE"]:
-        task_queue.put(task)
-
-    threads = []
-    thread_count = min(MAX_PARALLEL_JOBS, task_queue.qsize())
-    log_message(f"Starting {thread_count} worker threads")
-
-    for i in range(thread_count):
-        t = threading.Thread(
-            target=worker, args=(i + 1, task_queue, config, config_file)
-        )
-        t.start()
-        threads.append(t)
-
-    for t in threads:
-        t.join()
-
+    # Sub-tasks of all the tasks wait in one queue, from which every worker
+    # takes the next one as soon as it is idle. Longest sub-tasks go first,
+    # so that the run does not end waiting for one of them
+    jobs = {}
+    items = []
+    finished_units = journaled_units(journal.read())
+    for job_id, task in enumerate(config["TASKS_QUEUE"], start=1):
+        units = []
+        done = []
+        for unit in split_task(task):
+            earlier = finished_units.get((task_key(task), task_key(unit)))
+            if earlier:
+                # Finished before the scheduler was interrupted
+                done.append(earlier.popleft())
+            else:
+                units.append(unit)
+        jobs[job_id] = {"task": task, "left": len(units), "done": done}
+        if not units:
+            journal.append(task, merge_done_units(task, done))
+        items.extend((job_id, unit) for unit in units)
+    skipped = sum(len(job["done"]) for job in jobs.values())
+    if skipped:
+        log_message(f"Skipping {skipped} sub-tasks finished by an earlier run")
+    pending = queue_tasks(items)
+    log_message(f"Split into {len(items)} sub-tasks")
+
+    process_count = max(min(MAX_PARALLEL_JOBS, len(items)), 1)
+    log_message(f"Starting {process_count} worker processes")
+    log_message(f"Resource budgets: {RESOURCE_BUDGETS}")
+
+    in_use = dict.fromkeys(RESOURCE_BUDGETS, 0)
+    running = {}
+
+    def finish(future):
+        job_id, task = running.pop(future)
+        for r in task_resources(task):
+            in_use[r] -= 1
+        try:
+            done_task = future.result()
+        except Exception as e:
+            # The worker process died, e.g. killed for running out of memory
+            done_task = dict(task, status="failed", error=str(e), finished=datetime.now().isoformat())
+            log_message(f"Error in task {task.get('task', 'unknown')}: {e}")
+
+        job = jobs[job_id]
+        journal.append(job["task"], done_task, unit=task)
+        job["done"].append(done_task)
+        job["left"] -= 1
+        if not job["left"]:
+            journal.append(job["task"], merge_done_units(job["task"], job["done"]))
+
+    rate_limiters = create_rate_limiters()
+    executor = start_workers(process_count, rate_limiters)
+    try:
+        while any(pending.values()) or running:
+            broken = False
+            for job_id, task in take_startable_tasks(pending, in_use, process_count - len(running)):
+                try:
+                    running[executor.submit(run_task, job_id, task)] = (job_id, task)
+                except BrokenProcessPool:
+                    # A worker died since the last wait, the task goes back to the queue
+                    pending[task_resources(task)].appendleft((job_id, task))
+                    for r in task_resources(task):
+                        in_use[r] -= 1
+                    broken = True
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = broken or any(isinstance(f.exception(), BrokenProcessPool) for f in done)
+            if broken:
+                # A dead worker breaks the whole pool: all its running tasks
+                # fail, and new worker processes are started for the rest
+                done, _ = wait(running, return_when=ALL_COMPLETED)
+            for future in done:
+                finish(future)
+            if broken:
+                log_message("A worker process died, restarting the worker processes")
+                executor.shutdown(wait=True)
+                executor = start_workers(process_count, rate_limiters)
+            journal.compact_if_due(config)
+    finally:
+        executor.shutdown(wait=True)
+
+    journal.compact(config)
     log_message("All tasks completed.")
 
 
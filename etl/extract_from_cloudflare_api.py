@@ -1,5 +1,14 @@
+import os
 import requests
 
+from api_client import ApiClient, TokenBucket, create_session
+
+# Cloudflare Radar requests started per second, shared by all threads
+RATE_LIMIT_PER_SECOND = float(os.getenv("OZI_CLOUDFLARE_RATE_LIMIT", "4"))
+
+CLOUDFLARE_SESSION = create_session()
+CLOUDFLARE_CLIENT = ApiClient(CLOUDFLARE_SESSION, rate_limiter=TokenBucket(RATE_LIMIT_PER_SECOND))
+
 
 def get_cloudflare_traffic_for_country(country_iso2, api_token, copy_to_file=False):
     api_url = "https://api.cloudflare.com/client/v4/radar/netflows/timeseries"
@@ -9,14 +18,10 @@ def get_cloudflare_traffic_for_country(country_iso2, api_token, copy_to_file=Fal
     }
 
     try:
-        response = requests.get(api_url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-    except requests.exceptions.RequestException as e:
+        return CLOUDFLARE_CLIENT.get_json(api_url, params=params, headers=headers)
+    except (requests.exceptions.RequestException, ValueError) as e:
         print("An error occurred during cloudflare API call:", e)
-
-    return data
+        return None
 
 
 def get_cloudflare_internet_quality_for_country(
@@ -35,11 +40,7 @@ def get_cloudflare_internet_quality_for_country(
     }
 
     try:
-        response = requests.get(api_url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-    except requests.exceptions.RequestException as e:
+        return CLOUDFLARE_CLIENT.get_json(api_url, params=params, headers=headers)
+    except (requests.exceptions.RequestException, ValueError) as e:
         print("An error occurred during cloudflare API call:", e)
-
-    return data
+        return None
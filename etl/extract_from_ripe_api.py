@@ -1,13 +1,26 @@
 import json
 import re
 import os
-import time
 from datetime import datetime
-from json import loads
 import requests
 
+from api_client import ApiClient, IncompleteResponse, TokenBucket, create_session
+from response_cache import ResponseCache, CACHE_ENABLED
+
 API_URL = "https://stat.ripe.net/data/{}/data.json"
 RETRIES = 5
+# Keep RIPEstat load within fair use: parallel requests and request starts per second
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OZI_RIPE_CONCURRENCY", "8"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("OZI_RIPE_RATE_LIMIT", "10"))
+
+RIPE_SESSION = create_session(pool_maxsize=MAX_CONCURRENT_REQUESTS)
+RIPE_CLIENT = ApiClient(
+    RIPE_SESSION,
+    rate_limiter=TokenBucket(RATE_LIMIT_PER_SECOND),
+    max_concurrency=MAX_CONCURRENT_REQUESTS,
+    retries=RETRIES,
+)
+RIPE_CACHE = ResponseCache(enabled=CACHE_ENABLED)
 
 
 def get_country_asns(country_iso2, date, save_mode=None):
@@ -20,13 +33,14 @@ def get_country_asns(country_iso2, date, save_mode=None):
     return data
 
 
-def get_country_resource_stats(country_iso2, resolution, date, save_mode=None):
-    date_str = date.isoformat()
+def get_country_resource_stats(
+    country_iso2, resolution, date_from, date_to=None, save_mode=None
+):
     url = API_URL.format("country-resource-stats")
     params = {
         "resource": country_iso2,
-        "starttime": date_str,
-        "endtime": date_str,
+        "starttime": date_from.isoformat(),
+        "endtime": (date_to or date_from).isoformat(),
         "resolution": resolution,
     }
     data = ripe_api_call(url, params)
@@ -46,45 +60,35 @@ def get_asn_neighbours(asn, date, save_mode=None):
     return data
 
 
-def ripe_api_call(url, params):
-    attempts_left = RETRIES
-    while attempts_left > 0:
-        try:
-            response = requests.get(url, params)
-            response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-            data = loads(response.text)
-            if data:
-                return data
-        except requests.exceptions.HTTPError as e:
-            print(f"\nHTTP Error during API request: {e}")
-            attempts_left -= 1
-            if attempts_left > 0:
-                if e.response.status_code == 429:  # Too Many Requests
-                    print("Rate limit hit. Waiting longer before retrying.")
-                    time.sleep(10)  # Wait longer for rate limiting
-                else:
-                    print(f"... RETRYING ({attempts_left} attempts left)")
-                    time.sleep(5)  # Standard wait for other HTTP errors
-            else:
-                print("... STOP")
-        except json.JSONDecodeError:
-            print(
-                f"\nJSON Decode Error: Could not parse response as JSON for URL: {url} with params: {params}"
-            )
-            attempts_left -= 1
-            if attempts_left > 0:
-                print(f"... RETRYING ({attempts_left} attempts left)")
-                time.sleep(5)  # Wait before retrying for JSON decode errors
-            else:
-                print("... STOP")
-        except Exception as e:
-            print(f"\nException during API request: {e}")
-            attempts_left -= 1
-            if attempts_left > 0:
-                print(f"... RETRYING ({attempts_left} attempts left)")
-                time.sleep(5)  # Wait for 5 seconds before retrying on other exceptions
-            else:
-                print("... STOP")
+def has_data(answer):
+    # RIPEstat sometimes answers {} or without its data, retried like an error
+    return isinstance(answer, dict) and bool(answer.get("data"))
+
+
+def ripe_api_call(url, params, use_cache=True):
+    if use_cache:
+        data = RIPE_CACHE.get(url, params)
+        if data:
+            return data
+
+    try:
+        data = RIPE_CLIENT.get_json(url, params=params, accept=has_data)
+    except requests.exceptions.RequestException as e:
+        print(f"\nError during API request: {e}\n... STOP")
+        return None
+    except IncompleteResponse:
+        print(f"\nNo data in the response for URL: {url} with params: {params}\n... STOP")
+        return None
+    except ValueError:
+        print(
+            f"\nJSON Decode Error: Could not parse response as JSON for URL: {url} with params: {params}\n... STOP"
+        )
+        return None
+
+    if data:
+        if use_cache and data.get("status") == "ok":
+            RIPE_CACHE.put(url, params, data)
+        return data
     return None
 
 
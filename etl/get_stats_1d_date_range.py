@@ -29,9 +29,10 @@ def get_last_date_from_db():
                     """
                 SELECT MAX(cs_stats_timestamp) as max_date
                 FROM data.country_stat
-                WHERE cs_stats_resolution = '1d'
+                WHERE cs_stats_resolution = :resolution
             """
-                )
+                ),
+                {"resolution": "1d"},
             ).fetchone()
 
             if result and result[0]:
@@ -1,3 +1,5 @@
+import csv
+import io
 import os
 import urllib
 from datetime import datetime
@@ -12,6 +14,25 @@ PASSWORD = os.getenv("POSTGRES_OZI_PASSWORD", "ozi_password")
 DBNAME = os.getenv("POSTGRES_DB", "ozi_db2")
 
 BATCH_SIZE = 1000
+# Size the pool for the number of threads that write in parallel (main.py --workers)
+DB_POOL_SIZE = int(os.getenv("OZI_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("OZI_DB_MAX_OVERFLOW", "10"))
+# Rows per COPY round trip; bounds the size of the in-memory CSV buffer
+COPY_CHUNK_ROWS = 10000
+# Tables range-partitioned by month on the given column. Missing partitions are
+# created before loading, see data.ensure_monthly_partitions()
+MONTHLY_PARTITIONS = {
+    "data.asn_neighbour": "an_date",
+    "data.country_stat": "cs_stats_timestamp",
+}
+# Tables read by the dashboard, with their country column. Loading new rows
+# bumps data.dataset_version of the loaded countries, see data.bump_dataset_version()
+DATASET_VERSIONS = {
+    "data.country_stat": "cs_country_iso2",
+}
+# data.etl_load row of the running ETL, see start_etl_load(). Rows loaded into
+# the database are tagged with it in their load_id column
+CURRENT_LOAD_ID = None
 
 # Create a single engine with connection pooling
 def create_engine_with_pool():
@@ -26,10 +47,10 @@ def create_engine_with_pool():
     # Create engine with connection pooling
     engine = create_engine(
         connection_string,
-        pool_size=5,        # number of connections to maintain in the pool
-        max_overflow=10,    # number of connections that can be created beyond pool_size
-        pool_pre_ping=True, # validates connections before use
-        pool_recycle=3600   # recycle connections after 3600 seconds (1 hour)
+        pool_size=DB_POOL_SIZE,        # number of connections to maintain in the pool
+        max_overflow=DB_MAX_OVERFLOW,  # number of connections that can be created beyond pool_size
+        pool_pre_ping=True,            # validates connections before use
+        pool_recycle=3600              # recycle connections after 3600 seconds (1 hour)
     )
     return engine
 
@@ -40,354 +61,380 @@ def get_db_connection():
     return ENGINE.connect()
 
 
-def insert_country_asns_to_db(
-    country_iso2, list_of_asns, save_sql_to_file=False, load_to_database=True
-):
-    if not list_of_asns:
-        return
+def _to_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
 
-    with get_db_connection() as c:
-        # Fetch existing ASNs for the given country and dates
-        existing_asns_query = text(
-            f"""
-            SELECT a_ripe_id, a_date
-            FROM data.asn
-            WHERE a_country_iso2 = :country_iso2
-            AND a_date IN ({', '.join([f"'{item['date']}'" for item in list_of_asns])})
-        """
-        )
 
-        existing_asns_result = c.execute(
-            existing_asns_query, {"country_iso2": country_iso2}
-        ).fetchall()
-        existing_asns_set = set(
-            (asn, date.strftime("%Y-%m-%d")) for asn, date in existing_asns_result
-        )
+def _bulk_load_statements(table, columns, key_columns):
+    staging = f"staging_{table.split('.')[-1]}"
+    column_list = ", ".join(columns)
 
-        # Filter out ASNs that already exist
-        new_asns_to_insert = [
-            item
-            for item in list_of_asns
-            if (item["asn"], item["date"]) not in existing_asns_set
-        ]
-
-        if not new_asns_to_insert:
-            return
-
-    sql = "INSERT INTO data.asn(a_country_iso2, a_date, a_ripe_id, a_is_routed)\nVALUES"
-    values_list = []
-    for item in new_asns_to_insert:
-        values_list.append(
-            f"('{country_iso2}', '{item['date']}', {item['asn']}, {item['is_routed']})"
-        )
-    sql += ",\n".join(values_list) + ";\n"
+    create_staging = (
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+        f"SELECT {column_list} FROM {table} WITH NO DATA"
+    )
+    copy = f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+    # Rows already in the table are skipped by its unique index on key_columns
+    merge = (
+        f"INSERT INTO {table} ({column_list})\n"
+        f"SELECT {column_list} FROM {staging}\n"
+        f"ON CONFLICT ({', '.join(key_columns)}) DO NOTHING"
+    )
+    return create_staging, copy, merge
 
-    if save_sql_to_file:
-        filename = "sql/country_asns_{}_{}.sql".format(
-            country_iso2, datetime.now().strftime("%Y%m%d_%H%M%S")
-        )
-        with open(filename, "w") as f:
-            print(sql, file=f)
 
-    if load_to_database:
-        with get_db_connection() as c:
-            query = text(sql)
-            c.execute(query)
-            c.commit()
+def _partition_months(table, columns, rows):
+    """First days of the earliest and the latest month in the partition column."""
+    index = columns.index(MONTHLY_PARTITIONS[table])
+    months = {str(row[index])[:7] for row in rows}
+    return f"{min(months)}-01", f"{max(months)}-01"
 
 
-def insert_country_stats_to_db(
-    country_iso2, resolution, stats, save_sql_to_file=False, load_to_database=True
+def bulk_load_to_db(
+    table,
+    columns,
+    key_columns,
+    rows,
+    sql_file_prefix,
+    save_sql_to_file=False,
+    load_to_database=True,
 ):
-    if not stats:
-        return
+    """
+    Load rows into table through COPY FROM STDIN into a temporary staging table,
+    then merge them with one INSERT ... ON CONFLICT DO NOTHING. key_columns must
+    match a unique index of the table. Returns the number of inserted rows.
+    """
+    create_staging, copy, merge = _bulk_load_statements(table, columns, key_columns)
+
+    partitions = None
+    if table in MONTHLY_PARTITIONS:
+        partitions = (table.split(".")[-1], *_partition_months(table, columns, rows))
+
+    versions = None
+    if table in DATASET_VERSIONS:
+        country_index = columns.index(DATASET_VERSIONS[table])
+        versions = (table.split(".")[-1], sorted({row[country_index] for row in rows}))
 
-    with get_db_connection() as c:
-        # Fetch existing stats for the given country, resolution, and timestamps
-        existing_stats_query = text(
-            f"""
-            SELECT cs_stats_timestamp
-            FROM data.country_stat
-            WHERE cs_country_iso2 = :country_iso2
-            AND cs_stats_resolution = :resolution
-            AND cs_stats_timestamp IN ({', '.join([f"'{item['timeline'][0]['starttime']}'" for item in stats])})
-        """
+    if save_sql_to_file:
+        filename = "sql/{}_{}.sql".format(
+            sql_file_prefix, datetime.now().strftime("%Y%m%d_%H%M%S")
         )
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            if partitions:
+                print(
+                    "SELECT data.ensure_monthly_partitions('{}', '{}', '{}');".format(
+                        *partitions
+                    ),
+                    file=f,
+                )
+            print(f"BEGIN;\n{create_staging};\n{copy.replace('STDIN', 'stdin')};", file=f)
+            f.write(_to_csv(rows))
+            print(f"\\.\n{merge};", file=f)
+            if versions:
+                print(
+                    "SELECT data.bump_dataset_version('{}', ARRAY[{}]::varchar[]);".format(
+                        versions[0], ", ".join(f"'{c}'" for c in versions[1])
+                    ),
+                    file=f,
+                )
+            print("COMMIT;", file=f)
 
-        existing_stats_result = c.execute(
-            existing_stats_query,
-            {"country_iso2": country_iso2, "resolution": resolution},
-        ).fetchall()
-        existing_stats_set = set(
-            timestamp.strftime("%Y-%m-%d %H:%M:%S+00:00")
-            for timestamp, in existing_stats_result
-        )
+    if not load_to_database:
+        return 0
 
-        # Filter out stats that already exist
-        new_stats_to_insert = []
-        for item in stats:
-            timestamp = item["timeline"][0]["starttime"]
-            try:
-                item_timestamp_dt = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
-            except ValueError:
-                item_timestamp_dt = datetime.strptime(
-                    timestamp.replace("Z", ""), "%Y-%m-%dT%H:%M:%S"
-                )
+    if CURRENT_LOAD_ID is not None:
+        # Not in the saved SQL above, which may be replayed on another database
+        columns = columns + ["load_id"]
+        rows = [(*row, CURRENT_LOAD_ID) for row in rows]
+        create_staging, copy, merge = _bulk_load_statements(table, columns, key_columns)
 
-            item_timestamp_formatted = item_timestamp_dt.strftime(
-                "%Y-%m-%d %H:%M:%S+00:00"
+    if partitions:
+        # In a transaction of its own: it takes a lock shared with other loaders
+        with get_db_connection() as c:
+            c.execute(
+                text("SELECT data.ensure_monthly_partitions(:table, :date_from, :date_to)"),
+                dict(zip(("table", "date_from", "date_to"), partitions)),
             )
+            c.commit()
 
-            if item_timestamp_formatted not in existing_stats_set:
-                new_stats_to_insert.append(item)
+    with get_db_connection() as c:
+        c.execute(text(create_staging))
+        cursor = c.connection.driver_connection.cursor()
+        for start in range(0, len(rows), COPY_CHUNK_ROWS):
+            cursor.copy_expert(
+                copy, io.StringIO(_to_csv(rows[start : start + COPY_CHUNK_ROWS]))
+            )
+        inserted = c.execute(text(merge)).rowcount
+        if inserted and versions:
+            c.execute(
+                text(
+                    "SELECT data.bump_dataset_version("
+                    ":dataset, CAST(:countries AS character varying[]))"
+                ),
+                {"dataset": versions[0], "countries": versions[1]},
+            )
+        c.commit()
+    return inserted
 
-        if not new_stats_to_insert:
-            return
 
-    sql = (
-        "INSERT INTO data.country_stat(cs_country_iso2, cs_stats_timestamp, cs_stats_resolution, cs_v4_prefixes_ris,"
-        " cs_v6_prefixes_ris, cs_asns_ris, cs_v4_prefixes_stats, cs_v6_prefixes_stats, cs_asns_stats )\nVALUES "
+def insert_country_asns_to_db(
+    country_iso2, list_of_asns, save_sql_to_file=False, load_to_database=True
+):
+    if not list_of_asns:
+        return 0
+
+    rows = [
+        (country_iso2, item["date"], item["asn"], item["is_routed"])
+        for item in list_of_asns
+    ]
+    return bulk_load_to_db(
+        "data.asn",
+        ["a_country_iso2", "a_date", "a_ripe_id", "a_is_routed"],
+        ["a_country_iso2", "a_date", "a_ripe_id"],
+        rows,
+        f"country_asns_{country_iso2}",
+        save_sql_to_file,
+        load_to_database,
     )
-    values_list = []
-    for item in new_stats_to_insert:
-        v4_ris = (
-            item["v4_prefixes_ris"] if item["v4_prefixes_ris"] is not None else "NULL"
-        )
-        v6_ris = (
-            item["v6_prefixes_ris"] if item["v6_prefixes_ris"] is not None else "NULL"
-        )
-        asns_ris = item["asns_ris"] if item["asns_ris"] is not None else "NULL"
-        v4_stats = (
-            item["v4_prefixes_stats"]
-            if item["v4_prefixes_stats"] is not None
-            else "NULL"
-        )
-        v6_stats = (
-            item["v6_prefixes_stats"]
-            if item["v6_prefixes_stats"] is not None
-            else "NULL"
-        )
-        asns_stats = item["asns_stats"] if item["asns_stats"] is not None else "NULL"
-
-        values_list.append(
-            f"('{country_iso2}', '{item['timeline'][0]['starttime']}', '{resolution}', "
-            f"{v4_ris}, "
-            f"{v6_ris}, "
-            f"{asns_ris}, "
-            f"{v4_stats}, "
-            f"{v6_stats}, "
-            f"{asns_stats} "
-            ")"
-        )
-    sql += ",\n".join(values_list) + ";"
 
-    if save_sql_to_file:
-        filename = "sql/country_stats_{}_{}.sql".format(
-            country_iso2, datetime.now().strftime("%Y%m%d_%H%M%S")
-        )
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, "w") as f:
-            print(sql, file=f)
 
-    if load_to_database:
-        with get_db_connection() as c:
-            query = text(sql)
-            c.execute(query)
-            c.commit()
+def insert_country_stats_to_db(
+    country_iso2, resolution, stats, save_sql_to_file=False, load_to_database=True
+):
+    if not stats:
+        return 0
+
+    rows = [
+        (
+            country_iso2,
+            item["timeline"][0]["starttime"],
+            resolution,
+            item["v4_prefixes_ris"],
+            item["v6_prefixes_ris"],
+            item["asns_ris"],
+            item["v4_prefixes_stats"],
+            item["v6_prefixes_stats"],
+            item["asns_stats"],
+        )
+        for item in stats
+    ]
+    return bulk_load_to_db(
+        "data.country_stat",
+        [
+            "cs_country_iso2",
+            "cs_stats_timestamp",
+            "cs_stats_resolution",
+            "cs_v4_prefixes_ris",
+            "cs_v6_prefixes_ris",
+            "cs_asns_ris",
+            "cs_v4_prefixes_stats",
+            "cs_v6_prefixes_stats",
+            "cs_asns_stats",
+        ],
+        ["cs_country_iso2", "cs_stats_resolution", "cs_stats_timestamp"],
+        rows,
+        f"country_stats_{country_iso2}",
+        save_sql_to_file,
+        load_to_database,
+    )
 
 
 def insert_country_asn_neighbours_to_db(
     country_iso2, neighbours, save_sql_to_file=False, load_to_database=True
 ):
     if not neighbours:
-        return
-
-    with get_db_connection() as c:
-        # Fetch existing ASN neighbours for the given country and dates
-        existing_neighbours_query = text(
-            f"""
-            SELECT an_asn, an_neighbour, an_date, an_type
-            FROM data.asn_neighbour
-            WHERE an_date IN ({', '.join([f"'{item['date']}'" for item in neighbours])})
-        """
-        )
-
-        existing_neighbours_result = c.execute(existing_neighbours_query).fetchall()
-        existing_neighbours_set = set(
-            (asn, neighbour, date.strftime("%Y-%m-%d"), type)
-            for asn, neighbour, date, type in existing_neighbours_result
+        return 0
+
+    rows = [
+        (
+            item["asn_req"],
+            item["asn"],
+            item["date"],
+            item["type"],
+            item["power"],
+            item["v4_peers"],
+            item["v6_peers"],
         )
-
-        # Filter out neighbours that already exist
-        new_neighbours_to_insert = [
-            item
-            for item in neighbours
-            if (item["asn_req"], item["asn"], item["date"], item["type"])
-            not in existing_neighbours_set
-        ]
-
-        if not new_neighbours_to_insert:
-            return
-
-    sql = "INSERT INTO data.asn_neighbour (an_asn, an_neighbour, an_date, an_type, an_power, an_v4_peers, an_v6_peers)\n VALUES "
-    values_list = []
-    for item in new_neighbours_to_insert:
-        values_list.append(
-            f"({item['asn_req']}, {item['asn']}, '{item['date']}', '{item['type']}', {item['power']}, {item['v4_peers']}, {item['v6_peers']})"
-        )
-    sql += ",\n".join(values_list) + ";"
-
-    if save_sql_to_file:
-        filename = f"sql/asn_neighbours_{country_iso2}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
-        with open(filename, "w") as f:
-            print(sql, file=f)
-
-    if load_to_database:
-        with get_db_connection() as c:
-            query = text(sql)
-            c.execute(query)
-            c.commit()
+        for item in neighbours
+    ]
+    return bulk_load_to_db(
+        "data.asn_neighbour",
+        [
+            "an_asn",
+            "an_neighbour",
+            "an_date",
+            "an_type",
+            "an_power",
+            "an_v4_peers",
+            "an_v6_peers",
+        ],
+        ["an_asn", "an_neighbour", "an_date", "an_type"],
+        rows,
+        f"asn_neighbours_{country_iso2}",
+        save_sql_to_file,
+        load_to_database,
+    )
 
 
 def insert_traffic_for_country_to_db(
     country_iso2, traffic, save_sql_to_file=False, load_to_database=True
 ):
     if not traffic or not traffic["timestamps"]:
-        return
-
-    with get_db_connection() as c:
-        # Fetch existing traffic dates for the given country
-        existing_traffic_query = text(
-            f"""
-            SELECT cr_date
-            FROM data.country_traffic
-            WHERE cr_country_iso2 = :country_iso2
-            AND cr_date IN ({', '.join([f"'{ts}'" for ts in traffic['timestamps']])})
-        """
-        )
-
-        existing_traffic_result = c.execute(
-            existing_traffic_query, {"country_iso2": country_iso2}
-        ).fetchall()
-        existing_traffic_set = set(
-            date.strftime("%Y-%m-%d %H:%M:%S+00:00")
-            for date, in existing_traffic_result
-        )
-
-        new_traffic_to_insert = []
+        return 0
+
+    rows = [
+        (country_iso2, timestamp, value)
+        for timestamp, value in zip(traffic["timestamps"], traffic["values"])
+    ]
+    return bulk_load_to_db(
+        "data.country_traffic",
+        ["cr_country_iso2", "cr_date", "cr_traffic"],
+        ["cr_country_iso2", "cr_date"],
+        rows,
+        f"country_traffic_{country_iso2}",
+        save_sql_to_file,
+        load_to_database,
+    )
 
-        for timestamp, value in zip(traffic["timestamps"], traffic["values"]):
-            try:
-                item_timestamp_dt = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
-            except ValueError:
-                item_timestamp_dt = datetime.strptime(
-                    timestamp.replace("Z", ""), "%Y-%m-%dT%H:%M:%S"
-                )
 
-            item_timestamp_formatted = item_timestamp_dt.strftime(
-                "%Y-%m-%d %H:%M:%S+00:00"
-            )
+def insert_internet_quality_for_country_to_db(
+    country_iso2, internet_quality, save_sql_to_file=False, load_to_database=True
+):
+    if not internet_quality or not internet_quality["timestamps"]:
+        return 0
 
-            if item_timestamp_formatted not in existing_traffic_set:
-                new_traffic_to_insert.append({"timestamp": timestamp, "value": value})
+    rows = [
+        (country_iso2, timestamp, p75, p50, p25)
+        for timestamp, p75, p50, p25 in zip(
+            internet_quality["timestamps"],
+            internet_quality["p75"],
+            internet_quality["p50"],
+            internet_quality["p25"],
+        )
+    ]
+    return bulk_load_to_db(
+        "data.country_internet_quality",
+        ["ci_country_iso2", "ci_date", "ci_p75", "ci_p50", "ci_p25"],
+        ["ci_country_iso2", "ci_date"],
+        rows,
+        f"country_internet_quality_{country_iso2}",
+        save_sql_to_file,
+        load_to_database,
+    )
 
-        if not new_traffic_to_insert:
-            return
 
-    sql = (
-        "INSERT INTO data.country_traffic(cr_country_iso2, cr_date, cr_traffic)\nVALUES"
-    )
-    values_list = []
-    for item in new_traffic_to_insert:
-        values_list.append(
-            f"('{country_iso2}', '{item['timestamp']}', {item['value']})"
-        )
-    sql += ",\n".join(values_list) + ";"
+def refresh_connectivity_summary(country_iso2, dates):
+    """
+    Recompute the connectivity summary tables of a country for the given
+    dates only, e.g. after loading its ASN neighbours for these dates.
+    """
+    if not dates:
+        return
 
-    if save_sql_to_file:
-        filename = "sql/country_traffic_{}_{}.sql".format(
-            country_iso2, datetime.now().strftime("%Y%m%d_%H%M%S")
+    with get_db_connection() as c:
+        c.execute(
+            text(
+                "SELECT data.refresh_connectivity_summary("
+                ":country, CAST(:dates AS timestamp without time zone[]))"
+            ),
+            {"country": country_iso2, "dates": sorted(dates)},
         )
-        with open(filename, "w") as f:
-            print(sql, file=f)
-
-    if load_to_database:
-        with get_db_connection() as c:
-            query = text(sql)
-            c.execute(query)
-            c.commit()
+        c.commit()
 
 
-def insert_internet_quality_for_country_to_db(
-    country_iso2, internet_quality, save_sql_to_file=False, load_to_database=True
-):
-    if not internet_quality or not internet_quality["timestamps"]:
+def refresh_current_asn(asns):
+    """
+    Bring vm_current_asn up to date after loading the given ASNs, and the
+    connectivity summaries of the dates on which ASNs that are new or changed
+    country have neighbours.
+    """
+    if not asns:
         return
 
     with get_db_connection() as c:
-        # Fetch existing internet quality dates for the given country
-        existing_quality_query = text(
-            f"""
-            SELECT ci_date
-            FROM data.country_internet_quality
-            WHERE ci_country_iso2 = :country_iso2
-            AND ci_date IN ({', '.join([f"'{ts}'" for ts in internet_quality['timestamps']])})
-        """
+        c.execute(
+            text("SELECT data.refresh_current_asn(CAST(:asns AS integer[]))"),
+            {"asns": sorted(asns)},
         )
+        c.commit()
 
-        existing_quality_result = c.execute(
-            existing_quality_query, {"country_iso2": country_iso2}
-        ).fetchall()
-        existing_quality_set = set(
-            date.strftime("%Y-%m-%d %H:%M:%S+00:00")
-            for date, in existing_quality_result
+
+def start_etl_load(command):
+    """
+    Open a data.etl_load row for this ETL run. Rows loaded until
+    finish_etl_load() are tagged with its load_id.
+    """
+    global CURRENT_LOAD_ID
+    with get_db_connection() as c:
+        load_id = c.execute(
+            text(
+                "INSERT INTO data.etl_load (start_time, command, status)"
+                " VALUES (:start_time, :command, 'running') RETURNING load_id"
+            ),
+            {"start_time": datetime.now(), "command": command},
+        ).scalar()
+        c.commit()
+    CURRENT_LOAD_ID = load_id
+    return load_id
+
+
+def finish_etl_load(load_id, status):
+    global CURRENT_LOAD_ID
+    with get_db_connection() as c:
+        c.execute(
+            text(
+                "UPDATE data.etl_load SET finish_time = :finish_time, status = :status"
+                " WHERE load_id = :load_id"
+            ),
+            {"finish_time": datetime.now(), "status": status, "load_id": load_id},
         )
+        c.commit()
+    CURRENT_LOAD_ID = None
 
-        new_quality_to_insert = []
 
-        for timestamp, p75, p50, p25 in zip(
-            internet_quality["timestamps"],
-            internet_quality["p75"],
-            internet_quality["p50"],
-            internet_quality["p25"],
-        ):
-            try:
-                item_timestamp_dt = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
-            except ValueError:
-                item_timestamp_dt = datetime.strptime(
-                    timestamp.replace("Z", ""), "%Y-%m-%dT%H:%M:%S"
-                )
-
-            item_timestamp_formatted = item_timestamp_dt.strftime(
-                "%Y-%m-%d %H:%M:%S+00:00"
-            )
+def save_checkpoints(task, country_iso2, dates):
+    """
+    Record the dates of a task and country as completed by the current load.
+    Outside of a load, e.g. when the jobs are called directly, nothing is recorded.
+    """
+    if not dates or CURRENT_LOAD_ID is None:
+        return
 
-            if item_timestamp_formatted not in existing_quality_set:
-                new_quality_to_insert.append(
-                    {"timestamp": timestamp, "p75": p75, "p50": p50, "p25": p25}
-                )
+    with get_db_connection() as c:
+        c.execute(
+            text(
+                "INSERT INTO data.etl_checkpoint (task, country_iso2, date, load_id)"
+                " SELECT :task, :country, date, :load_id"
+                " FROM unnest(CAST(:dates AS timestamp without time zone[])) AS date"
+                " ON CONFLICT (task, country_iso2, date)"
+                " DO UPDATE SET load_id = EXCLUDED.load_id, completed = CURRENT_TIMESTAMP"
+            ),
+            {
+                "task": task,
+                "country": country_iso2,
+                "dates": sorted(set(dates)),
+                "load_id": CURRENT_LOAD_ID,
+            },
+        )
+        c.commit()
 
-        if not new_quality_to_insert:
-            return
 
-    sql = "INSERT INTO data.country_internet_quality(ci_country_iso2, ci_date, ci_p75, ci_p50, ci_p25)\nVALUES"
-    values_list = []
-    for item in new_quality_to_insert:
-        values_list.append(
-            f"('{country_iso2}', '{item['timestamp']}', {item['p75']}, {item['p50']}, {item['p25']})"
-        )
-    sql += ",\n".join(values_list) + ";"
+def get_completed_dates(task, country_iso2, dates):
+    """The dates among dates with a checkpoint of task and country."""
+    if not dates:
+        return set()
 
-    if save_sql_to_file:
-        filename = "sql/country_internet_quality_{}_{}.sql".format(
-            country_iso2, datetime.now().strftime("%Y%m%d_%H%M%S")
+    with get_db_connection() as c:
+        return set(
+            c.execute(
+                text(
+                    "SELECT date FROM data.etl_checkpoint"
+                    " WHERE task = :task AND country_iso2 = :country"
+                    " AND date = ANY (CAST(:dates AS timestamp without time zone[]))"
+                ),
+                {"task": task, "country": country_iso2, "dates": list(dates)},
+            ).scalars()
         )
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, "w") as f:
-            print(sql, file=f)
-
-    if load_to_database:
-        with get_db_connection() as c:
-            query = text(sql)
-            c.execute(query)
-            c.commit()
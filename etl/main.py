@@ -1,12 +1,21 @@
 import argparse
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import etl_jobs
 from load_to_database import *
 from country_lists import *
 from etl_jobs import get_internet_quality_for_country
+from extract_from_ripe_api import RIPE_CACHE
+from response_cache import CACHE_ENABLED
 from datetime import datetime, timedelta
 
 from etl_jobs import (
     get_list_of_asns_for_country,
     get_stats_for_country,
+    split_stats_by_day,
     get_list_of_asn_neighbours_for_country,
     get_traffic_for_country,
 )
@@ -15,8 +24,30 @@ CLOUDFLARE_API_TOKEN = os.getenv("OZI_CLOUDFLARE_API_TOKEN")
 
 RESOLUTION_DICT = {"D": "daily", "W": "weekly", "M": "Monthly"}
 
-
-def main():
+# Longest date window requested from country-resource-stats in one STATS_1D call
+STATS_1D_WINDOW_DAYS = int(os.getenv("OZI_STATS_1D_WINDOW_DAYS", "90"))
+
+# Days of dates of a country loaded between two checkpoints. Each chunk runs
+# its own extract/load pipeline and connectivity summary refresh, so longer
+# chunks overlap more API calls with database writes, while an interrupted
+# run repeats up to one chunk per country. Other tasks are checkpointed once
+# per country
+CHECKPOINT_DAYS = {
+    "ASNS": int(os.getenv("OZI_CHECKPOINT_DAYS", "31")),
+    "ASN_NEIGHBOURS": int(os.getenv("OZI_CHECKPOINT_DAYS", "31")),
+    "STATS_1D": STATS_1D_WINDOW_DAYS,
+}
+
+# Batches extracted ahead of the loader; extraction pauses when the queue is full
+PIPELINE_QUEUE_SIZE = int(os.getenv("OZI_PIPELINE_QUEUE_SIZE", "4"))
+_END_OF_BATCHES = object()
+
+
+def main(argv=None):
+    """
+    Run one ETL task. argv holds the command line arguments without the
+    program name, None reads them from sys.argv. Returns the exit code.
+    """
     parser = argparse.ArgumentParser(
         description="ETL script for OZI Dashboard project."
     )
@@ -50,8 +81,30 @@ def main():
         action="store_true",
         help="Save generated SQL to file (default: False)",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always query RIPEstat, bypassing the local response cache",
+    )
+    parser.add_argument(
+        "--no-pipeline",
+        action="store_true",
+        help="Extract and load batches one after another instead of overlapping them",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the countries and dates completed by earlier runs of the task",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of countries processed in parallel (default: 1)",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     task = args.task
     countries = args.countries
     resolution = args.date_resolution
@@ -60,30 +113,45 @@ def main():
         date_to = datetime.strptime(args.date_to, "%Y-%m-%d")
     except ValueError:
         print("Error: Dates must be in YYYY-MM-DD format.")
-        return
+        return 1
+
+    # etl_scheduler runs many tasks in one process, options must not leak
+    # from one task into the next
+    RIPE_CACHE.enabled = CACHE_ENABLED and not args.no_cache
+    etl_jobs.SHOW_PROGRESS = True
 
     if countries[0] == "all":
         countries = list(ALL_COUNTRIES.keys())
 
-    task_map = {
-        "ASNS": etl_load_asns,
-        "STATS_1D": etl_load_stats_1d,
-        "STATS_5M": etl_load_stats_5m,
-        "ASN_NEIGHBOURS": etl_load_asn_neighbours,
-        "TRAFFIC": etl_load_traffic,
-        "INTERNET_QUALITY": etl_load_internet_quality,
-    }
-
     if task not in task_map:
         print(f"Error: Unknown task '{task}'.")
-        return
+        return 1
 
     if resolution not in RESOLUTION_DICT:
         print(f"Error: Unknown resolution '{resolution}'.")
-        return
+        return 1
 
     dates = generate_dates(date_from, date_to, resolution)
 
+    command = " ".join(sys.argv if argv is None else ["main.py", *argv])
+    load_id = start_etl_load(command)
+    print(f"{'Load:':<12} {load_id}")
+    status = "failed"
+    try:
+        result = run_task(task, countries, date_from, date_to, dates, args)
+        if result == 0:
+            status = "completed"
+        return result
+    finally:
+        finish_etl_load(load_id, status)
+
+
+def run_task(task, countries, date_from, date_to, dates, args):
+    resolution = args.date_resolution
+    if args.workers > 1:
+        return run_countries_in_parallel(task, countries, dates, args)
+
+    incomplete = []
     for iso2 in countries:
         date_from_formatted = date_from.strftime("%Y-%m-%d")
         date_to_formatted = date_to.strftime("%Y-%m-%d")
@@ -94,10 +162,8 @@ def main():
         print(f"{'Date To:':<12} {date_to_formatted}")
         print(f"{'Resolution:':<12} {RESOLUTION_DICT[resolution]}")
 
-        if task in ["STATS_5M", "TRAFFIC", "INTERNET_QUALITY"]:
-            task_map[task](iso2, dates.copy(), save_to_file=args.save_to_file)
-        else:
-            task_map[task](iso2, dates.copy())
+        if not run_task_for_country(task, iso2, dates.copy(), args):
+            incomplete.append(iso2)
 
         # task_map[task](iso2, generate_dates(date_from, date_to, resolution))
         # task_map[task](iso2, date_from, date_to, resolution)
@@ -105,6 +171,92 @@ def main():
         print(f"\n{'At:':<12} {datetime.now()}")
         print(f"{'Finished:':<12} {task}")
 
+    if incomplete:
+        print(f"{'Incomplete:':<12} {' '.join(incomplete)} - re-run with --resume")
+        return 1
+    return 0
+
+
+def run_task_for_country(task, iso2, dates, args):
+    """
+    Run the task for the dates of a country in chunks of CHECKPOINT_DAYS,
+    recording a checkpoint after every chunk the loader reports complete.
+    With --resume, the dates checkpointed by earlier runs are skipped.
+    Returns False when some data could not be extracted.
+    """
+    if args.resume:
+        completed = get_completed_dates(task, iso2, dates)
+        if completed:
+            print(f"{'Resuming:':<12} {iso2} skipping {len(completed)} of {len(dates)} completed dates")
+        dates = [date for date in dates if date not in completed]
+        if not dates:
+            return True
+
+    if task in CHECKPOINT_DAYS:
+        chunks = split_dates_into_windows(dates, CHECKPOINT_DAYS[task])
+    else:
+        chunks = [dates]
+
+    all_complete = True
+    for chunk in chunks:
+        # The ASN extractors consume the list of dates they are given
+        if task in ["STATS_5M", "TRAFFIC", "INTERNET_QUALITY"]:
+            complete = task_map[task](iso2, list(chunk), save_to_file=args.save_to_file)
+        elif task in ["ASNS", "ASN_NEIGHBOURS"]:
+            complete = task_map[task](iso2, list(chunk), pipelined=not args.no_pipeline)
+        else:
+            complete = task_map[task](iso2, list(chunk))
+        if complete:
+            save_checkpoints(task, iso2, chunk)
+        else:
+            # Loaded rows stay, --resume runs the chunk again
+            all_complete = False
+    return all_complete
+
+
+def run_countries_in_parallel(task, countries, dates, args):
+    """
+    Run the task for all countries on a pool of threads sharing the database
+    engine and the HTTP sessions. Per-country progress bars would interleave,
+    so they are replaced by one line per finished country and a final report.
+    """
+    etl_jobs.SHOW_PROGRESS = False
+    started = datetime.now()
+    print(f"{'Started:':<12} {task}")
+    print(f"{'At:':<12} {started}")
+    print(f"{'Countries:':<12} {len(countries)}")
+    print(f"{'Date From:':<12} {dates[0].strftime('%Y-%m-%d') if dates else '-'}")
+    print(f"{'Date To:':<12} {dates[-1].strftime('%Y-%m-%d') if dates else '-'}")
+    print(f"{'Workers:':<12} {args.workers}")
+
+    def run(iso2):
+        start = time.monotonic()
+        complete = run_task_for_country(task, iso2, dates.copy(), args)
+        return time.monotonic() - start, complete
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(run, iso2): iso2 for iso2 in countries}
+        for done, future in enumerate(as_completed(futures), start=1):
+            iso2 = futures[future]
+            try:
+                duration, complete = future.result()
+                if complete:
+                    status = f"completed in {duration:.1f}s"
+                else:
+                    failed[iso2] = "incomplete"
+                    status = f"INCOMPLETE after {duration:.1f}s, some requests failed"
+            except Exception as e:
+                failed[iso2] = e
+                status = f"FAILED: {e}"
+            print(f"[{done}/{len(countries)}] {iso2} {ALL_COUNTRIES.get(iso2, '')}: {status}")
+
+    print(f"\n{'At:':<12} {datetime.now()}")
+    print(f"{'Finished:':<12} {task} in {datetime.now() - started}")
+    print(f"{'Completed:':<12} {len(countries) - len(failed)}")
+    print(f"{'Failed:':<12} {len(failed)} {' '.join(sorted(failed))}")
+    return 1 if failed else 0
+
 
 def generate_dates(date_from, date_to, resolution):
     dates = []
@@ -134,41 +286,142 @@ def generate_dates(date_from, date_to, resolution):
     return dates
 
 
-def etl_load_asns(iso2, dates):
+def run_pipelined(batches, load_batch, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Consume the batches generator in an extractor thread and pass every batch
+    through a bounded queue to a loader thread, so that API requests and
+    database writes overlap. The first exception of either side is re-raised
+    once both threads have stopped.
+    """
+    batch_queue = queue.Queue(maxsize=queue_size)
+    failed = threading.Event()
+    errors = []
+
+    def extract():
+        try:
+            for batch in batches:
+                if failed.is_set():
+                    break
+                batch_queue.put(batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            batch_queue.put(_END_OF_BATCHES)
+
+    def load():
+        while True:
+            batch = batch_queue.get()
+            if batch is _END_OF_BATCHES:
+                return
+            if failed.is_set():
+                continue  # keep draining so that the extractor is never blocked
+            try:
+                load_batch(batch)
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+    threads = [
+        threading.Thread(target=extract, name="etl-extract"),
+        threading.Thread(target=load, name="etl-load"),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+
+def etl_load_asns(iso2, dates, pipelined=True):
     print(f"{'Getting data from the API and storing to DB...':<50}")
-    for asns_batch in get_list_of_asns_for_country(iso2, dates, BATCH_SIZE):
+    batches = get_list_of_asns_for_country(iso2, dates, BATCH_SIZE)
+    loaded_asns = set()
+
+    def load_batch(asns_batch):
         insert_country_asns_to_db(iso2, asns_batch)
+        loaded_asns.update(item["asn"] for item in asns_batch)
 
+    try:
+        if pipelined:
+            run_pipelined(batches, load_batch)
+        else:
+            for asns_batch in batches:
+                load_batch(asns_batch)
+    finally:
+        # The connectivity summaries take the country of each ASN from vm_current_asn
+        refresh_current_asn(loaded_asns)
+    # A failed RIPEstat call raises, the dates are all loaded when we get here
+    return True
 
-def etl_load_stats_1d(iso2, dates):
+
+def split_dates_into_windows(dates, window_days):
+    windows = []
     for date in dates:
-        stats = get_stats_for_country(iso2, date, date, "1d")
+        if windows and (date - windows[-1][0]).days < window_days:
+            windows[-1].append(date)
+        else:
+            windows.append([date])
+    return windows
+
+
+def etl_load_stats_1d(iso2, dates):
+    complete = True
+    for window in split_dates_into_windows(dates, STATS_1D_WINDOW_DAYS):
+        stats = get_stats_for_country(iso2, window[0], window[-1], "1d")
+        if stats is None:
+            complete = False
+        stats = split_stats_by_day(stats, {date.date() for date in window})
         if stats:
             insert_country_stats_to_db(iso2, "1d", stats, save_sql_to_file=True)
+    return complete
 
 
 def etl_load_stats_5m(iso2, dates, save_to_file=False):
+    complete = True
     years = sorted(set(date.year for date in dates))
     for year in years:
         date_from = datetime(year, 1, 1)
-        date_to = datetime(year + 1, 1, 1)
-        stats = get_stats_for_country(iso2, date_from, date_to, "5m")
-        if stats:
+        # Same single-instant request as before get_stats_for_country forwarded
+        # date_to; a window up to the next year would download a year of 5m data
+        stats = get_stats_for_country(iso2, date_from, date_from, "5m")
+        if stats is None:
+            complete = False
+        elif stats:
             insert_country_stats_to_db(iso2, "5m", stats, save_sql_to_file=save_to_file)
+    return complete
 
 
-def etl_load_asn_neighbours(iso2, dates):
+def etl_load_asn_neighbours(iso2, dates, pipelined=True):
     print(f"{'Getting data from the API and storing to DB...':<50}")
-    for neighbours_batch in get_list_of_asn_neighbours_for_country(
-        iso2, dates, BATCH_SIZE
-    ):
+    failed = []
+    batches = get_list_of_asn_neighbours_for_country(iso2, dates, BATCH_SIZE, failed=failed)
+    loaded_dates = set()
+
+    def load_batch(neighbours_batch):
         insert_country_asn_neighbours_to_db(iso2, neighbours_batch)
+        loaded_dates.update(item["date"] for item in neighbours_batch)
+
+    try:
+        if pipelined:
+            run_pipelined(batches, load_batch)
+        else:
+            for neighbours_batch in batches:
+                load_batch(neighbours_batch)
+    finally:
+        # Also after a failure, for the dates that made it into the database
+        refresh_connectivity_summary(iso2, loaded_dates)
+    if failed:
+        print(f"\n{len(failed)} ASN neighbour requests failed, the dates are not complete")
+    return not failed
 
 
 def etl_load_traffic(iso2, dates, save_to_file=False):
     traffic = get_traffic_for_country(iso2, CLOUDFLARE_API_TOKEN)
     if traffic:
         insert_traffic_for_country_to_db(iso2, traffic, save_sql_to_file=save_to_file)
+    return traffic is not None
 
 
 def etl_load_internet_quality(iso2, dates, save_to_file=False):
@@ -177,7 +430,18 @@ def etl_load_internet_quality(iso2, dates, save_to_file=False):
         insert_internet_quality_for_country_to_db(
             iso2, internet_quality, save_sql_to_file=save_to_file
         )
+    return internet_quality is not None
+
+
+task_map = {
+    "ASNS": etl_load_asns,
+    "STATS_1D": etl_load_stats_1d,
+    "STATS_5M": etl_load_stats_5m,
+    "ASN_NEIGHBOURS": etl_load_asn_neighbours,
+    "TRAFFIC": etl_load_traffic,
+    "INTERNET_QUALITY": etl_load_internet_quality,
+}
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+CACHE_DIR = os.getenv(
+    "OZI_RIPE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache")
+)
+CACHE_MAX_BYTES = int(os.getenv("OZI_RIPE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+# Answers for a query_time older than this are final and may be kept forever
+IMMUTABLE_AFTER_DAYS = int(os.getenv("OZI_RIPE_CACHE_IMMUTABLE_DAYS", "3"))
+CACHE_ENABLED = os.getenv("OZI_RIPE_CACHE", "on").lower() not in ("0", "off", "no")
+
+# Request parameters that pin an answer to a point in time
+TIME_PARAMS = ("query_time", "endtime")
+
+
+def normalize_params(params):
+    return {
+        k: v.isoformat() if isinstance(v, (date, datetime)) else str(v)
+        for k, v in sorted(params.items())
+    }
+
+
+def is_immutable(params, now=None):
+    """
+    True if every time parameter of the request lies more than
+    IMMUTABLE_AFTER_DAYS in the past. Requests without a time parameter
+    describe "now" and are never cached.
+    """
+    now = now or datetime.now()
+    times = [params[name] for name in TIME_PARAMS if name in params]
+    if not times:
+        return False
+
+    for value in times:
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value.replace("Z", ""))
+            except ValueError:
+                return False
+        elif isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        if value.replace(tzinfo=None) > now - timedelta(days=IMMUTABLE_AFTER_DAYS):
+            return False
+    return True
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses.
+
+    Every response is stored gzip-compressed in a file named after the SHA-256
+    of (url, normalized params). A SQLite index next to the files tracks sizes
+    and access times, so the least recently used entries are evicted once the
+    cache grows beyond max_bytes. The index is opened lazily and can be shared
+    by several ETL processes.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.db = None
+
+    def _index(self):
+        if self.db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.db = sqlite3.connect(
+                os.path.join(self.directory, "index.sqlite"),
+                timeout=30,
+                check_same_thread=False,
+            )
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entry (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self.db.commit()
+        return self.db
+
+    @staticmethod
+    def key(url, params):
+        payload = json.dumps([url, normalize_params(params)], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, url, params):
+        if not self.enabled or not is_immutable(params):
+            return None
+
+        key = self.key(url, params)
+        with self.lock:
+            db = self._index()
+            if not db.execute("SELECT 1 FROM entry WHERE key = ?", (key,)).fetchone():
+                return None
+            db.execute(
+                "UPDATE entry SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            db.commit()
+
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Payload vanished or is corrupt: forget it and fetch again
+            with self.lock:
+                self.db.execute("DELETE FROM entry WHERE key = ?", (key,))
+                self.db.commit()
+            return None
+
+    def put(self, url, params, data):
+        if not self.enabled or not is_immutable(params):
+            return
+
+        key = self.key(url, params)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            db = self._index()
+            db.execute(
+                "INSERT OR REPLACE INTO entry (key, url, params, size, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    json.dumps(normalize_params(params)),
+                    os.path.getsize(path),
+                    now,
+                    now,
+                ),
+            )
+            db.commit()
+            self._evict()
+
+    def _evict(self):
+        (total,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entry").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        # Free a little more than needed so that eviction doesn't run on every put
+        target = self.max_bytes * 0.9
+        for key, size in self.db.execute(
+            "SELECT key, size FROM entry ORDER BY last_access"
+        ).fetchall():
+            if total <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.db.execute("DELETE FROM entry WHERE key = ?", (key,))
+            total -= size
+        self.db.commit()
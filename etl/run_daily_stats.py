@@ -41,7 +41,8 @@ def main():
     print(f"Running ETL job with parameters: {date_args_str}")
 
     # Step 3: Run the main ETL job
-    etl_command_args = ["python3", "etl/main.py", "-t", "STATS_1D", "-c", "all"] + date_args + ["-dr", "D"]
+    workers = os.getenv("OZI_DAILY_STATS_WORKERS", "8")
+    etl_command_args = ["python3", "etl/main.py", "-t", "STATS_1D", "-c", "all"] + date_args + ["-dr", "D", "--workers", workers]
     print(f"Executing: {' '.join(etl_command_args)}")
     stdout, stderr, returncode = run_command(etl_command_args)
 
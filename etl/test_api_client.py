@@ -0,0 +1,134 @@
+import time
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import requests
+import requests_mock
+
+import api_client
+from api_client import (
+    AdaptiveConcurrency,
+    ApiClient,
+    CircuitBreaker,
+    create_session,
+    parse_retry_after,
+)
+from extract_from_cloudflare_api import get_cloudflare_traffic_for_country
+from extract_from_ripe_api import RETRIES, ripe_api_call
+
+URL = "https://stat.ripe.net/data/asn-neighbours/data.json"
+DATA = {"status": "ok", "data": {"neighbours": [{"asn": 1}]}}
+
+
+class TestApiClient(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("api_client.time.sleep")
+        self.sleeps = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        self.assertTrue(55 < parse_retry_after(in_a_minute) <= 60)
+
+    def test_retries_with_retry_after(self):
+        client = ApiClient(create_session())
+        with requests_mock.Mocker() as m:
+            m.get(URL, [
+                {"status_code": 429, "headers": {"Retry-After": "3"}},
+                {"status_code": 503},
+                {"json": DATA},
+            ])
+            self.assertEqual(client.get_json(URL), DATA)
+
+        self.assertEqual(m.call_count, 3)
+        # The Retry-After of the 429, then a backoff of up to BACKOFF_BASE_SECONDS * 2
+        self.assertEqual(self.sleeps.call_args_list[0].args, (3.0,))
+        self.assertTrue(0 <= self.sleeps.call_args_list[1].args[0] <= api_client.BACKOFF_BASE_SECONDS * 2)
+
+    def test_client_errors_are_not_retried(self):
+        client = ApiClient(create_session())
+        with requests_mock.Mocker() as m:
+            m.get(URL, status_code=404)
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.get_json(URL)
+
+        self.assertEqual(m.call_count, 1)
+        self.sleeps.assert_not_called()
+
+    def test_gives_up_after_retries(self):
+        client = ApiClient(create_session(), retries=3)
+        with requests_mock.Mocker() as m:
+            m.get(URL, exc=requests.exceptions.ConnectTimeout("timed out"))
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                client.get_json(URL)
+
+        self.assertEqual(m.call_count, 3)
+        self.assertEqual(self.sleeps.call_count, 2)
+
+    def test_ripe_answers_without_data_are_retried(self):
+        with requests_mock.Mocker() as m:
+            m.get(URL, [{"json": {}}, {"json": {"status": "ok", "data": None}}, {"json": DATA}])
+            self.assertEqual(ripe_api_call(URL, {"resource": "1"}, use_cache=False), DATA)
+            self.assertEqual(m.call_count, 3)
+
+            m.get(URL, json={})
+            self.assertIsNone(ripe_api_call(URL, {"resource": "1"}, use_cache=False))
+            self.assertEqual(m.call_count, 3 + RETRIES)
+
+    def test_cloudflare_error_returns_none(self):
+        with requests_mock.Mocker() as m:
+            m.get("https://api.cloudflare.com/client/v4/radar/netflows/timeseries", status_code=403)
+            self.assertIsNone(get_cloudflare_traffic_for_country("CZ", "token"))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_circuit_breaker_pauses_host(self):
+        with patch("api_client.CIRCUIT_FAILURES", 2), patch("api_client.CIRCUIT_OPEN_SECONDS", 0.2):
+            breaker = CircuitBreaker("stat.ripe.net")
+            breaker.record_failure()
+            breaker.wait()  # below the threshold, no pause
+
+            breaker.record_failure()
+            started = time.monotonic()
+            breaker.wait()
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+            self.assertTrue(breaker.probing)
+
+            # The probe failed: twice as long a pause
+            breaker.record_failure()
+            self.assertGreater(breaker.open_until - time.monotonic(), 0.3)
+
+            breaker.record_success()
+            self.assertEqual(breaker.failures, 0)
+            self.assertFalse(breaker.probing)
+
+    def test_circuit_breaker_honours_retry_after(self):
+        breaker = CircuitBreaker("stat.ripe.net")
+        breaker.record_failure(retry_after=5)
+        self.assertTrue(4 < breaker.open_until - time.monotonic() <= 5)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_adaptive_concurrency(self):
+        concurrency = AdaptiveConcurrency(8)
+        for _ in range(3):
+            concurrency.acquire()
+        concurrency.release(overloaded=True)
+        concurrency.release(overloaded=True)  # same burst, decreased once
+        self.assertEqual(concurrency.limit, 4)
+
+        # About one more call per limit successful calls
+        for _ in range(5):
+            concurrency.acquire()
+            concurrency.release(overloaded=False)
+        self.assertTrue(5 < concurrency.limit < 6)
+        self.assertEqual(concurrency.in_flight, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,12 @@
 import unittest
 from unittest.mock import patch, MagicMock, ANY
-from datetime import datetime
+from argparse import Namespace
+from datetime import datetime, timedelta
+import random
+import time
 
+import etl_jobs
+from etl_jobs import get_list_of_asn_neighbours_for_country
 from main import (
     etl_load_asns,
     etl_load_stats_1d,
@@ -9,6 +14,9 @@ from main import (
     etl_load_asn_neighbours,
     etl_load_traffic,
     etl_load_internet_quality,
+    run_pipelined,
+    run_countries_in_parallel,
+    run_task_for_country,
 )
 
 MODULE_DB = "main"
@@ -16,20 +24,26 @@ MODULE_JOBS = "main"
 
 
 class TestETLJobs(unittest.TestCase):
+    @patch(f"{MODULE_DB}.refresh_current_asn")
     @patch(f"{MODULE_DB}.insert_country_asns_to_db")
     @patch(f"{MODULE_JOBS}.get_list_of_asns_for_country")
-    def test_etl_load_asns(self, mock_get_asns, mock_insert_asns):
+    def test_etl_load_asns(self, mock_get_asns, mock_insert_asns, mock_refresh):
         iso2 = "US"
         dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
 
-        mock_get_asns.return_value = [["ASN1", "ASN2"], ["ASN3"]]
+        batches = [
+            [{"asn": 1, "date": "2023-01-01"}, {"asn": 2, "date": "2023-01-01"}],
+            [{"asn": 1, "date": "2023-01-02"}],
+        ]
+        mock_get_asns.return_value = batches
 
         etl_load_asns(iso2, dates)
 
         mock_get_asns.assert_called_once_with(iso2, dates, ANY)
         self.assertEqual(mock_insert_asns.call_count, 2)
-        mock_insert_asns.assert_any_call(iso2, ["ASN1", "ASN2"])
-        mock_insert_asns.assert_any_call(iso2, ["ASN3"])
+        mock_insert_asns.assert_any_call(iso2, batches[0])
+        mock_insert_asns.assert_any_call(iso2, batches[1])
+        mock_refresh.assert_called_once_with({1, 2})
 
     @patch(f"{MODULE_DB}.insert_country_stats_to_db")
     @patch(f"{MODULE_JOBS}.get_stats_for_country")
@@ -37,15 +51,56 @@ class TestETLJobs(unittest.TestCase):
         iso2 = "DE"
         dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
 
-        mock_get_stats.side_effect = [[{"stat": 1}], None]
+        mock_get_stats.return_value = [
+            {
+                "v4_prefixes_ris": 10,
+                "timeline": [
+                    {"starttime": "2023-01-01T00:00:00", "endtime": "2023-01-03T00:00:00"}
+                ],
+            }
+        ]
 
         etl_load_stats_1d(iso2, dates)
 
-        self.assertEqual(mock_get_stats.call_count, 2)
+        mock_get_stats.assert_called_once_with(iso2, dates[0], dates[1], "1d")
         mock_insert_stats.assert_called_once_with(
-            iso2, "1d", [{"stat": 1}], save_sql_to_file=True
+            iso2,
+            "1d",
+            [
+                {
+                    "v4_prefixes_ris": 10,
+                    "timeline": [
+                        {"starttime": "2023-01-01T00:00:00", "endtime": "2023-01-03T00:00:00"}
+                    ],
+                },
+                {
+                    "v4_prefixes_ris": 10,
+                    "timeline": [
+                        {"starttime": "2023-01-02T00:00:00", "endtime": "2023-01-03T00:00:00"}
+                    ],
+                },
+            ],
+            save_sql_to_file=True,
         )
 
+    @patch(f"{MODULE_DB}.insert_country_stats_to_db")
+    @patch(f"{MODULE_JOBS}.get_stats_for_country")
+    def test_etl_load_stats_1d_windows(self, mock_get_stats, mock_insert_stats):
+        dates = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(100)]
+        mock_get_stats.return_value = None
+
+        with patch(f"{MODULE_JOBS}.STATS_1D_WINDOW_DAYS", 30):
+            complete = etl_load_stats_1d("DE", dates)
+
+        # The API failed, the dates must not be checkpointed
+        self.assertFalse(complete)
+
+        self.assertEqual(
+            [c.args[1:3] for c in mock_get_stats.call_args_list],
+            [(dates[i], dates[min(i + 29, 99)]) for i in range(0, 100, 30)],
+        )
+        mock_insert_stats.assert_not_called()
+
     @patch(f"{MODULE_DB}.insert_country_stats_to_db")
     @patch(f"{MODULE_JOBS}.get_stats_for_country")
     def test_etl_load_stats_5m(self, mock_get_stats, mock_insert_stats):
@@ -57,26 +112,50 @@ class TestETLJobs(unittest.TestCase):
         etl_load_stats_5m(iso2, dates, save_to_file=False)
 
         mock_get_stats.assert_called_once_with(
-            iso2, datetime(2023, 1, 1), datetime(2024, 1, 1), "5m"
+            iso2, datetime(2023, 1, 1), datetime(2023, 1, 1), "5m"
         )
         mock_insert_stats.assert_called_once_with(
             iso2, "5m", [{"stat": "some"}], save_sql_to_file=False
         )
 
+    @patch(f"{MODULE_DB}.refresh_connectivity_summary")
     @patch(f"{MODULE_DB}.insert_country_asn_neighbours_to_db")
     @patch(f"{MODULE_JOBS}.get_list_of_asn_neighbours_for_country")
-    def test_etl_load_asn_neighbours(self, mock_get_neighbours, mock_insert_neighbours):
+    def test_etl_load_asn_neighbours(
+        self, mock_get_neighbours, mock_insert_neighbours, mock_refresh
+    ):
         iso2 = "JP"
         dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        n1 = {"asn": 1, "date": "2023-01-01"}
+        n2 = {"asn": 2, "date": "2023-01-01"}
+        n3 = {"asn": 3, "date": "2023-01-02"}
 
-        mock_get_neighbours.return_value = [["N1", "N2"], ["N3"]]
+        mock_get_neighbours.return_value = [[n1, n2], [n3]]
 
         etl_load_asn_neighbours(iso2, dates)
 
-        mock_get_neighbours.assert_called_once_with(iso2, dates, ANY)
+        mock_get_neighbours.assert_called_once_with(iso2, dates, ANY, failed=[])
         self.assertEqual(mock_insert_neighbours.call_count, 2)
-        mock_insert_neighbours.assert_any_call(iso2, ["N1", "N2"])
-        mock_insert_neighbours.assert_any_call(iso2, ["N3"])
+        mock_insert_neighbours.assert_any_call(iso2, [n1, n2])
+        mock_insert_neighbours.assert_any_call(iso2, [n3])
+        mock_refresh.assert_called_once_with(iso2, {"2023-01-01", "2023-01-02"})
+
+    @patch(f"{MODULE_DB}.refresh_connectivity_summary")
+    @patch(f"{MODULE_DB}.insert_country_asn_neighbours_to_db")
+    @patch(f"{MODULE_JOBS}.get_list_of_asn_neighbours_for_country")
+    def test_etl_load_asn_neighbours_refreshes_loaded_dates_on_failure(
+        self, mock_get_neighbours, mock_insert_neighbours, mock_refresh
+    ):
+        mock_get_neighbours.return_value = [
+            [{"asn": 1, "date": "2023-01-01"}],
+            [{"asn": 2, "date": "2023-01-02"}],
+        ]
+        mock_insert_neighbours.side_effect = [None, RuntimeError("db down")]
+
+        with self.assertRaises(RuntimeError):
+            etl_load_asn_neighbours("JP", [], pipelined=False)
+
+        mock_refresh.assert_called_once_with("JP", {"2023-01-01"})
 
     @patch(f"{MODULE_DB}.insert_traffic_for_country_to_db")
     @patch(f"{MODULE_JOBS}.get_traffic_for_country")
@@ -109,5 +188,204 @@ class TestETLJobs(unittest.TestCase):
         )
 
 
+class TestPipeline(unittest.TestCase):
+    def test_run_pipelined_loads_batches_in_order(self):
+        loaded = []
+
+        def slow_load(batch):
+            time.sleep(0.001)
+            loaded.append(batch)
+
+        run_pipelined(iter([[i] for i in range(20)]), slow_load, queue_size=2)
+
+        self.assertEqual(loaded, [[i] for i in range(20)])
+
+    def test_run_pipelined_reraises_extract_error_after_loading_extracted(self):
+        loaded = []
+
+        def batches():
+            yield [1]
+            yield [2]
+            raise ValueError("API failure")
+
+        with self.assertRaises(ValueError):
+            run_pipelined(batches(), loaded.append)
+        self.assertEqual(loaded, [[1], [2]])
+
+    def test_run_pipelined_stops_extracting_after_load_error(self):
+        extracted = []
+
+        def batches():
+            for i in range(100):
+                extracted.append(i)
+                yield [i]
+
+        def failing_load(batch):
+            raise RuntimeError("DB failure")
+
+        with self.assertRaises(RuntimeError):
+            run_pipelined(batches(), failing_load, queue_size=1)
+        self.assertLess(len(extracted), 100)
+
+    @patch(f"{MODULE_DB}.refresh_current_asn")
+    @patch(f"{MODULE_DB}.insert_country_asns_to_db")
+    @patch(f"{MODULE_JOBS}.get_list_of_asns_for_country")
+    def test_etl_load_asns_without_pipeline(self, mock_get_asns, mock_insert_asns, mock_refresh):
+        mock_get_asns.return_value = [[{"asn": 1}], [{"asn": 2}]]
+
+        etl_load_asns("US", [datetime(2023, 1, 1)], pipelined=False)
+
+        self.assertEqual(mock_insert_asns.call_count, 2)
+
+
+class TestParallelCountries(unittest.TestCase):
+    def test_run_countries_in_parallel_reports_failures(self):
+        dates = [datetime(2023, 1, 1)]
+        args = Namespace(workers=3, save_to_file=False, no_pipeline=False, resume=False)
+        self.addCleanup(setattr, etl_jobs, "SHOW_PROGRESS", True)
+
+        def load(iso2, dates, pipelined):
+            if iso2 == "LT":
+                raise RuntimeError("API down")
+
+        mock_load = MagicMock(side_effect=load)
+        with patch.dict("main.task_map", {"ASNS": mock_load}):
+            status = run_countries_in_parallel("ASNS", ["EE", "LV", "LT"], dates, args)
+
+        self.assertEqual(status, 1)
+        self.assertEqual(
+            sorted(call.args[0] for call in mock_load.call_args_list),
+            ["EE", "LT", "LV"],
+        )
+        mock_load.assert_any_call("EE", dates, pipelined=True)
+
+
+class TestCheckpoints(unittest.TestCase):
+    @patch("main.save_checkpoints")
+    @patch("main.get_completed_dates")
+    def test_resume_skips_completed_dates(self, mock_completed, mock_save):
+        dates = [datetime(2023, 1, d) for d in (1, 2, 3)]
+        mock_completed.return_value = {datetime(2023, 1, 2)}
+        args = Namespace(save_to_file=False, no_pipeline=True, resume=True)
+
+        mock_load = MagicMock()
+        with patch.dict("main.task_map", {"ASNS": mock_load}):
+            run_task_for_country("ASNS", "EE", dates, args)
+
+        # The remaining dates are loaded and checkpointed as one chunk
+        mock_load.assert_called_once_with("EE", [datetime(2023, 1, 1), datetime(2023, 1, 3)], pipelined=False)
+        mock_save.assert_called_once_with("ASNS", "EE", [datetime(2023, 1, 1), datetime(2023, 1, 3)])
+
+    @patch("main.save_checkpoints")
+    @patch("main.get_completed_dates")
+    def test_chunks_of_checkpoint_days(self, mock_completed, mock_save):
+        dates = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(10)]
+        args = Namespace(save_to_file=False, no_pipeline=False, resume=False)
+
+        mock_load = MagicMock(return_value=True)
+        with patch.dict("main.task_map", {"ASN_NEIGHBOURS": mock_load}), \
+                patch.dict("main.CHECKPOINT_DAYS", {"ASN_NEIGHBOURS": 4}):
+            run_task_for_country("ASN_NEIGHBOURS", "EE", dates, args)
+
+        self.assertEqual([c.args[1] for c in mock_load.call_args_list], [dates[0:4], dates[4:8], dates[8:]])
+        self.assertEqual([c.args[2] for c in mock_save.call_args_list], [dates[0:4], dates[4:8], dates[8:]])
+
+    @patch("main.save_checkpoints")
+    @patch("main.get_completed_dates")
+    def test_failed_chunk_is_not_checkpointed(self, mock_completed, mock_save):
+        dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        args = Namespace(save_to_file=False, no_pipeline=True, resume=False)
+
+        mock_load = MagicMock(side_effect=[True, RuntimeError("API down")])
+        with patch.dict("main.task_map", {"ASN_NEIGHBOURS": mock_load}), \
+                patch.dict("main.CHECKPOINT_DAYS", {"ASN_NEIGHBOURS": 1}):
+            with self.assertRaises(RuntimeError):
+                run_task_for_country("ASN_NEIGHBOURS", "EE", dates, args)
+
+        mock_completed.assert_not_called()
+        mock_save.assert_called_once_with("ASN_NEIGHBOURS", "EE", [datetime(2023, 1, 1)])
+
+    @patch("main.save_checkpoints")
+    @patch("main.get_completed_dates")
+    def test_incomplete_chunk_is_not_checkpointed(self, mock_completed, mock_save):
+        dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        args = Namespace(save_to_file=False, no_pipeline=True, resume=False)
+
+        mock_load = MagicMock(side_effect=[False, True])
+        with patch.dict("main.task_map", {"ASNS": mock_load}), patch.dict("main.CHECKPOINT_DAYS", {"ASNS": 1}):
+            self.assertFalse(run_task_for_country("ASNS", "EE", dates, args))
+
+        mock_save.assert_called_once_with("ASNS", "EE", [datetime(2023, 1, 2)])
+
+    @patch("main.save_checkpoints")
+    @patch(f"{MODULE_DB}.refresh_current_asn")
+    @patch(f"{MODULE_DB}.insert_country_asns_to_db")
+    @patch("etl_jobs.get_country_asns")
+    def test_checkpoints_dates_consumed_by_the_loader(self, mock_api, mock_insert, mock_refresh, mock_save):
+        dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        mock_api.return_value = {
+            "data": {"countries": [{"routed": "{AsnSingle(1)}", "non_routed": "{}"}]}
+        }
+        args = Namespace(save_to_file=False, no_pipeline=False, resume=False)
+        self.addCleanup(setattr, etl_jobs, "SHOW_PROGRESS", True)
+        etl_jobs.SHOW_PROGRESS = False
+
+        run_task_for_country("ASNS", "EE", dates, args)
+
+        self.assertEqual(mock_api.call_count, 2)
+        mock_save.assert_called_once_with("ASNS", "EE", dates)
+
+
+class TestAsnNeighboursFetcher(unittest.TestCase):
+    @patch("etl_jobs.get_asn_neighbours")
+    @patch("etl_jobs.get_list_of_asns_for_country")
+    def test_concurrent_fetch_keeps_date_and_asn_order(
+        self, mock_get_asns, mock_get_neighbours
+    ):
+        dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        mock_get_asns.side_effect = lambda iso2, d, batch_size, verbose: iter(
+            [[{"asn": str(asn)} for asn in range(1, 21)]]
+        )
+
+        def slow_neighbours(asn, date):
+            time.sleep(random.uniform(0, 0.01))
+            return {"data": {"neighbours": [{"asn": int(asn) * 10}]}}
+
+        mock_get_neighbours.side_effect = slow_neighbours
+
+        batches = list(
+            get_list_of_asn_neighbours_for_country(
+                "US", dates.copy(), 15, verbose=False, max_workers=4
+            )
+        )
+
+        self.assertEqual([len(batch) for batch in batches], [15, 15, 10])
+        rows = [(row["date"], int(row["asn_req"])) for batch in batches for row in batch]
+        expected = [
+            (date.strftime("%Y-%m-%d"), asn) for date in dates for asn in range(1, 21)
+        ]
+        self.assertEqual(rows, expected)
+
+    @patch("main.refresh_connectivity_summary")
+    @patch("main.insert_country_asn_neighbours_to_db")
+    @patch("etl_jobs.get_asn_neighbours")
+    @patch("etl_jobs.get_list_of_asns_for_country")
+    def test_failed_neighbour_requests_make_the_load_incomplete(
+        self, mock_get_asns, mock_get_neighbours, mock_insert, mock_refresh
+    ):
+        self.addCleanup(setattr, etl_jobs, "SHOW_PROGRESS", True)
+        etl_jobs.SHOW_PROGRESS = False
+        mock_get_asns.side_effect = lambda iso2, d, batch_size, verbose: iter([[{"asn": "1"}, {"asn": "2"}]])
+        mock_get_neighbours.side_effect = lambda asn, date: (
+            None if asn == "2" else {"data": {"neighbours": [{"asn": 10}]}}
+        )
+
+        self.assertFalse(etl_load_asn_neighbours("US", [datetime(2023, 1, 1)]))
+        mock_insert.assert_called_once()
+
+        mock_get_neighbours.side_effect = lambda asn, date: {"data": {"neighbours": []}}
+        self.assertTrue(etl_load_asn_neighbours("US", [datetime(2023, 1, 1)]))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,342 @@
+import os
+import signal
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+import etl_scheduler
+from api_client import TokenBucket
+from etl_scheduler import (
+    TaskJournal,
+    build_args,
+    build_command,
+    load_config,
+    merge_done_units,
+    queue_tasks,
+    run_task,
+    save_config,
+    split_task,
+    take_startable_tasks,
+)
+
+TASK = {
+    "task": "ASNS",
+    "countries": ["AM", "AZ"],
+    "date-from": "2019-01-01",
+    "date-to": "2019-01-31",
+    "date-resolution": "D",
+}
+
+
+class TestEtlScheduler(unittest.TestCase):
+    def setUp(self):
+        logs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(logs_dir.cleanup)
+        patcher = patch("etl_scheduler.LOGS_DIR", logs_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.logs_dir = logs_dir.name
+
+    def test_build_args(self):
+        self.assertEqual(
+            build_args(TASK),
+            ["--task", "ASNS", "--countries", "AM", "AZ", "--date-from", "2019-01-01",
+             "--date-to", "2019-01-31", "--date-resolution", "D"],
+        )
+        self.assertEqual(build_command(TASK), "python3 main.py " + " ".join(build_args(TASK)))
+
+    def test_run_task_calls_main_in_process(self):
+        etl_main = MagicMock()
+        etl_main.main.side_effect = lambda argv: print("loaded") or 0
+        with patch.object(etl_scheduler, "etl_main", etl_main):
+            done = run_task(1, TASK)
+
+        etl_main.main.assert_called_once_with(build_args(TASK))
+        self.assertEqual(done["status"], "completed")
+        self.assertEqual(done["task"], "ASNS")
+        log_file = os.path.join(self.logs_dir, f"{os.getpid()}_ASNS_AM-AZ_20190101_20190131_D.log")
+        with open(log_file) as f:
+            self.assertEqual(f.read(), "loaded\n")
+
+    def test_run_task_reports_failures(self):
+        etl_main = MagicMock()
+        for failure in (1, SystemExit(2), RuntimeError("API down")):
+            etl_main.main.side_effect = failure if isinstance(failure, BaseException) else None
+            etl_main.main.return_value = failure
+            with patch.object(etl_scheduler, "etl_main", etl_main):
+                done = run_task(1, TASK)
+            self.assertEqual(done["status"], "failed")
+        log_file = os.path.join(self.logs_dir, f"{os.getpid()}_ASNS_AM-AZ_20190101_20190131_D.log")
+        with open(log_file) as f:
+            self.assertIn("RuntimeError: API down", f.read())
+
+    def test_build_args_flags(self):
+        self.assertEqual(
+            build_args({"task": "ASNS", "resume": True, "no-cache": False}),
+            ["--task", "ASNS", "--resume"],
+        )
+
+    @patch.dict("etl_scheduler.RESOURCE_BUDGETS", {"ripe": 2, "cloudflare": 1, "db": 3})
+    def test_take_startable_tasks_respects_budgets(self):
+        pending = queue_tasks(enumerate(
+            [{"task": t} for t in ["ASN_NEIGHBOURS", "ASNS", "STATS_1D", "STATS_1D", "TRAFFIC", "INTERNET_QUALITY", "FOO"]],
+            start=1,
+        ))
+        in_use = {"ripe": 0, "cloudflare": 0, "db": 0}
+
+        started = take_startable_tasks(pending, in_use, slots=10)
+
+        # STATS_1D waits for RIPEstat, INTERNET_QUALITY for Cloudflare and the database
+        self.assertEqual(sorted(job_id for job_id, _ in started), [1, 2, 5, 7])
+        self.assertEqual(sorted(job_id for tasks in pending.values() for job_id, _ in tasks), [3, 4, 6])
+        self.assertEqual(in_use, {"ripe": 2, "cloudflare": 1, "db": 3})
+
+        in_use.update(ripe=0, db=0)
+        self.assertEqual([job_id for job_id, _ in take_startable_tasks(pending, in_use, slots=1)], [3])
+
+    @patch.dict("etl_scheduler.RESOURCE_BUDGETS", {"ripe": 3, "cloudflare": 2, "db": 2})
+    def test_database_budget_covers_all_task_types(self):
+        task_types = ["ASNS", "ASN_NEIGHBOURS", "STATS_1D", "STATS_5M", "TRAFFIC", "INTERNET_QUALITY"]
+        pending = queue_tasks(enumerate(({"task": t} for t in task_types * 3), start=1))
+        in_use = {"ripe": 0, "cloudflare": 0, "db": 0}
+        running = []
+        finished = []
+
+        while any(pending.values()) or running:
+            running.extend(take_startable_tasks(pending, in_use, slots=10))
+            self.assertLessEqual(len(running), 2)
+            self.assertEqual(in_use["db"], len(running))
+            job_id, task = running.pop(0)
+            for r in etl_scheduler.task_resources(task):
+                in_use[r] -= 1
+            finished.append(task["task"])
+
+        self.assertEqual(sorted(finished), sorted(task_types * 3))
+
+    def test_take_startable_tasks_longest_first(self):
+        tasks = [
+            dict(TASK, **{"date-from": "2019-01-01", "date-to": "2019-01-10"}),
+            {"task": "TRAFFIC"},
+            dict(TASK, **{"date-from": "2019-01-01", "date-to": "2019-01-31"}),
+        ]
+        pending = queue_tasks(enumerate(tasks, start=1))
+        in_use = {"ripe": 0, "cloudflare": 0, "db": 0}
+        started = take_startable_tasks(pending, in_use, slots=10)
+        self.assertEqual([job_id for job_id, _ in started], [3, 1, 2])
+
+
+class TestSplitTask(unittest.TestCase):
+    @patch.dict("etl_scheduler.CHUNK_DAYS", {"ASNS": 14})
+    def test_split_by_country_and_dates(self):
+        units = split_task(TASK)
+        self.assertEqual(
+            [(u["countries"], u["date-from"], u["date-to"]) for u in units],
+            [
+                (["AM"], "2019-01-01", "2019-01-14"),
+                (["AM"], "2019-01-15", "2019-01-28"),
+                (["AM"], "2019-01-29", "2019-01-31"),
+                (["AZ"], "2019-01-01", "2019-01-14"),
+                (["AZ"], "2019-01-15", "2019-01-28"),
+                (["AZ"], "2019-01-29", "2019-01-31"),
+            ],
+        )
+        self.assertEqual(units[0]["date-resolution"], "D")
+
+    def test_weekly_chunks_start_on_a_generated_date(self):
+        task = dict(TASK, task="ASN_NEIGHBOURS", countries=["CZ"], **{"date-resolution": "W"})
+        with patch.dict("etl_scheduler.CHUNK_DAYS", {"ASN_NEIGHBOURS": 14}):
+            units = split_task(task)
+        self.assertEqual(
+            [(u["date-from"], u["date-to"]) for u in units],
+            [("2019-01-07", "2019-01-14"), ("2019-01-21", "2019-01-28")],
+        )
+
+    def test_tasks_split_by_country_only_or_not_at_all(self):
+        traffic = {"task": "TRAFFIC", "countries": ["AM", "AZ"], "date-from": "2019-01-01"}
+        self.assertEqual(split_task(traffic), [dict(traffic, countries=["AM"]), dict(traffic, countries=["AZ"])])
+        invalid = dict(TASK, **{"date-from": "2019-01"})
+        self.assertEqual(split_task(invalid), [invalid])
+
+    def test_merge_done_units(self):
+        units = [
+            dict(TASK, countries=["AM"], status="completed", started="2025-05-01T00:00:02", finished="2025-05-01T00:01:00"),
+            dict(TASK, countries=["AZ"], status="failed", started="2025-05-01T00:00:01", finished="2025-05-01T00:00:30"),
+        ]
+        done = merge_done_units(TASK, units)
+        self.assertEqual(done["status"], "failed")
+        self.assertEqual(done["started"], "2025-05-01T00:00:01")
+        self.assertEqual(done["finished"], "2025-05-01T00:01:00")
+        self.assertEqual(done["sub_tasks"], 2)
+        self.assertEqual(done["failed_sub_tasks"], ["AZ 2019-01-01 2019-01-31"])
+
+
+class TestTaskJournal(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.config_file = os.path.join(directory.name, "job.yaml")
+        self.tasks = [dict(TASK, countries=[cc]) for cc in ["AM", "AZ", "AM"]]
+        save_config(self.config_file, {"TASKS_QUEUE": self.tasks})
+
+    def done(self, task, second):
+        return dict(task, status="completed", finished=f"2025-05-01T00:00:{second:02d}")
+
+    def test_compact_moves_finished_tasks(self):
+        config = load_config(self.config_file)
+        journal = TaskJournal(self.config_file)
+        finished = [self.done(self.tasks[2], 1), self.done(self.tasks[1], 2)]
+        journal.append(self.tasks[2], finished[0])
+        journal.append(self.tasks[1], finished[1])
+
+        # The YAML file is only written by compact()
+        self.assertEqual(load_config(self.config_file), {"TASKS_QUEUE": self.tasks})
+        self.assertEqual(journal.compact(config), 2)
+
+        saved = load_config(self.config_file)
+        # One of the two identical AM tasks remains queued
+        self.assertEqual(saved["TASKS_QUEUE"], [self.tasks[0]])
+        self.assertEqual(saved["TASKS_DONE"], finished)
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertEqual(journal.compact(config), 0)
+
+    def test_recovers_journal_left_by_a_crash(self):
+        journal = TaskJournal(self.config_file)
+        journal.append(self.tasks[1], self.done(self.tasks[1], 1))
+        with open(journal.path, "a") as f:
+            f.write('{"task": {"task": "AS')  # torn by the crash
+
+        config = load_config(self.config_file)
+        self.assertEqual(TaskJournal(self.config_file).compact(config), 1)
+        self.assertEqual(load_config(self.config_file)["TASKS_QUEUE"], [self.tasks[0], self.tasks[2]])
+
+    def test_entries_already_compacted_are_skipped(self):
+        journal = TaskJournal(self.config_file)
+        done = self.done(self.tasks[0], 1)
+        journal.append(self.tasks[0], done)
+        config = load_config(self.config_file)
+        with patch("etl_scheduler.os.remove"):
+            # Crash after saving the config, before emptying the journal
+            journal.compact(config)
+
+        config = load_config(self.config_file)
+        journal.compact(config)
+        saved = load_config(self.config_file)
+        self.assertEqual(saved["TASKS_QUEUE"], self.tasks[1:])
+        self.assertEqual(saved["TASKS_DONE"], [done])
+
+    def test_compact_keeps_sub_tasks_of_queued_tasks(self):
+        save_config(self.config_file, {"TASKS_QUEUE": self.tasks[:2]})
+        journal = TaskJournal(self.config_file)
+        unit = dict(self.tasks[1], **{"date-to": "2019-01-15"})
+        journal.append(self.tasks[1], self.done(unit, 1), unit=unit)
+        journal.append(self.tasks[0], self.done(self.tasks[0], 2), unit=self.tasks[0])
+        journal.append(self.tasks[0], self.done(self.tasks[0], 2))
+
+        config = load_config(self.config_file)
+        self.assertEqual(journal.compact(config), 1)
+
+        # The sub-task of the finished AM task is dropped, AZ is still queued
+        self.assertEqual(load_config(self.config_file)["TASKS_QUEUE"], self.tasks[1:2])
+        self.assertEqual([e["unit"] for e in journal.read()], [unit])
+
+    @patch("etl_scheduler.init_worker")
+    @patch("etl_scheduler.ensure_logs_dir")
+    @patch("etl_scheduler.setup_logging")
+    @patch("etl_scheduler.ProcessPoolExecutor", ThreadPoolExecutor)
+    @patch("etl_scheduler.run_task")
+    @patch.dict("etl_scheduler.CHUNK_DAYS", {"ASNS": 16})
+    def test_restart_skips_journaled_sub_tasks(self, mock_run, *mocks):
+        mock_run.side_effect = lambda job_id, unit: self.done(unit, job_id)
+        save_config(self.config_file, {"TASKS_QUEUE": [TASK]})
+        units = etl_scheduler.split_task(TASK)
+        self.assertEqual(len(units), 4)
+        journal = TaskJournal(self.config_file)
+        # Interrupted after the first sub-task of AZ
+        journal.append(TASK, self.done(units[2], 9), unit=units[2])
+
+        with patch("sys.argv", ["etl_scheduler.py", self.config_file]):
+            etl_scheduler.main()
+
+        self.assertEqual(
+            sorted(etl_scheduler.task_key(c.args[1]) for c in mock_run.call_args_list),
+            sorted(etl_scheduler.task_key(u) for u in units[:2] + units[3:]),
+        )
+        saved = load_config(self.config_file)
+        self.assertEqual(saved["TASKS_QUEUE"], [])
+        self.assertEqual(saved["TASKS_DONE"][0]["sub_tasks"], 4)
+        self.assertEqual(saved["TASKS_DONE"][0]["status"], "completed")
+        self.assertFalse(os.path.exists(journal.path))
+
+
+def init_test_worker(rate_limiters):
+    pass
+
+
+def run_or_die(job_id, task):
+    if task["countries"] == ["ZZ"]:
+        # Like a worker killed for running out of memory
+        os.kill(os.getpid(), signal.SIGKILL)
+    now = datetime.now().isoformat()
+    return dict(task, status="completed", started=now, finished=now)
+
+
+class TestWorkerFailure(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.config_file = os.path.join(directory.name, "job.yaml")
+
+    @patch("etl_scheduler.MAX_PARALLEL_JOBS", 1)
+    @patch("etl_scheduler.init_worker", init_test_worker)
+    @patch("etl_scheduler.run_task", run_or_die)
+    @patch("etl_scheduler.ensure_logs_dir")
+    @patch("etl_scheduler.setup_logging")
+    def test_killed_worker_is_replaced(self, *mocks):
+        task = {"task": "TRAFFIC", "countries": ["AM", "ZZ", "AZ"], "date-from": "2019-01-01", "date-to": "2019-01-31"}
+        save_config(self.config_file, {"TASKS_QUEUE": [task]})
+
+        with patch("sys.argv", ["etl_scheduler.py", self.config_file]):
+            etl_scheduler.main()
+
+        saved = load_config(self.config_file)
+        self.assertEqual(saved["TASKS_QUEUE"], [])
+        done = saved["TASKS_DONE"][0]
+        self.assertEqual(done["sub_tasks"], 3)
+        # The sub-tasks after the killed one ran in new worker processes
+        self.assertEqual(done["failed_sub_tasks"], ["ZZ 2019-01-01 2019-01-31"])
+
+
+def wait_for_tokens(bucket, count):
+    for _ in range(count):
+        bucket.wait()
+
+
+def init_bucket(bucket):
+    global BUCKET
+    BUCKET = bucket
+
+
+def wait_for_shared_tokens(count):
+    wait_for_tokens(BUCKET, count)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_is_shared_by_processes(self):
+        bucket = TokenBucket(20, shared=True)
+        with ProcessPoolExecutor(max_workers=2, initializer=init_bucket, initargs=(bucket,)) as executor:
+            started = time.monotonic()
+            # 10 tokens at 20 per second, the first one from the initial burst
+            list(executor.map(wait_for_shared_tokens, [5, 5]))
+            self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+    def test_disabled_without_rate(self):
+        started = time.monotonic()
+        wait_for_tokens(TokenBucket(0), 1000)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,17 @@
 import unittest
 from datetime import datetime
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 import time
 import os
+import load_to_database
 from load_to_database import (
+    finish_etl_load,
+    get_completed_dates,
+    refresh_connectivity_summary,
+    refresh_current_asn,
+    save_checkpoints,
+    start_etl_load,
     insert_country_asns_to_db,
     insert_country_stats_to_db,
     insert_country_asn_neighbours_to_db,
@@ -57,6 +65,11 @@ class TestLoadToDatabase(unittest.TestCase):
             connection.execute(
                 text("TRUNCATE TABLE data.country_internet_quality CASCADE;")
             )
+            connection.execute(text("TRUNCATE TABLE data.connectivity_index_by_country;"))
+            connection.execute(text("TRUNCATE TABLE data.connectivity_index_by_asn_top10;"))
+            connection.execute(text("TRUNCATE TABLE data.connectivity_index_distinct;"))
+            connection.execute(text("TRUNCATE TABLE data.dataset_version;"))
+            connection.execute(text("TRUNCATE TABLE data.etl_load CASCADE;"))
             connection.commit()
 
     def test_insert_country_asns_to_db_no_duplicates(self):
@@ -149,6 +162,112 @@ class TestLoadToDatabase(unittest.TestCase):
             )
             self.assertEqual([ts[0] for ts in stats_in_db], expected_timestamps)
 
+    def test_insert_country_stats_to_db_counts_and_nulls(self):
+        stats = [
+            {
+                "timeline": [{"starttime": "2023-01-01T00:00:00Z"}],
+                "v4_prefixes_ris": 10,
+                "v6_prefixes_ris": None,
+                "asns_ris": 2,
+                "v4_prefixes_stats": 100,
+                "v6_prefixes_stats": None,
+                "asns_stats": 20,
+            }
+        ]
+
+        self.assertEqual(insert_country_stats_to_db("EE", "1d", stats), 1)
+        self.assertEqual(insert_country_stats_to_db("EE", "1d", stats), 0)
+        self.assertEqual(insert_country_stats_to_db("EE", "5m", stats), 1)
+
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                text(
+                    "SELECT cs_v4_prefixes_ris, cs_v6_prefixes_ris, cs_v6_prefixes_stats"
+                    " FROM data.country_stat WHERE cs_stats_resolution = '1d';"
+                )
+            ).one()
+            self.assertEqual(tuple(row), (10, None, None))
+
+    def test_insert_country_stats_to_db_bumps_dataset_version(self):
+        def stats(starttime):
+            return [
+                {
+                    "timeline": [{"starttime": starttime}],
+                    "v4_prefixes_ris": 1,
+                    "v6_prefixes_ris": 1,
+                    "asns_ris": 1,
+                    "v4_prefixes_stats": 1,
+                    "v6_prefixes_stats": 1,
+                    "asns_stats": 1,
+                }
+            ]
+
+        def versions():
+            with self.engine.connect() as connection:
+                return dict(
+                    connection.execute(
+                        text(
+                            "SELECT country_iso2, version FROM data.dataset_version"
+                            " WHERE dataset = 'country_stat';"
+                        )
+                    ).fetchall()
+                )
+
+        insert_country_stats_to_db("LV", "1d", stats("2023-01-01T00:00:00Z"))
+        self.assertEqual(versions(), {"LV": 1})
+
+        # Nothing new loaded, the dashboard keeps its figures
+        insert_country_stats_to_db("LV", "1d", stats("2023-01-01T00:00:00Z"))
+        self.assertEqual(versions(), {"LV": 1})
+
+        insert_country_stats_to_db("LV", "1d", stats("2023-01-02T00:00:00Z"))
+        insert_country_stats_to_db("LT", "1d", stats("2023-01-02T00:00:00Z"))
+        self.assertEqual(versions(), {"LV": 2, "LT": 1})
+
+    def test_insert_country_stats_to_db_creates_monthly_partitions(self):
+        stats = [
+            {
+                "timeline": [{"starttime": starttime}],
+                "v4_prefixes_ris": 10,
+                "v6_prefixes_ris": 5,
+                "asns_ris": 2,
+                "v4_prefixes_stats": 100,
+                "v6_prefixes_stats": 50,
+                "asns_stats": 20,
+            }
+            for starttime in ["2022-01-31T23:55:00Z", "2022-03-01T00:00:00Z"]
+        ]
+
+        insert_country_stats_to_db("NL", "5m", stats)
+
+        with self.engine.connect() as connection:
+            partitions = connection.execute(
+                text(
+                    "SELECT tableoid::regclass::text FROM data.country_stat"
+                    " ORDER BY cs_stats_timestamp;"
+                )
+            ).scalars().all()
+            self.assertEqual(
+                partitions, ["data.country_stat_p202201", "data.country_stat_p202203"]
+            )
+            self.assertIsNotNone(
+                connection.execute(
+                    text("SELECT to_regclass('data.country_stat_p202202');")
+                ).scalar()
+            )
+
+            detached = connection.execute(
+                text(
+                    "SELECT * FROM data.detach_monthly_partitions('country_stat', '2022-02-01');"
+                )
+            ).scalars().all()
+            self.assertEqual(detached, ["country_stat_p202201"])
+            self.assertEqual(
+                connection.execute(text("SELECT COUNT(*) FROM data.country_stat;")).scalar(), 1
+            )
+            connection.execute(text("DROP TABLE data.country_stat_p202201;"))
+            connection.commit()
+
     def test_insert_country_asn_neighbours_to_db_no_duplicates(self):
         country_iso2 = "JP"
         neighbours = [
@@ -212,6 +331,188 @@ class TestLoadToDatabase(unittest.TestCase):
             ]
             self.assertEqual(neighbours_in_db_dates_converted, expected_neighbours)
 
+    def test_full_refresh_skips_asns_without_country(self):
+        insert_country_asns_to_db("CZ", [{"asn": 1, "date": "2023-01-01", "is_routed": True}])
+        with self.engine.connect() as connection:
+            connection.execute(text("REFRESH MATERIALIZED VIEW data.vm_current_asn;"))
+            connection.commit()
+        insert_country_asn_neighbours_to_db(
+            "CZ",
+            [
+                {"asn_req": asn, "asn": 2, "date": "2023-01-01", "type": "left",
+                 "power": 1, "v4_peers": 1, "v6_peers": 0}
+                # ASN 9 is not in vm_current_asn, it has no country
+                for asn in (1, 9)
+            ],
+        )
+
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT data.refresh_connectivity_summary();"))
+            connection.commit()
+            rows = connection.execute(
+                text("SELECT asn_country, asn_count FROM data.connectivity_index_distinct;")
+            ).fetchall()
+        self.assertEqual([tuple(r) for r in rows], [("CZ", 1)])
+
+    def test_refresh_views_fills_vm_asn_neighbour(self):
+        insert_country_asns_to_db("CZ", [{"asn": 1, "date": "2023-01-01", "is_routed": True}])
+        insert_country_asn_neighbours_to_db(
+            "CZ",
+            [{"asn_req": 1, "asn": 2, "date": "2023-01-01", "type": "left",
+              "power": 1, "v4_peers": 1, "v6_peers": 0}],
+        )
+        refresh_views = os.path.join(os.path.dirname(__file__), "..", "refersh_views.sql")
+        with open(refresh_views) as f:
+            statements = f.read()
+
+        with self.engine.connect() as connection:
+            connection.execute(text(statements))
+            connection.commit()
+            # Materialized, so that readers do not join asn_neighbour per query
+            kind = connection.execute(
+                text("SELECT relkind FROM pg_class WHERE oid = 'data.vm_asn_neighbour'::regclass;")
+            ).scalar()
+            rows = connection.execute(
+                text("SELECT asn_country, an_asn, an_neighbour FROM data.vm_asn_neighbour;")
+            ).fetchall()
+        self.assertEqual(kind, "m")
+        self.assertEqual([tuple(r) for r in rows], [("CZ", 1, 2)])
+
+    def test_loaded_asns_reach_the_connectivity_summary(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("REFRESH MATERIALIZED VIEW data.vm_current_asn;"))
+            connection.commit()
+        # Neighbours of ASN 1 loaded and summarized before ASN 1 itself
+        insert_country_asn_neighbours_to_db(
+            "CZ",
+            [{"asn_req": 1, "asn": 2, "date": "2023-01-01", "type": "left",
+              "power": 1, "v4_peers": 1, "v6_peers": 0}],
+        )
+        refresh_connectivity_summary("CZ", {"2023-01-01"})
+        insert_country_asns_to_db("CZ", [{"asn": 1, "date": "2023-01-01", "is_routed": True}])
+
+        refresh_current_asn({1})
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT asn_country, asn_count FROM data.connectivity_index_distinct;")
+            ).fetchall()
+        self.assertEqual([tuple(r) for r in rows], [("CZ", 1)])
+
+    def test_summary_refreshes_are_serialized(self):
+        with self.engine.connect() as holder, self.engine.connect() as waiter:
+            holder.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext('data.connectivity_summary'));")
+            )
+            waiter.execute(text("SET lock_timeout = '100ms';"))
+            with self.assertRaises(OperationalError) as raised:
+                waiter.execute(text("SELECT data.refresh_connectivity_summary();"))
+            self.assertIn("lock timeout", str(raised.exception))
+            holder.rollback()
+
+    def test_refresh_connectivity_summary_only_touches_given_dates(self):
+        insert_country_asns_to_db(
+            "CZ",
+            [{"asn": asn, "date": "2023-01-01", "is_routed": True} for asn in (1, 2)],
+        )
+        insert_country_asns_to_db(
+            "SK", [{"asn": 3, "date": "2023-01-01", "is_routed": True}]
+        )
+        with self.engine.connect() as connection:
+            connection.execute(text("REFRESH MATERIALIZED VIEW data.vm_current_asn;"))
+            connection.commit()
+
+        def neighbour(asn, neighbour, date):
+            return {
+                "asn_req": asn,
+                "asn": neighbour,
+                "date": date,
+                "type": "left",
+                "power": 1,
+                "v4_peers": 1,
+                "v6_peers": 0,
+            }
+
+        insert_country_asn_neighbours_to_db(
+            "CZ",
+            [
+                neighbour(1, 2, "2023-01-01"),
+                neighbour(1, 3, "2023-01-01"),
+                neighbour(1, 2, "2023-01-02"),
+            ],
+        )
+        refresh_connectivity_summary("CZ", {"2023-01-01", "2023-01-02"})
+
+        # Loaded later, but the summary of 2023-01-02 is not refreshed
+        insert_country_asn_neighbours_to_db("CZ", [neighbour(2, 3, "2023-01-02")])
+        insert_country_asn_neighbours_to_db("CZ", [neighbour(2, 3, "2023-01-01")])
+        refresh_connectivity_summary("CZ", {"2023-01-01"})
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT asn_country, date::date::text, asn_count,"
+                    " foreign_neighbour_count, total_neighbour_count"
+                    " FROM data.connectivity_index_by_country ORDER BY date;"
+                )
+            ).fetchall()
+            self.assertEqual(
+                [tuple(r) for r in rows],
+                [("CZ", "2023-01-01", 2, 2, 3), ("CZ", "2023-01-02", 1, 0, 1)],
+            )
+            distinct = connection.execute(
+                text(
+                    "SELECT date::date::text, asn_count, total_neighbour_count, foreign_share_pct"
+                    " FROM data.connectivity_index_distinct ORDER BY date;"
+                )
+            ).fetchall()
+            self.assertEqual(
+                [tuple(r) for r in distinct],
+                [("2023-01-01", 2, 3, 67.0), ("2023-01-02", 1, 1, 0.0)],
+            )
+            top10 = connection.execute(
+                text(
+                    "SELECT an_asn, rn FROM data.vm_connectivity_index_by_asn_top10"
+                    " WHERE an_date = '2023-01-01' ORDER BY rn;"
+                )
+            ).fetchall()
+            self.assertEqual([tuple(r) for r in top10], [(1, 1), (2, 2)])
+            version = connection.execute(
+                text(
+                    "SELECT version FROM data.dataset_version"
+                    " WHERE dataset = 'connectivity_index_distinct' AND country_iso2 = 'CZ';"
+                )
+            ).scalar()
+            self.assertEqual(version, 2)
+
+    def test_etl_load_tags_rows_and_records_checkpoints(self):
+        asns = [{"asn": 1, "date": "2023-01-01", "is_routed": True}]
+        insert_country_asns_to_db("FI", asns)
+
+        load_id = start_etl_load("main.py -t ASNS -c FI")
+        self.addCleanup(setattr, load_to_database, "CURRENT_LOAD_ID", None)
+        insert_country_asns_to_db("FI", asns + [{"asn": 2, "date": "2023-01-01", "is_routed": True}])
+        dates = [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+        save_checkpoints("ASNS", "FI", dates[:1])
+        finish_etl_load(load_id, "completed")
+
+        # Outside of a load nothing is recorded
+        save_checkpoints("ASNS", "FI", dates[1:])
+
+        self.assertEqual(get_completed_dates("ASNS", "FI", dates), {dates[0]})
+        self.assertEqual(get_completed_dates("ASNS", "SE", dates), set())
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT a_ripe_id, load_id FROM data.asn ORDER BY a_ripe_id;")
+            ).fetchall()
+            # The row loaded before keeps its load
+            self.assertEqual([tuple(r) for r in rows], [(1, None), (2, load_id)])
+            status = connection.execute(
+                text("SELECT status, finish_time IS NOT NULL FROM data.etl_load WHERE load_id = :id"),
+                {"id": load_id},
+            ).one()
+            self.assertEqual(tuple(status), ("completed", True))
+
     def test_insert_traffic_for_country_to_db_no_duplicates(self):
         country_iso2 = "BR"
         traffic = {
@@ -0,0 +1,161 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, text
+
+# Database connection details (from docker-compose.yml)
+DB_HOST = os.environ.get("OZI_DATABASE_HOST", "ozi-postgres")
+DB_PORT = 5432
+DB_NAME = os.environ.get("OZI_DATABASE_NAME", "ozi_db2")
+DB_USER = os.environ.get("OZI_DATABASE_USER", "ozi")
+DB_PASS = os.environ.get("OZI_DATABASE_PASSWORD", "ozi_password")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    The test database is almost empty, where a sequential scan is always the
+    cheapest plan. With enable_seqscan off the planner still falls back to a
+    sequential scan when no index can answer the query, so these tests check
+    that the indexes match the queries of the ETL and the dashboard.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(DATABASE_URL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+
+    def explain(self, query, params=None):
+        with self.engine.connect() as connection:
+            connection.execute(text("SET enable_seqscan = off"))
+            result = connection.execute(
+                text(f"EXPLAIN (FORMAT JSON) {query}"), params or {}
+            ).scalar()
+        return list(plan_nodes(result[0]["Plan"]))
+
+    def partition_indexes(self, index):
+        # Plans of partitioned tables name the indexes of the partitions
+        with self.engine.connect() as connection:
+            return [index] + connection.execute(
+                text(
+                    "SELECT c.relname FROM pg_inherits i"
+                    " JOIN pg_class c ON c.oid = i.inhrelid"
+                    " WHERE i.inhparent = to_regclass('data.' || :index)"
+                ),
+                {"index": index},
+            ).scalars().all()
+
+    def assertUsesIndex(self, query, index=None, params=None):
+        nodes = self.explain(query, params)
+        seq_scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+        self.assertEqual(seq_scans, [], f"sequential scan in plan of: {query}")
+        if index:
+            used = {n.get("Index Name") for n in nodes}
+            self.assertTrue(used & set(self.partition_indexes(index)), used)
+
+    def test_last_stats_date(self):
+        self.assertUsesIndex(
+            "SELECT MAX(cs_stats_timestamp) FROM data.country_stat"
+            " WHERE cs_stats_resolution = :resolution",
+            "idx_country_stat_resolution_timestamp",
+            {"resolution": "1d"},
+        )
+
+    def test_dashboard_stats_series(self):
+        self.assertUsesIndex(
+            "SELECT cs_country_iso2, cs_stats_timestamp, cs_asns_ris, cs_asns_stats"
+            " FROM data.country_stat WHERE cs_country_iso2 = :country"
+            " AND cs_stats_resolution = :resolution AND cs_stats_timestamp >= :start_date"
+            " AND cs_stats_timestamp < :end_date ORDER BY cs_stats_timestamp",
+            "uq_country_stat_natural_key",
+            {"country": "DE", "resolution": "1d", "start_date": "2025-01-01", "end_date": "2025-02-01"},
+        )
+
+    def test_dashboard_stats_series_all_resolutions(self):
+        self.assertUsesIndex(
+            "SELECT cs_country_iso2, cs_stats_timestamp, cs_asns_ris, cs_asns_stats"
+            " FROM data.country_stat WHERE cs_country_iso2 = :country"
+            " AND cs_stats_timestamp >= :start_date AND cs_stats_timestamp < :end_date"
+            " ORDER BY cs_stats_timestamp",
+            "uq_country_stat_natural_key",
+            {"country": "DE", "start_date": "2025-01-01", "end_date": "2025-02-01"},
+        )
+
+    def test_dashboard_connectivity_series(self):
+        self.assertUsesIndex(
+            "SELECT * FROM data.connectivity_index_distinct WHERE asn_country = :country"
+            " AND date >= :start_date AND date < :end_date ORDER BY date",
+            "connectivity_index_distinct_pkey",
+            {"country": "DE", "start_date": "2025-01-01", "end_date": "2025-02-01"},
+        )
+
+    def test_country_stat_by_country_and_date(self):
+        self.assertUsesIndex(
+            "SELECT * FROM data.country_stat WHERE cs_country_iso2 = :iso2"
+            " AND cs_stats_resolution = '1d' AND cs_stats_timestamp >= :date_from",
+            params={"iso2": "DE", "date_from": "2025-01-01"},
+        )
+
+    def test_asn_neighbours_of_asn(self):
+        self.assertUsesIndex(
+            "SELECT 1 FROM data.asn_neighbour WHERE an_asn = :asn AND an_date = :date",
+            "idx_asn_neighbour_asn_date",
+            {"asn": 1, "date": "2025-01-01"},
+        )
+
+    def test_asn_neighbours_by_date(self):
+        self.assertUsesIndex(
+            "SELECT * FROM data.v_asn_neighbour WHERE an_date BETWEEN :date_from AND :date_to",
+            params={"date_from": "2025-01-01", "date_to": "2025-01-31"},
+        )
+
+    def test_dashboard_connectivity_date_range(self):
+        self.assertUsesIndex(
+            "SELECT MIN(date)::date, MAX(date)::date FROM data.connectivity_index_distinct",
+            "idx_connectivity_index_distinct_date",
+        )
+
+    def test_partition_pruning(self):
+        with self.engine.connect() as connection:
+            connection.execute(
+                text(
+                    "SELECT data.ensure_monthly_partitions('asn_neighbour', '2021-01-01', '2021-02-01')"
+                )
+            )
+            connection.commit()
+
+        nodes = self.explain(
+            "SELECT * FROM data.v_asn_neighbour WHERE an_date >= :date_from AND an_date < :date_to",
+            {"date_from": "2021-01-01", "date_to": "2021-02-01"},
+        )
+        scanned = {n["Relation Name"] for n in nodes if "Relation Name" in n}
+        self.assertEqual(scanned - {"vm_current_asn"}, {"asn_neighbour_p202101"})
+
+    def test_current_asn(self):
+        self.assertUsesIndex(
+            "SELECT asn_country FROM data.vm_current_asn WHERE asn_id = :asn",
+            "uq_vm_current_asn_asn_id",
+            {"asn": 1},
+        )
+
+    def test_connectivity_by_country(self):
+        self.assertUsesIndex(
+            "SELECT * FROM data.vm_connectivity_index_by_country"
+            " WHERE asn_country = :iso2 ORDER BY date",
+            "connectivity_index_by_country_pkey",
+            {"iso2": "DE"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
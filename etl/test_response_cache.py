@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from response_cache import ResponseCache, is_immutable
+
+URL = "https://stat.ripe.net/data/asn-neighbours/data.json"
+DATA = {"status": "ok", "data": {"neighbours": [{"asn": 1}]}}
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_is_immutable(self):
+        old = datetime.now() - timedelta(days=30)
+        recent = datetime.now() - timedelta(hours=1)
+
+        self.assertTrue(is_immutable({"resource": "1", "query_time": old.isoformat()}))
+        self.assertTrue(is_immutable({"starttime": old, "endtime": old}))
+        self.assertFalse(is_immutable({"resource": "1", "query_time": recent.isoformat()}))
+        self.assertFalse(is_immutable({"starttime": old, "endtime": recent}))
+        self.assertFalse(is_immutable({"resource": "1"}))
+
+    def test_cache_roundtrip_with_normalized_params(self):
+        cache = ResponseCache(str(self.directory))
+        params = {"resource": 1, "query_time": datetime(2020, 1, 1)}
+
+        self.assertIsNone(cache.get(URL, params))
+        cache.put(URL, params, DATA)
+
+        same_params = {"query_time": "2020-01-01T00:00:00", "resource": "1"}
+        self.assertEqual(cache.get(URL, same_params), DATA)
+        self.assertTrue(list(self.directory.glob("*/*.json.gz")))
+
+    def test_cache_skips_recent_queries_and_bypass(self):
+        cache = ResponseCache(str(self.directory))
+        recent = {"resource": "1", "query_time": datetime.now().isoformat()}
+        cache.put(URL, recent, DATA)
+        self.assertIsNone(cache.get(URL, recent))
+
+        params = {"resource": "1", "query_time": "2020-01-01T00:00:00"}
+        cache.put(URL, params, DATA)
+        cache.enabled = False
+        self.assertIsNone(cache.get(URL, params))
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = ResponseCache(str(self.directory), max_bytes=10**9)
+        params = [
+            {"resource": str(asn), "query_time": "2020-01-01T00:00:00"}
+            for asn in range(3)
+        ]
+        for p in params:
+            cache.put(URL, p, DATA)
+        cache.get(URL, params[0])
+
+        entry_size = cache.db.execute("SELECT MAX(size) FROM entry").fetchone()[0]
+        cache.max_bytes = entry_size * 3
+        cache.put(URL, {"resource": "3", "query_time": "2020-01-01T00:00:00"}, DATA)
+
+        self.assertIsNone(cache.get(URL, params[1]))
+        self.assertEqual(cache.get(URL, params[0]), DATA)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ import requests_mock
 import time
 import requests
 from datetime import datetime
-from etl.extract_from_ripe_api import ripe_api_call, API_URL, RETRIES
+from etl.extract_from_ripe_api import ripe_api_call, API_URL, RETRIES, RIPE_SESSION
 
 # Mock data for successful response
 SUCCESS_DATA = {
@@ -50,6 +50,19 @@ def test_ripe_api_call_success():
         assert result == SUCCESS_DATA
 
 
+def test_ripe_api_call_uses_pooled_session():
+    """Test that API calls go through the shared keep-alive session"""
+    with requests_mock.Mocker() as m:
+        m.get(API_URL.format("test-call"), json=SUCCESS_DATA, status_code=200)
+        ripe_api_call(API_URL.format("test-call"), {"resource": "EE"})
+        ripe_api_call(API_URL.format("test-call"), {"resource": "LV"})
+
+        assert m.call_count == 2
+        assert "gzip" in m.last_request.headers["Accept-Encoding"]
+        assert m.last_request.qs == {"resource": ["lv"]}
+        assert RIPE_SESSION.headers["Accept-Encoding"] == "gzip, deflate"
+
+
 def test_ripe_api_call_500_retry_success():
     """Test API call with 500 error and successful retry"""
     with requests_mock.Mocker() as m:
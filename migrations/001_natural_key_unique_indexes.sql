@@ -0,0 +1,67 @@
+-- Unique indexes on the natural keys of the fact tables.
+--
+-- The ETL loaders insert with INSERT ... ON CONFLICT DO NOTHING and rely on
+-- these indexes to skip rows that are already loaded. Existing duplicates
+-- are removed first, keeping the oldest row of every key.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/001_natural_key_unique_indexes.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+DELETE FROM data.asn
+ WHERE a_id IN (SELECT a_id
+                  FROM (SELECT a_id,
+                               row_number() OVER (PARTITION BY a_country_iso2, a_date, a_ripe_id ORDER BY a_id) AS rn
+                          FROM data.asn) d
+                 WHERE rn > 1);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_asn_natural_key
+    ON data.asn USING btree (a_country_iso2, a_date, a_ripe_id);
+
+
+DELETE FROM data.asn_neighbour
+ WHERE an_id IN (SELECT an_id
+                   FROM (SELECT an_id,
+                                row_number() OVER (PARTITION BY an_asn, an_neighbour, an_date, an_type ORDER BY an_id) AS rn
+                           FROM data.asn_neighbour) d
+                  WHERE rn > 1);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_asn_neighbour_natural_key
+    ON data.asn_neighbour USING btree (an_asn, an_neighbour, an_date, an_type) NULLS NOT DISTINCT;
+
+
+DELETE FROM data.country_stat
+ WHERE cs_id IN (SELECT cs_id
+                   FROM (SELECT cs_id,
+                                row_number() OVER (PARTITION BY cs_country_iso2, cs_stats_resolution, cs_stats_timestamp ORDER BY cs_id) AS rn
+                           FROM data.country_stat) d
+                  WHERE rn > 1);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_country_stat_natural_key
+    ON data.country_stat USING btree (cs_country_iso2, cs_stats_resolution, cs_stats_timestamp);
+
+
+DELETE FROM data.country_traffic
+ WHERE cr_id IN (SELECT cr_id
+                   FROM (SELECT cr_id,
+                                row_number() OVER (PARTITION BY cr_country_iso2, cr_date ORDER BY cr_id) AS rn
+                           FROM data.country_traffic) d
+                  WHERE rn > 1);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_country_traffic_natural_key
+    ON data.country_traffic USING btree (cr_country_iso2, cr_date);
+
+
+DELETE FROM data.country_internet_quality
+ WHERE ci_id IN (SELECT ci_id
+                   FROM (SELECT ci_id,
+                                row_number() OVER (PARTITION BY ci_country_iso2, ci_date ORDER BY ci_id) AS rn
+                           FROM data.country_internet_quality) d
+                  WHERE rn > 1);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_country_internet_quality_natural_key
+    ON data.country_internet_quality USING btree (ci_country_iso2, ci_date);
+
+COMMIT;
@@ -0,0 +1,42 @@
+-- Secondary indexes for the ETL and dashboard access paths.
+--
+--   idx_country_stat_resolution_timestamp   MAX(cs_stats_timestamp) per resolution
+--                                           (get_stats_1d_date_range), v_country_stat_1d/5m
+--   idx_asn_neighbour_asn_date              EXISTS lookup of v_asn_with_neighbours
+--   idx_asn_neighbour_date                  v_asn_neighbour and the connectivity views
+--                                           restricted to a date range
+--   uq_vm_current_asn_asn_id                joins of v_asn_neighbour on vm_current_asn,
+--                                           also allows REFRESH ... CONCURRENTLY
+--   idx_vm_*                                dashboard reads of the materialized views
+--
+-- The indexes are built CONCURRENTLY so the ETL can keep loading, which is why
+-- this script does not run in a transaction. Re-running it is harmless.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/002_access_path_indexes.sql
+
+\connect ozi_db2
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_country_stat_resolution_timestamp
+    ON data.country_stat USING btree (cs_stats_resolution, cs_stats_timestamp);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_asn_neighbour_asn_date
+    ON data.asn_neighbour USING btree (an_asn, an_date);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_asn_neighbour_date
+    ON data.asn_neighbour USING btree (an_date, an_asn, an_neighbour)
+    WHERE ((an_type)::text = ANY (ARRAY[('left'::character varying)::text, ('right'::character varying)::text]));
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_vm_current_asn_asn_id
+    ON data.vm_current_asn USING btree (asn_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vm_asn_neighbour_date
+    ON data.vm_asn_neighbour USING btree (an_date);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vm_connectivity_index_by_country_country_date
+    ON data.vm_connectivity_index_by_country USING btree (asn_country, date);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vm_connectivity_index_by_asn_top10_country_date
+    ON data.vm_connectivity_index_by_asn_top10 USING btree (asn_country, an_date);
+
+ANALYZE data.country_stat;
+ANALYZE data.asn_neighbour;
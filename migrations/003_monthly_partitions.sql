@@ -0,0 +1,566 @@
+-- Monthly range partitioning of data.asn_neighbour (by an_date) and
+-- data.country_stat (by cs_stats_timestamp).
+--
+-- Every table is rebuilt as a partitioned table with a default partition and
+-- one partition per month that holds data, named <table>_pYYYYMM. The loaders
+-- create the partitions of new months with data.ensure_monthly_partitions();
+-- old months are removed from the tables with data.detach_monthly_partitions().
+-- The primary keys now include the partition column.
+--
+-- The views reading these tables are recreated unchanged. The materialized
+-- views are recreated empty: run refersh_views.sql afterwards.
+--
+-- The tables are copied, so the database needs free space for one more copy
+-- of both, and loads must be stopped while this runs.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/003_monthly_partitions.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+SET ROLE ozi;
+
+--
+-- Name: detach_monthly_partitions(text, timestamp without time zone); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE OR REPLACE FUNCTION data.detach_monthly_partitions(p_table text, p_before timestamp without time zone) RETURNS SETOF text
+    LANGUAGE plpgsql
+    AS $_$
+-- Detach the monthly partitions of data.<p_table> that end on or before
+-- p_before. The detached tables are kept, to be archived and dropped.
+DECLARE
+    v_partition text;
+BEGIN
+    FOR v_partition IN
+        SELECT c.relname
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = format('data.%I', p_table)::regclass
+           AND c.relname ~ ('^' || p_table || '_p[0-9]{6}$')
+           AND to_date(right(c.relname, 6), 'YYYYMM') + interval '1 month' <= p_before
+         ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE data.%I DETACH PARTITION data.%I', p_table, v_partition);
+        RETURN NEXT v_partition;
+    END LOOP;
+END;
+$_$;
+
+
+ALTER FUNCTION data.detach_monthly_partitions(p_table text, p_before timestamp without time zone) OWNER TO ozi;
+
+--
+-- Name: ensure_monthly_partitions(text, timestamp without time zone, timestamp without time zone); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE OR REPLACE FUNCTION data.ensure_monthly_partitions(p_table text, p_from timestamp without time zone, p_to timestamp without time zone) RETURNS integer
+    LANGUAGE plpgsql
+    AS $_$
+-- Create the monthly partitions data.<p_table>_pYYYYMM covering p_from..p_to.
+-- Rows of those months already in the default partition are moved into the
+-- new partition. Returns the number of partitions created.
+DECLARE
+    v_month timestamp without time zone := date_trunc('month', p_from);
+    v_column text;
+    v_partition text;
+    v_created integer := 0;
+BEGIN
+    SELECT a.attname INTO v_column
+      FROM pg_partitioned_table p
+      JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+     WHERE p.partrelid = format('data.%I', p_table)::regclass;
+
+    WHILE v_month <= p_to LOOP
+        v_partition := p_table || '_p' || to_char(v_month, 'YYYYMM');
+        IF to_regclass(format('data.%I', v_partition)) IS NULL THEN
+            -- Concurrent loaders may need the same month
+            PERFORM pg_advisory_xact_lock(hashtext('data.' || p_table));
+        END IF;
+        IF to_regclass(format('data.%I', v_partition)) IS NULL THEN
+            EXECUTE format('CREATE TABLE data.%I (LIKE data.%I INCLUDING DEFAULTS)', v_partition, p_table);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM data.%I WHERE %I >= $1 AND %I < $2 RETURNING *) '
+                'INSERT INTO data.%I SELECT * FROM moved',
+                p_table || '_default', v_column, v_column, v_partition)
+                USING v_month, v_month + interval '1 month';
+            EXECUTE format(
+                'ALTER TABLE data.%I ATTACH PARTITION data.%I FOR VALUES FROM (%L) TO (%L)',
+                p_table, v_partition, v_month, v_month + interval '1 month');
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_month + interval '1 month';
+    END LOOP;
+    RETURN v_created;
+END;
+$_$;
+
+
+ALTER FUNCTION data.ensure_monthly_partitions(p_table text, p_from timestamp without time zone, p_to timestamp without time zone) OWNER TO ozi;
+
+
+--
+-- Views depending on the tables, recreated below
+--
+
+DROP MATERIALIZED VIEW data.vm_asn_neighbour,
+    data.vm_connectivity_index_by_asn_top10,
+    data.vm_connectivity_index_by_country;
+
+DROP VIEW data.v_neighbours_by_country,
+    data.v_data_overview,
+    data.v_country_stat_last,
+    data.v_country_stat_5m,
+    data.v_country_stat_1d,
+    data.v_connectivity_index_distinct,
+    data.v_connectivity_index_by_country,
+    data.v_connectivity_index_by_asn_top10,
+    data.v_connectivity_index_by_asn,
+    data.v_asn_with_neighbours,
+    data.v_asn_neighbour;
+
+--
+-- asn_neighbour
+--
+
+ALTER TABLE data.asn_neighbour RENAME TO asn_neighbour_unpartitioned;
+ALTER TABLE data.asn_neighbour_unpartitioned DROP CONSTRAINT asn_neighbour_pkey;
+ALTER TABLE data.asn_neighbour_unpartitioned DROP CONSTRAINT asn_neighbour_load_id_fkey;
+DROP INDEX data.uq_asn_neighbour_natural_key, data.idx_asn_neighbour_asn_date, data.idx_asn_neighbour_date;
+ALTER SEQUENCE data."asn_neighbour_an_id_seq" OWNED BY NONE;
+
+CREATE TABLE data.asn_neighbour (LIKE data.asn_neighbour_unpartitioned INCLUDING DEFAULTS)
+PARTITION BY RANGE (an_date);
+
+CREATE TABLE data.asn_neighbour_default PARTITION OF data.asn_neighbour DEFAULT;
+
+SELECT data.ensure_monthly_partitions('asn_neighbour', min(an_date), max(an_date))
+  FROM data.asn_neighbour_unpartitioned
+HAVING count(*) > 0;
+
+INSERT INTO data.asn_neighbour SELECT * FROM data.asn_neighbour_unpartitioned;
+
+DROP TABLE data.asn_neighbour_unpartitioned;
+
+ALTER SEQUENCE data."asn_neighbour_an_id_seq" OWNED BY data.asn_neighbour."an_id";
+
+ALTER TABLE data.asn_neighbour
+    ADD CONSTRAINT asn_neighbour_pkey PRIMARY KEY ("an_id", an_date);
+
+ALTER TABLE data.asn_neighbour
+    ADD CONSTRAINT asn_neighbour_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
+
+CREATE INDEX idx_asn_neighbour_asn_date ON data.asn_neighbour USING btree (an_asn, an_date);
+
+CREATE INDEX idx_asn_neighbour_date ON data.asn_neighbour USING btree (an_date, an_asn, an_neighbour) WHERE ((an_type)::text = ANY (ARRAY[('left'::character varying)::text, ('right'::character varying)::text]));
+
+CREATE INDEX idx_asn_neighbour_load_id ON data.asn_neighbour USING btree (load_id);
+
+CREATE UNIQUE INDEX uq_asn_neighbour_natural_key ON data.asn_neighbour USING btree (an_asn, an_neighbour, an_date, an_type) NULLS NOT DISTINCT;
+
+--
+-- country_stat
+--
+
+ALTER TABLE data.country_stat RENAME TO country_stat_unpartitioned;
+ALTER TABLE data.country_stat_unpartitioned DROP CONSTRAINT country_stat_pkey;
+ALTER TABLE data.country_stat_unpartitioned DROP CONSTRAINT country_stat_load_id_fkey;
+DROP INDEX data.uq_country_stat_natural_key, data.idx_country_stat_resolution_timestamp;
+ALTER SEQUENCE data.country_stat_cs_id_seq OWNED BY NONE;
+
+CREATE TABLE data.country_stat (LIKE data.country_stat_unpartitioned INCLUDING DEFAULTS)
+PARTITION BY RANGE (cs_stats_timestamp);
+
+CREATE TABLE data.country_stat_default PARTITION OF data.country_stat DEFAULT;
+
+SELECT data.ensure_monthly_partitions('country_stat', min(cs_stats_timestamp), max(cs_stats_timestamp))
+  FROM data.country_stat_unpartitioned
+HAVING count(*) > 0;
+
+INSERT INTO data.country_stat SELECT * FROM data.country_stat_unpartitioned;
+
+DROP TABLE data.country_stat_unpartitioned;
+
+ALTER SEQUENCE data.country_stat_cs_id_seq OWNED BY data.country_stat.cs_id;
+
+ALTER TABLE data.country_stat
+    ADD CONSTRAINT country_stat_pkey PRIMARY KEY (cs_id, cs_stats_timestamp);
+
+ALTER TABLE data.country_stat
+    ADD CONSTRAINT country_stat_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
+
+CREATE INDEX idx_country_stat_load_id ON data.country_stat USING btree (load_id);
+
+CREATE INDEX idx_country_stat_resolution_timestamp ON data.country_stat USING btree (cs_stats_resolution, cs_stats_timestamp);
+
+CREATE UNIQUE INDEX uq_country_stat_natural_key ON data.country_stat USING btree (cs_country_iso2, cs_stats_resolution, cs_stats_timestamp);
+
+CREATE TRIGGER trigger_set_timestamps_country_stat BEFORE INSERT OR UPDATE ON data.country_stat FOR EACH ROW EXECUTE FUNCTION data.set_timestamps();
+
+--
+-- Views
+--
+
+CREATE VIEW data.v_asn_neighbour AS
+ SELECT n.an_date,
+    n.an_asn,
+    a1.asn_country,
+    n.an_neighbour,
+    COALESCE(a2.asn_country, 'UNKNOWN'::character varying) AS neighbour_country,
+        CASE
+            WHEN ((a1.asn_country)::text <> (COALESCE(a2.asn_country, 'UNKNOWN'::character varying))::text) THEN true
+            ELSE false
+        END AS is_foreign_neighbour,
+    n.an_type,
+    n.an_power,
+    n.an_v4_peers,
+    n.an_v6_peers
+   FROM ((data.asn_neighbour n
+     LEFT JOIN data.vm_current_asn a1 ON ((a1.asn_id = n.an_asn)))
+     LEFT JOIN data.vm_current_asn a2 ON ((a2.asn_id = n.an_neighbour)))
+  WHERE ((n.an_type)::text = ANY (ARRAY[('left'::character varying)::text, ('right'::character varying)::text]));
+
+
+ALTER VIEW data.v_asn_neighbour OWNER TO ozi;
+
+CREATE VIEW data.v_asn_with_neighbours AS
+ WITH asn_with_neighbours AS (
+         SELECT asn.a_id,
+            asn.a_date,
+            asn.a_country_iso2,
+            (EXISTS ( SELECT 1
+                   FROM data.asn_neighbour
+                  WHERE ((asn_neighbour.an_asn = asn.a_id) AND (asn_neighbour.an_date = asn.a_date)))) AS has_neighbours
+           FROM data.asn
+        )
+ SELECT a_country_iso2,
+    a_date,
+    count(*) AS total_asns,
+    count(has_neighbours) AS asns_with_neighbours,
+    ((count(has_neighbours))::double precision / (count(*))::double precision) AS share_asns_with_neighbours
+   FROM asn_with_neighbours
+  GROUP BY a_country_iso2, a_date;
+
+
+ALTER VIEW data.v_asn_with_neighbours OWNER TO ozi;
+
+CREATE VIEW data.v_connectivity_index_by_asn AS
+ SELECT an_asn,
+    an_date,
+    asn_country,
+    sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS foreign_neighbour_count,
+    sum(
+        CASE
+            WHEN (NOT is_foreign_neighbour) THEN 1
+            ELSE 0
+        END) AS local_neighbour_count,
+    count(*) AS total_neighbour_count,
+    ((sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END))::double precision / (count(*))::double precision) AS foreign_neighbours_share
+   FROM data.v_asn_neighbour
+  WHERE (asn_country IS NOT NULL)
+  GROUP BY an_asn, an_date, asn_country;
+
+
+ALTER VIEW data.v_connectivity_index_by_asn OWNER TO ozi;
+
+CREATE VIEW data.v_connectivity_index_by_asn_top10 AS
+ SELECT an_asn,
+    an_date,
+    asn_country,
+    foreign_neighbour_count,
+    local_neighbour_count,
+    total_neighbour_count,
+    foreign_neighbours_share,
+    rn
+   FROM ( SELECT v_connectivity_index_by_asn.an_asn,
+            v_connectivity_index_by_asn.an_date,
+            v_connectivity_index_by_asn.asn_country,
+            v_connectivity_index_by_asn.foreign_neighbour_count,
+            v_connectivity_index_by_asn.local_neighbour_count,
+            v_connectivity_index_by_asn.total_neighbour_count,
+            v_connectivity_index_by_asn.foreign_neighbours_share,
+            row_number() OVER (PARTITION BY v_connectivity_index_by_asn.asn_country, v_connectivity_index_by_asn.an_date ORDER BY v_connectivity_index_by_asn.total_neighbour_count DESC) AS rn
+           FROM data.v_connectivity_index_by_asn) sub
+  WHERE (rn <= 10);
+
+
+ALTER VIEW data.v_connectivity_index_by_asn_top10 OWNER TO ozi;
+
+CREATE VIEW data.v_connectivity_index_by_country AS
+ SELECT asn_country,
+    an_date AS date,
+    count(DISTINCT an_asn) AS asn_count,
+    sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS foreign_neighbour_count,
+    sum(
+        CASE
+            WHEN (NOT is_foreign_neighbour) THEN 1
+            ELSE 0
+        END) AS local_neighbour_count,
+    count(*) AS total_neighbour_count,
+    ((sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END))::double precision / (count(*))::double precision) AS foreign_neighbours_share
+   FROM data.v_asn_neighbour
+  WHERE (asn_country IS NOT NULL)
+  GROUP BY asn_country, an_date;
+
+
+ALTER VIEW data.v_connectivity_index_by_country OWNER TO ozi;
+
+CREATE VIEW data.v_connectivity_index_distinct AS
+ SELECT asn_country,
+    an_date AS date,
+    count(DISTINCT an_asn) AS asn_count,
+    sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS foreign_neighbour_count,
+    sum(
+        CASE
+            WHEN NOT is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS local_neighbour_count,
+    count(*) AS total_neighbour_count,
+    round(sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END)::double precision / NULLIF(count(*), 0)::double precision * 100::double precision) AS foreign_share_pct
+   FROM ( SELECT DISTINCT v_asn_neighbour.an_asn,
+            v_asn_neighbour.an_neighbour,
+            v_asn_neighbour.an_date,
+            v_asn_neighbour.asn_country,
+            v_asn_neighbour.is_foreign_neighbour
+           FROM data.v_asn_neighbour) deduplicated
+  GROUP BY asn_country, an_date;
+
+
+ALTER VIEW data.v_connectivity_index_distinct OWNER TO ozi;
+
+CREATE VIEW data.v_country_stat_1d AS
+ SELECT country_stat.created,
+    country_stat.updated,
+    country_stat.cs_id,
+    country_stat.cs_country_iso2,
+    country_stat.cs_stats_timestamp,
+    country_stat.cs_stats_resolution,
+    country_stat.cs_v4_prefixes_ris,
+    country_stat.cs_v6_prefixes_ris,
+    country_stat.cs_asns_ris,
+    country_stat.cs_v4_prefixes_stats,
+    country_stat.cs_v6_prefixes_stats,
+    country_stat.cs_asns_stats,
+    country.c_name
+   FROM (data.country_stat
+     JOIN data.country ON (((country.c_iso2)::text = (country_stat.cs_country_iso2)::text)))
+  WHERE ((country_stat.cs_stats_resolution)::text = '1d'::text);
+
+
+ALTER VIEW data.v_country_stat_1d OWNER TO ozi;
+
+CREATE VIEW data.v_country_stat_5m AS
+ SELECT country_stat.created,
+    country_stat.updated,
+    country_stat.cs_id,
+    country_stat.cs_country_iso2,
+    country_stat.cs_stats_timestamp,
+    country_stat.cs_stats_resolution,
+    country_stat.cs_v4_prefixes_ris,
+    country_stat.cs_v6_prefixes_ris,
+    country_stat.cs_asns_ris,
+    country_stat.cs_v4_prefixes_stats,
+    country_stat.cs_v6_prefixes_stats,
+    country_stat.cs_asns_stats,
+    country.c_name
+   FROM (data.country_stat
+     JOIN data.country ON (((country.c_iso2)::text = (country_stat.cs_country_iso2)::text)))
+  WHERE ((country_stat.cs_stats_resolution)::text = '5m'::text);
+
+
+ALTER VIEW data.v_country_stat_5m OWNER TO ozi;
+
+CREATE VIEW data.v_country_stat_last AS
+ WITH last_dates AS (
+         SELECT country_stat_1.cs_country_iso2 AS country,
+            max(country_stat_1.cs_stats_timestamp) AS last_date
+           FROM data.country_stat country_stat_1
+          WHERE ((country_stat_1.cs_stats_resolution)::text = '1d'::text)
+          GROUP BY country_stat_1.cs_country_iso2
+        )
+ SELECT country.c_name,
+    country_stat.created,
+    country_stat.updated,
+    country_stat.cs_id,
+    country_stat.cs_country_iso2,
+    country_stat.cs_stats_timestamp,
+    country_stat.cs_stats_resolution,
+    country_stat.cs_v4_prefixes_ris,
+    country_stat.cs_v6_prefixes_ris,
+    country_stat.cs_asns_ris,
+    country_stat.cs_v4_prefixes_stats,
+    country_stat.cs_v6_prefixes_stats,
+    country_stat.cs_asns_stats
+   FROM ((data.country_stat
+     JOIN last_dates ON (((last_dates.last_date = country_stat.cs_stats_timestamp) AND ((last_dates.country)::text = (country_stat.cs_country_iso2)::text))))
+     JOIN data.country ON (((country.c_iso2)::text = (country_stat.cs_country_iso2)::text)))
+  WHERE ((country_stat.cs_stats_resolution)::text = '1d'::text);
+
+
+ALTER VIEW data.v_country_stat_last OWNER TO ozi;
+
+CREATE VIEW data.v_data_overview AS
+ WITH date_range AS (
+         SELECT date_trunc('day'::text, min(asn.a_date)) AS start_date,
+            date_trunc('day'::text, max(asn.a_date)) AS end_date
+           FROM data.asn
+        ), dates AS (
+         SELECT generate_series(date_range.start_date, date_range.end_date, '1 day'::interval) AS date
+           FROM date_range
+        ), countries AS (
+         SELECT DISTINCT asn.a_country_iso2 AS country_iso2
+           FROM data.asn
+        )
+ SELECT d.date,
+    c.country_iso2,
+        CASE
+            WHEN (a.cnt > 0) THEN true
+            ELSE false
+        END AS has_asn_records,
+        CASE
+            WHEN (n.cnt > 0) THEN true
+            ELSE false
+        END AS has_neighbour_records,
+        CASE
+            WHEN (q.cnt > 0) THEN true
+            ELSE false
+        END AS has_quality_records,
+        CASE
+            WHEN (cs.cnt > 0) THEN true
+            ELSE false
+        END AS has_country_stat_records,
+        CASE
+            WHEN (ct.cnt > 0) THEN true
+            ELSE false
+        END AS has_country_traffic_records
+   FROM ((((((dates d
+     CROSS JOIN countries c)
+     LEFT JOIN ( SELECT asn.a_date,
+            count(*) AS cnt
+           FROM data.asn
+          GROUP BY asn.a_date) a ON ((d.date = a.a_date)))
+     LEFT JOIN ( SELECT asn_neighbour.an_date,
+            count(*) AS cnt
+           FROM data.asn_neighbour
+          GROUP BY asn_neighbour.an_date) n ON ((d.date = n.an_date)))
+     LEFT JOIN ( SELECT country_internet_quality.ci_date,
+            country_internet_quality.ci_country_iso2,
+            count(*) AS cnt
+           FROM data.country_internet_quality
+          GROUP BY country_internet_quality.ci_date, country_internet_quality.ci_country_iso2) q ON (((d.date = q.ci_date) AND ((c.country_iso2)::text = (q.ci_country_iso2)::text))))
+     LEFT JOIN ( SELECT (country_stat.cs_stats_timestamp)::date AS cs_stats_timestamp,
+            country_stat.cs_country_iso2,
+            count(*) AS cnt
+           FROM data.country_stat
+          GROUP BY ((country_stat.cs_stats_timestamp)::date), country_stat.cs_country_iso2) cs ON (((d.date = cs.cs_stats_timestamp) AND ((c.country_iso2)::text = (cs.cs_country_iso2)::text))))
+     LEFT JOIN ( SELECT country_traffic.cr_date,
+            country_traffic.cr_country_iso2,
+            count(*) AS cnt
+           FROM data.country_traffic
+          GROUP BY country_traffic.cr_date, country_traffic.cr_country_iso2) ct ON (((d.date = ct.cr_date) AND ((c.country_iso2)::text = (ct.cr_country_iso2)::text))))
+  ORDER BY d.date, c.country_iso2;
+
+
+ALTER VIEW data.v_data_overview OWNER TO ozi;
+
+CREATE VIEW data.v_neighbours_by_country AS
+ SELECT asn_country,
+    neighbour_country,
+    count(*) AS neighbours_count
+   FROM data.v_asn_neighbour
+  GROUP BY asn_country, neighbour_country;
+
+
+ALTER VIEW data.v_neighbours_by_country OWNER TO ozi;
+
+CREATE MATERIALIZED VIEW data.vm_asn_neighbour AS
+ SELECT an_date,
+    an_asn,
+    asn_country,
+    an_neighbour,
+    neighbour_country,
+    is_foreign_neighbour,
+    an_type,
+    an_power,
+    an_v4_peers,
+    an_v6_peers
+   FROM data.v_asn_neighbour
+  WITH NO DATA;
+
+
+ALTER MATERIALIZED VIEW data.vm_asn_neighbour OWNER TO ozi;
+
+CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10 AS
+ SELECT an_asn,
+    an_date,
+    asn_country,
+    foreign_neighbour_count,
+    local_neighbour_count,
+    total_neighbour_count,
+    foreign_neighbours_share,
+    rn
+   FROM data.v_connectivity_index_by_asn_top10
+  WITH NO DATA;
+
+
+ALTER MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10 OWNER TO ozi;
+
+CREATE MATERIALIZED VIEW data.vm_connectivity_index_by_country AS
+ SELECT asn_country,
+    date,
+    asn_count,
+    foreign_neighbour_count,
+    local_neighbour_count,
+    total_neighbour_count,
+    foreign_neighbours_share
+   FROM data.v_connectivity_index_by_country
+  WITH NO DATA;
+
+
+ALTER MATERIALIZED VIEW data.vm_connectivity_index_by_country OWNER TO ozi;
+
+CREATE INDEX idx_vm_asn_neighbour_date ON data.vm_asn_neighbour USING btree (an_date);
+
+CREATE INDEX idx_vm_connectivity_index_by_asn_top10_country_date ON data.vm_connectivity_index_by_asn_top10 USING btree (asn_country, an_date);
+
+CREATE INDEX idx_vm_connectivity_index_by_country_country_date ON data.vm_connectivity_index_by_country USING btree (asn_country, date);
+
+GRANT SELECT ON TABLE data.country_stat TO looker_user;
+GRANT SELECT ON TABLE data.v_connectivity_index_by_asn TO looker_user;
+GRANT SELECT ON TABLE data.v_connectivity_index_by_asn_top10 TO looker_user;
+GRANT SELECT ON TABLE data.v_country_stat_1d TO looker_user;
+GRANT SELECT ON TABLE data.v_country_stat_5m TO looker_user;
+GRANT SELECT ON TABLE data.v_country_stat_last TO looker_user;
+GRANT ALL ON TABLE data.vm_connectivity_index_by_country TO looker_user;
+
+RESET ROLE;
+
+COMMIT;
+
+ANALYZE data.asn_neighbour;
+ANALYZE data.country_stat;
@@ -0,0 +1,213 @@
+-- Connectivity summary tables maintained incrementally by the ETL.
+--
+-- data.connectivity_index_by_country and data.connectivity_index_by_asn_top10
+-- hold the rows of v_connectivity_index_by_country / _by_asn_top10. After
+-- loading ASN neighbours the ETL recomputes them for the loaded country and
+-- dates only, with data.refresh_connectivity_summary(country, dates).
+-- The summaries take the country of the ASNs from vm_current_asn: after
+-- loading ASNs the ETL calls data.refresh_current_asn(asns), which refreshes
+-- vm_current_asn when one of them is new or changed country and recomputes
+-- the dates on which they have neighbours. Both functions take the same
+-- advisory lock, so that concurrent refreshes do not collide.
+--
+-- The materialized views vm_connectivity_index_by_country and
+-- vm_connectivity_index_by_asn_top10 are replaced by plain views of the
+-- summary tables with the same name, so that existing queries keep working.
+-- vm_asn_neighbour stays materialized and refreshed by refersh_views.sql.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/004_connectivity_summary.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+SET ROLE ozi;
+
+--
+-- Name: connectivity_index_by_asn_top10; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.connectivity_index_by_asn_top10 (
+    an_asn bigint NOT NULL,
+    an_date timestamp without time zone NOT NULL,
+    asn_country character varying(2) NOT NULL,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_neighbours_share double precision,
+    rn bigint
+);
+
+
+ALTER TABLE data.connectivity_index_by_asn_top10 OWNER TO ozi;
+
+--
+-- Name: connectivity_index_by_country; Type: TABLE; Schema: data; Owner: ozi
+--
+
+CREATE TABLE data.connectivity_index_by_country (
+    asn_country character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    asn_count bigint,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_neighbours_share double precision
+);
+
+
+ALTER TABLE data.connectivity_index_by_country OWNER TO ozi;
+
+--
+-- Name: connectivity_index_by_asn_top10 connectivity_index_by_asn_top10_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.connectivity_index_by_asn_top10
+    ADD CONSTRAINT connectivity_index_by_asn_top10_pkey PRIMARY KEY (asn_country, an_date, an_asn);
+
+
+--
+-- Name: connectivity_index_by_country connectivity_index_by_country_pkey; Type: CONSTRAINT; Schema: data; Owner: ozi
+--
+
+ALTER TABLE ONLY data.connectivity_index_by_country
+    ADD CONSTRAINT connectivity_index_by_country_pkey PRIMARY KEY (asn_country, date);
+
+
+--
+-- Name: refresh_connectivity_summary(character varying, timestamp without time zone[]); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.refresh_connectivity_summary(p_country character varying DEFAULT NULL::character varying, p_dates timestamp without time zone[] DEFAULT NULL::timestamp without time zone[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $_$
+-- Recompute the connectivity summary tables for the ASNs of p_country and
+-- the dates p_dates. NULL stands for all countries / all dates.
+DECLARE
+    v_filter text := 'TRUE';
+BEGIN
+    -- One refresh at a time, the ETL workers and refersh_views.sql delete and
+    -- insert the same rows
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF p_country IS NOT NULL THEN
+        v_filter := v_filter || ' AND asn_country = $1';
+    END IF;
+    IF p_dates IS NOT NULL THEN
+        v_filter := v_filter || ' AND %I = ANY ($2)';
+    END IF;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_country '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share '
+        'FROM data.v_connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_asn_top10 '
+        'SELECT an_asn, an_date, asn_country, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share, rn '
+        'FROM data.v_connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+END;
+$_$;
+
+
+ALTER FUNCTION data.refresh_connectivity_summary(p_country character varying, p_dates timestamp without time zone[]) OWNER TO ozi;
+
+--
+-- Name: refresh_current_asn(integer[]); Type: FUNCTION; Schema: data; Owner: ozi
+--
+
+CREATE FUNCTION data.refresh_current_asn(p_asns integer[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+-- Refresh vm_current_asn after loading the ASNs p_asns if the country of one
+-- of them changed or is new, and recompute the connectivity summaries of the
+-- dates on which the changed ASNs have neighbours.
+DECLARE
+    v_changed integer[];
+    v_dates timestamp without time zone[];
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF (SELECT ispopulated FROM pg_matviews
+         WHERE schemaname = 'data' AND matviewname = 'vm_current_asn') THEN
+        SELECT array_agg(c.asn_id) INTO v_changed
+          FROM (SELECT DISTINCT ON (a_ripe_id) a_ripe_id AS asn_id, a_country_iso2 AS asn_country
+                  FROM data.asn
+                 WHERE a_ripe_id = ANY (p_asns)
+                 ORDER BY a_ripe_id, a_date DESC) c
+          LEFT JOIN data.vm_current_asn m ON m.asn_id = c.asn_id
+         WHERE m.asn_country IS DISTINCT FROM c.asn_country;
+        IF v_changed IS NULL THEN
+            RETURN;
+        END IF;
+        REFRESH MATERIALIZED VIEW CONCURRENTLY data.vm_current_asn;
+    ELSE
+        v_changed := p_asns;
+        REFRESH MATERIALIZED VIEW data.vm_current_asn;
+    END IF;
+
+    SELECT array_agg(DISTINCT an_date) INTO v_dates
+      FROM data.asn_neighbour
+     WHERE an_asn = ANY (v_changed) OR an_neighbour = ANY (v_changed);
+    IF v_dates IS NOT NULL THEN
+        PERFORM data.refresh_connectivity_summary(NULL, v_dates);
+    END IF;
+END;
+$$;
+
+
+ALTER FUNCTION data.refresh_current_asn(p_asns integer[]) OWNER TO ozi;
+
+DROP MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10,
+    data.vm_connectivity_index_by_country;
+
+--
+-- Name: vm_connectivity_index_by_asn_top10; Type: VIEW; Schema: data; Owner: ozi
+--
+
+CREATE VIEW data.vm_connectivity_index_by_asn_top10 AS
+ SELECT an_asn,
+    an_date,
+    asn_country,
+    foreign_neighbour_count,
+    local_neighbour_count,
+    total_neighbour_count,
+    foreign_neighbours_share,
+    rn
+   FROM data.connectivity_index_by_asn_top10;
+
+
+ALTER VIEW data.vm_connectivity_index_by_asn_top10 OWNER TO ozi;
+
+--
+-- Name: vm_connectivity_index_by_country; Type: VIEW; Schema: data; Owner: ozi
+--
+
+CREATE VIEW data.vm_connectivity_index_by_country AS
+ SELECT asn_country,
+    date,
+    asn_count,
+    foreign_neighbour_count,
+    local_neighbour_count,
+    total_neighbour_count,
+    foreign_neighbours_share
+   FROM data.connectivity_index_by_country;
+
+
+ALTER VIEW data.vm_connectivity_index_by_country OWNER TO ozi;
+
+GRANT ALL ON TABLE data.vm_connectivity_index_by_country TO looker_user;
+
+REFRESH MATERIALIZED VIEW data.vm_current_asn;
+
+SELECT data.refresh_connectivity_summary();
+
+RESET ROLE;
+
+COMMIT;
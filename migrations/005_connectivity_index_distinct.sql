@@ -0,0 +1,115 @@
+-- Persisted data.connectivity_index_distinct: the rows of
+-- v_connectivity_index_distinct, read by the dashboard instead of the view.
+-- data.refresh_connectivity_summary() maintains it together with the other
+-- connectivity summaries. The view skips the neighbours of ASNs without a
+-- country (missing from vm_current_asn), like the other connectivity views,
+-- since connectivity_index_distinct.asn_country is NOT NULL.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/005_connectivity_index_distinct.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+SET ROLE ozi;
+
+CREATE TABLE data.connectivity_index_distinct (
+    asn_country character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    asn_count bigint,
+    foreign_neighbour_count bigint,
+    local_neighbour_count bigint,
+    total_neighbour_count bigint,
+    foreign_share_pct double precision
+);
+
+ALTER TABLE ONLY data.connectivity_index_distinct
+    ADD CONSTRAINT connectivity_index_distinct_pkey PRIMARY KEY (asn_country, date);
+
+CREATE INDEX idx_connectivity_index_distinct_date ON data.connectivity_index_distinct USING btree (date);
+
+CREATE OR REPLACE FUNCTION data.refresh_connectivity_summary(p_country character varying DEFAULT NULL::character varying, p_dates timestamp without time zone[] DEFAULT NULL::timestamp without time zone[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $_$
+-- Recompute the connectivity summary tables for the ASNs of p_country and
+-- the dates p_dates. NULL stands for all countries / all dates.
+DECLARE
+    v_filter text := 'TRUE';
+BEGIN
+    -- One refresh at a time, the ETL workers and refersh_views.sql delete and
+    -- insert the same rows
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF p_country IS NOT NULL THEN
+        v_filter := v_filter || ' AND asn_country = $1';
+    END IF;
+    IF p_dates IS NOT NULL THEN
+        v_filter := v_filter || ' AND %I = ANY ($2)';
+    END IF;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_country '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share '
+        'FROM data.v_connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_distinct '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_share_pct '
+        'FROM data.v_connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_asn_top10 '
+        'SELECT an_asn, an_date, asn_country, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share, rn '
+        'FROM data.v_connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+END;
+$_$;
+
+-- ASNs missing from vm_current_asn have no country, see migration 008
+CREATE OR REPLACE VIEW data.v_connectivity_index_distinct AS
+ SELECT asn_country,
+    an_date AS date,
+    count(DISTINCT an_asn) AS asn_count,
+    sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS foreign_neighbour_count,
+    sum(
+        CASE
+            WHEN NOT is_foreign_neighbour THEN 1
+            ELSE 0
+        END) AS local_neighbour_count,
+    count(*) AS total_neighbour_count,
+    round(sum(
+        CASE
+            WHEN is_foreign_neighbour THEN 1
+            ELSE 0
+        END)::double precision / NULLIF(count(*), 0)::double precision * 100::double precision) AS foreign_share_pct
+   FROM ( SELECT DISTINCT v_asn_neighbour.an_asn,
+            v_asn_neighbour.an_neighbour,
+            v_asn_neighbour.an_date,
+            v_asn_neighbour.asn_country,
+            v_asn_neighbour.is_foreign_neighbour
+           FROM data.v_asn_neighbour
+          WHERE (v_asn_neighbour.asn_country IS NOT NULL)) deduplicated
+  GROUP BY asn_country, an_date;
+
+INSERT INTO data.connectivity_index_distinct
+SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count,
+       total_neighbour_count, foreign_share_pct
+  FROM data.v_connectivity_index_distinct;
+
+RESET ROLE;
+
+COMMIT;
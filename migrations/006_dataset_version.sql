@@ -0,0 +1,95 @@
+-- data.dataset_version: one version number per (dataset, country), bumped by
+-- data.bump_dataset_version() in the transaction that loads new rows. The
+-- dashboard keys its figure cache on it, so figures are rebuilt after an ETL
+-- load instead of after a fixed time.
+--
+-- Bumped for 'country_stat' by the ETL loaders and for
+-- 'connectivity_index_distinct' by data.refresh_connectivity_summary().
+--
+-- Apply with: psql -d ozi_db2 -f migrations/006_dataset_version.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+SET ROLE ozi;
+
+CREATE TABLE data.dataset_version (
+    dataset character varying(64) NOT NULL,
+    country_iso2 character varying(2) NOT NULL,
+    version bigint NOT NULL,
+    updated timestamp without time zone NOT NULL
+);
+
+ALTER TABLE ONLY data.dataset_version
+    ADD CONSTRAINT dataset_version_pkey PRIMARY KEY (dataset, country_iso2);
+
+CREATE FUNCTION data.bump_dataset_version(p_dataset character varying, p_countries character varying[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+-- Mark the data of p_countries in p_dataset as changed, so that caches of
+-- the dashboard built from it are rebuilt. Called in the loading transaction.
+BEGIN
+    INSERT INTO data.dataset_version (dataset, country_iso2, version, updated)
+    SELECT DISTINCT p_dataset, country, 1, CURRENT_TIMESTAMP
+      FROM unnest(p_countries) AS country
+    ON CONFLICT (dataset, country_iso2)
+    DO UPDATE SET version = dataset_version.version + 1, updated = EXCLUDED.updated;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION data.refresh_connectivity_summary(p_country character varying DEFAULT NULL::character varying, p_dates timestamp without time zone[] DEFAULT NULL::timestamp without time zone[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $_$
+-- Recompute the connectivity summary tables for the ASNs of p_country and
+-- the dates p_dates. NULL stands for all countries / all dates.
+DECLARE
+    v_filter text := 'TRUE';
+BEGIN
+    -- One refresh at a time, the ETL workers and refersh_views.sql delete and
+    -- insert the same rows
+    PERFORM pg_advisory_xact_lock(hashtext('data.connectivity_summary'));
+    IF p_country IS NOT NULL THEN
+        v_filter := v_filter || ' AND asn_country = $1';
+    END IF;
+    IF p_dates IS NOT NULL THEN
+        v_filter := v_filter || ' AND %I = ANY ($2)';
+    END IF;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_country '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share '
+        'FROM data.v_connectivity_index_by_country WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_distinct '
+        'SELECT asn_country, date, asn_count, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_share_pct '
+        'FROM data.v_connectivity_index_distinct WHERE ' || v_filter, 'date')
+        USING p_country, p_dates;
+
+    EXECUTE format('DELETE FROM data.connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+    EXECUTE format(
+        'INSERT INTO data.connectivity_index_by_asn_top10 '
+        'SELECT an_asn, an_date, asn_country, foreign_neighbour_count, local_neighbour_count, '
+        'total_neighbour_count, foreign_neighbours_share, rn '
+        'FROM data.v_connectivity_index_by_asn_top10 WHERE ' || v_filter, 'an_date')
+        USING p_country, p_dates;
+
+    PERFORM data.bump_dataset_version('connectivity_index_distinct',
+        CASE WHEN p_country IS NULL
+             THEN ARRAY(SELECT DISTINCT asn_country FROM data.connectivity_index_distinct)
+             ELSE ARRAY[p_country] END);
+END;
+$_$;
+
+RESET ROLE;
+
+COMMIT;
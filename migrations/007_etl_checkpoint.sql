@@ -0,0 +1,29 @@
+-- data.etl_checkpoint: the (task, country, date) units completed by the ETL,
+-- with the data.etl_load run that loaded them. main.py --resume skips the
+-- units recorded here.
+--
+-- Apply with: psql -d ozi_db2 -f migrations/007_etl_checkpoint.sql
+
+\connect ozi_db2
+
+BEGIN;
+
+SET ROLE ozi;
+
+CREATE TABLE data.etl_checkpoint (
+    task character varying(32) NOT NULL,
+    country_iso2 character varying(2) NOT NULL,
+    date timestamp without time zone NOT NULL,
+    load_id integer NOT NULL,
+    completed timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+ALTER TABLE ONLY data.etl_checkpoint
+    ADD CONSTRAINT etl_checkpoint_pkey PRIMARY KEY (task, country_iso2, date);
+
+ALTER TABLE ONLY data.etl_checkpoint
+    ADD CONSTRAINT etl_checkpoint_load_id_fkey FOREIGN KEY (load_id) REFERENCES data.etl_load(load_id);
+
+RESET ROLE;
+
+COMMIT;
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory used by the cached results of one worker process
+CACHE_MAX_BYTES = int(os.environ.get("DASH_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Directory shared by all workers, e.g. a tmpfs. Unset keeps the cache per process
+CACHE_DIR = os.environ.get("DASH_CACHE_DIR") or None
+CACHE_DIR_MAX_BYTES = int(os.environ.get("DASH_CACHE_DIR_MAX_MB", "512")) * 1024 * 1024
+
+# Seconds an entry is served before it is loaded again, per class of entry
+TTL_SECONDS = {
+    # Series of one country, refreshed by the 5 minute interval of the pages
+    "series": int(os.environ.get("DASH_CACHE_TTL_SERIES", "300")),
+    # Country lists and names, date ranges of the pickers
+    "lookup": int(os.environ.get("DASH_CACHE_TTL_LOOKUP", "600")),
+    # Versions of data.dataset_version: how long a new ETL load may go unnoticed
+    "version": int(os.environ.get("DASH_CACHE_TTL_VERSION", "60")),
+    # Figures are keyed by the version of their data, the TTL only frees memory
+    "figure": int(os.environ.get("DASH_CACHE_TTL_FIGURE", "86400")),
+}
+# Seconds between two clean-ups of the shared directory
+SWEEP_INTERVAL = 60
+
+
+def sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class QueryCache:
+    """
+    Cache of query results keyed by (entry class, query, parameters).
+
+    Every process keeps the most recently used results in memory, up to
+    max_bytes. With a directory, results are also written there as pickles, so
+    that a result loaded by one gunicorn worker is served to the others without
+    querying the database. The directory must only be writable by the app.
+
+    Loads of the same key are serialized within a process, so many users
+    opening the same country trigger a single query per worker.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR, ttl=TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires, size, value)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.key_locks = {}  # key -> [lock, threads holding or waiting for it]
+        self.last_sweep = 0.0
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0}
+
+    def get_or_load(self, entry_class, key, load):
+        """
+        Return the result cached under key, or call load() and cache its
+        result for the TTL of entry_class. A result of None is not cached.
+        Callers must not modify the returned object, it is shared.
+        """
+        key = (entry_class,) + tuple(key)
+        value = self._get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                # Another thread may have loaded it while we were waiting
+                value = self._get(key)
+                if value is not None:
+                    return value
+
+                value = self._get_shared(key)
+                if value is not None:
+                    self._count("shared_hits")
+                else:
+                    self._count("misses")
+                    value = load()
+                    if value is None:
+                        return None
+                    self._put_shared(key, value)
+                self._put(key, value)
+                return value
+        finally:
+            # Only dropped by the last thread, a thread arriving while others
+            # wait must queue on the same lock
+            with self.lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self.key_locks[key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["shared_hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                entries=len(self.entries),
+                bytes=self.size,
+                max_bytes=self.max_bytes,
+                hit_rate=round((lookups - self.counters["misses"]) / lookups, 3) if lookups else None,
+            )
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires < time.time():
+                del self.entries[key]
+                self.size -= size
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def _put(self, key, value):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (time.time() + self.ttl[key[0]], size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.counters["evictions"] += 1
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pickle")
+
+    def _get_shared(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires, stored_key, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            print(f"Ignoring unreadable cache file {path}: {e}")
+            return None
+        if stored_key != key or expires < time.time():
+            return None
+        return value
+
+    def _put_shared(self, key, value):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    (time.time() + self.ttl[key[0]], key, value),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, path)
+            self._sweep()
+        except OSError as e:
+            # The shared cache is an optimisation, the result is still served
+            print(f"Could not write cache file for {key}: {e}")
+
+    def _sweep(self):
+        # Drop files of expired entries and, beyond the size bound, the oldest
+        now = time.time()
+        if now - self.last_sweep < SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        max_ttl = max(self.ttl.values())
+        files = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if stat.st_mtime + max_ttl < now:
+                    os.remove(entry.path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                pass  # removed by another worker
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= CACHE_DIR_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+QUERY_CACHE = QueryCache()
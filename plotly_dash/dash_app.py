@@ -1,129 +1,20 @@
 import os
 import dash
+import flask
 from dash import html, dcc, Input, Output, State
-import plotly.express as px
-import sqlalchemy
 import pandas as pd
-from datetime import datetime
-
-# Global variables for caching
-last_data_fetch_time = None
-cached_df = None
-last_connectivity_fetch_time = None
-cached_connectivity_df = None
-last_date_range_fetch_time = {}  # Cache per source_type
-cached_date_ranges = {}  # Cache per source_type
-country_names_ru = {}
-country_names_en = {}
-CACHE_TTL_SECONDS = 300  # Cache will be considered stale after 5 minutes (was 60)
-DATE_RANGE_CACHE_TTL = 600  # Date ranges cache for 10 minutes
-
-
-def fetch_data(start_date=None, end_date=None):
-    global last_data_fetch_time, cached_df, country_names_ru, country_names_en
-
-    # Check if cached data is still fresh
-    if (
-        cached_df is not None
-        and last_data_fetch_time is not None
-        and (datetime.now() - last_data_fetch_time).total_seconds() < CACHE_TTL_SECONDS
-    ):
-        print("Serving data from cache.")
-        df = cached_df
-    else:
-        print("Fetching new data from database...")
-        db_url = (
-            f"postgresql://{os.environ.get('POSTGRES_OZI_USER', 'user')}:"
-            f"{os.environ.get('POSTGRES_OZI_PASSWORD', 'password')}"
-            f"@{os.environ.get('DASH_DB_HOST', 'localhost')}:"
-            f"{os.environ.get('DASH_DB_PORT', '5432')}/"
-            f"{os.environ.get('DASH_DB_NAME', 'exampledb')}"
-        )
-        engine = sqlalchemy.create_engine(db_url)
-
-        # Fetch country statistics data
-        query_stats = """SELECT
-                    cs_country_iso2,
-                    cs_stats_timestamp,
-                    cs_asns_ris,
-                    cs_asns_stats
-                 FROM data.country_stat
-                 ORDER BY cs_stats_timestamp;"""
-        df = pd.read_sql(query_stats, engine)
-
-        # Fetch country names in Russian and English
-        query_countries = "SELECT c_iso2, c_name_ru, c_name FROM data.country;"
-        df_countries = pd.read_sql(query_countries, engine)
-        engine.dispose()
-
-        # Populate country_names_ru and country_names_en dictionaries
-        country_names_ru = {
-            row["c_iso2"]: row["c_name_ru"] for index, row in df_countries.iterrows()
-        }
-        country_names_en = {
-            row["c_iso2"]: row["c_name"] for index, row in df_countries.iterrows()
-        }
-
-        # Update cache and timestamp
-        cached_df = df
-        last_data_fetch_time = datetime.now()
-
-        print(f"Fetched {len(df)} records from database")
-
-    # Filter by date if provided
-    if start_date and end_date:
-        mask = (df["cs_stats_timestamp"] >= start_date) & (df["cs_stats_timestamp"] <= end_date)
-        return df.loc[mask]
-    
-    return df
-
-
-def fetch_connectivity_data(start_date=None, end_date=None):
-    global last_connectivity_fetch_time, cached_connectivity_df
-
-    # Check if cached data is still fresh
-    if (
-        cached_connectivity_df is not None
-        and last_connectivity_fetch_time is not None
-        and (datetime.now() - last_connectivity_fetch_time).total_seconds() < CACHE_TTL_SECONDS
-    ):
-        print("Serving connectivity data from cache.")
-        df = cached_connectivity_df
-    else:
-        print("Fetching connectivity data from database...")
-        db_url = (
-            f"postgresql://{os.environ.get('POSTGRES_OZI_USER', 'user')}:"
-            f"{os.environ.get('POSTGRES_OZI_PASSWORD', 'password')}"
-            f"@{os.environ.get('DASH_DB_HOST', 'localhost')}:"
-            f"{os.environ.get('DASH_DB_PORT', '5432')}/"
-            f"{os.environ.get('DASH_DB_NAME', 'exampledb')}"
-        )
-        engine = sqlalchemy.create_engine(db_url)
-
-        query = """SELECT 
-                    asn_country,
-                    date,
-                    asn_count,
-                    foreign_neighbour_count,
-                    local_neighbour_count,
-                    total_neighbour_count,
-                    foreign_share_pct
-                 FROM data.v_connectivity_index_distinct
-                 ORDER BY date;"""
-        df = pd.read_sql(query, engine)
-        engine.dispose()
-
-        # Update cache and timestamp
-        cached_connectivity_df = df
-        last_connectivity_fetch_time = datetime.now()
-
-    # Filter by date if provided
-    if start_date and end_date:
-        mask = (df["date"] >= start_date) & (df["date"] <= end_date)
-        return df.loc[mask]
-
-    return df
-
+from sqlalchemy import text
+from cache import QUERY_CACHE
+from db import get_engine
+from figures import get_figure
+from queries import (
+    STATS_RESOLUTION,
+    fetch_connectivity_countries,
+    fetch_country_names,
+    fetch_stats_countries,
+    resolution_filter,
+)
+from datetime import datetime, timedelta
 
 app = dash.Dash(__name__)
 app.suppress_callback_exceptions = True
@@ -173,6 +64,12 @@ app.index_string = '''
 </html>
 '''
 
+@app.server.route("/cache-stats")
+def cache_stats():
+    # Counters of this worker process only
+    return flask.jsonify(QUERY_CACHE.stats())
+
+
 @app.server.after_request
 def add_security_headers(response):
     response.headers["X-Frame-Options"] = "ALLOW-FROM https://ozi-ru.net"
@@ -215,42 +112,25 @@ def get_available_date_range(source_type='combined'):
     Args:
         source_type: 'stats', 'connectivity', or 'combined' (default)
     """
-    global last_date_range_fetch_time, cached_date_ranges
-    
-    # Check cache first
-    cache_key = source_type
-    if (
-        cache_key in cached_date_ranges
-        and cache_key in last_date_range_fetch_time
-        and (datetime.now() - last_date_range_fetch_time[cache_key]).total_seconds() < DATE_RANGE_CACHE_TTL
-    ):
-        print(f"Serving date range for {source_type} from cache")
-        return cached_date_ranges[cache_key]
-    
-    try:
-        db_url = (
-            f"postgresql://{os.environ.get('POSTGRES_OZI_USER', 'user')}:"
-            f"{os.environ.get('POSTGRES_OZI_PASSWORD', 'password')}"
-            f"@{os.environ.get('DASH_DB_HOST', 'localhost')}:"
-            f"{os.environ.get('DASH_DB_PORT', '5432')}/"
-            f"{os.environ.get('DASH_DB_NAME', 'exampledb')}"
-        )
-        engine = sqlalchemy.create_engine(db_url)
-        
+    def load():
+        engine = get_engine()
+
         # Choose query based on source type
+        params = {}
         if source_type == 'stats':
-            query = """
+            query = f"""
                 SELECT 
-                    MIN(cs_stats_timestamp::date) as min_date,
-                    MAX(cs_stats_timestamp::date) as max_date
+                    MIN(cs_stats_timestamp)::date as min_date,
+                    MAX(cs_stats_timestamp)::date as max_date
                 FROM data.country_stat
+                WHERE TRUE {resolution_filter(STATS_RESOLUTION, params)}
             """
         elif source_type == 'connectivity':
             query = """
                 SELECT 
-                    MIN(date::date) as min_date,
-                    MAX(date::date) as max_date
-                FROM data.v_connectivity_index_distinct
+                    MIN(date)::date as min_date,
+                    MAX(date)::date as max_date
+                FROM data.connectivity_index_distinct
             """
         else:  # combined
             query = """
@@ -260,31 +140,30 @@ def get_available_date_range(source_type='combined'):
                 FROM (
                     SELECT cs_stats_timestamp::date as date_col FROM data.country_stat
                     UNION ALL
-                    SELECT date::date as date_col FROM data.v_connectivity_index_distinct
+                    SELECT date::date as date_col FROM data.connectivity_index_distinct
                 ) combined_dates
             """
-        
-        result = pd.read_sql(query, engine)
-        engine.dispose()
-        
+
+        result = pd.read_sql(text(query), engine, params=params)
+
         if not result.empty and result['min_date'].iloc[0] is not None:
             min_date = pd.to_datetime(result['min_date'].iloc[0]).date()
             max_date = pd.to_datetime(result['max_date'].iloc[0]).date()
-            
-            # Cache the result
-            cached_date_ranges[cache_key] = (min_date, max_date)
-            last_date_range_fetch_time[cache_key] = datetime.now()
-            
             return min_date, max_date
-        else:
-            # Fallback to default range if no data
-            today = datetime.now().date()
-            return today - timedelta(days=365*3), today
+        # No data: not cached, so that the range appears once data is loaded
+        return None
+
+    try:
+        date_range = QUERY_CACHE.get_or_load("lookup", ("date_range", source_type), load)
     except Exception as e:
         print(f"Error fetching date range for {source_type}: {e}")
-        # Fallback to default range on error
+        date_range = None
+
+    if date_range is None:
+        # Fallback to default range if no data or on error
         today = datetime.now().date()
         return today - timedelta(days=365*3), today
+    return date_range
 
 # Date Picker for specific data source
 def create_date_picker(picker_id="global-date-picker", source_type='combined', label_suffix=''):
@@ -331,9 +210,10 @@ def create_date_picker(picker_id="global-date-picker", source_type='combined', l
     )
 
 # Layout for Page 1 (Original Dashboard)
-def layout_page1_content(df):
+def layout_page1_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in df["cs_country_iso2"].unique():
+    for country_iso in countries:
         english_name = country_names_en.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {english_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -358,9 +238,10 @@ def layout_page1_content(df):
 
 
 # Layout for Page 2 (Copy of Original Dashboard)
-def layout_page2_content(df):
+def layout_page2_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in df["cs_country_iso2"].unique():
+    for country_iso in countries:
         russian_name = country_names_ru.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {russian_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -384,9 +265,10 @@ def layout_page2_content(df):
 
 
 # Layout for Page 3 - Foreign Neighbours (English)
-def layout_page3_content(connectivity_df):
+def layout_page3_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         english_name = country_names_en.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {english_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -411,9 +293,10 @@ def layout_page3_content(connectivity_df):
 
 
 # Layout for Page 4 - Foreign Neighbours (Russian)
-def layout_page4_content(connectivity_df):
+def layout_page4_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         russian_name = country_names_ru.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {russian_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -438,9 +321,10 @@ def layout_page4_content(connectivity_df):
 
 
 # Layout for Page 5 - Local Neighbours (English)
-def layout_page5_content(connectivity_df):
+def layout_page5_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         english_name = country_names_en.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {english_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -465,9 +349,10 @@ def layout_page5_content(connectivity_df):
 
 
 # Layout for Page 6 - Local Neighbours (Russian)
-def layout_page6_content(connectivity_df):
+def layout_page6_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         russian_name = country_names_ru.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {russian_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -492,9 +377,10 @@ def layout_page6_content(connectivity_df):
 
 
 # Layout for Page 7 - Foreign Share (English)
-def layout_page7_content(connectivity_df):
+def layout_page7_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         english_name = country_names_en.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {english_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -519,9 +405,10 @@ def layout_page7_content(connectivity_df):
 
 
 # Layout for Page 8 - Foreign Share (Russian)
-def layout_page8_content(connectivity_df):
+def layout_page8_content(countries):
+    country_names_en, country_names_ru = fetch_country_names()
     dropdown_options = []
-    for country_iso in connectivity_df["asn_country"].unique():
+    for country_iso in countries:
         russian_name = country_names_ru.get(country_iso, country_iso)
         dropdown_options.append({"label": f"{country_iso}, {russian_name}", "value": country_iso})
     dropdown_options = sorted(dropdown_options, key=lambda k: k["label"])
@@ -545,41 +432,45 @@ def layout_page8_content(connectivity_df):
     ])
 
 
-# Initial Data Fetch for Layouts
-initial_df = fetch_data()
-initial_connectivity_df = fetch_connectivity_data()
-
 app.layout = html.Div(
     [
         dcc.Location(id="url", refresh=False),
+        dcc.Store(id="viewport-width"),
         create_navbar(),
         html.Div(id="page-content")
     ]
 )
 
+# Width of the browser window, the graphs span all of it
+app.clientside_callback(
+    "function(pathname) { return window.innerWidth; }",
+    Output("viewport-width", "data"),
+    Input("url", "pathname"),
+)
+
 
 # Callback to update page content based on URL
 @app.callback(Output("page-content", "children"), Input("url", "pathname"))
 def display_page(pathname):
     if pathname == "/asn-stats" or pathname == "/" or pathname == "/page1":
-        return layout_page1_content(fetch_data())
+        return layout_page1_content(fetch_stats_countries())
     elif pathname.startswith("/asn-timeseries") or pathname == "/page2":
-        return layout_page2_content(fetch_data())
+        return layout_page2_content(fetch_stats_countries())
     elif pathname == "/global-connectivity" or pathname == "/page3":
-        return layout_page3_content(fetch_connectivity_data())
+        return layout_page3_content(fetch_connectivity_countries())
     elif pathname == "/ru/global-connectivity" or pathname == "/page4":
-        return layout_page4_content(fetch_connectivity_data())
+        return layout_page4_content(fetch_connectivity_countries())
     elif pathname == "/local-connectivity" or pathname == "/page5":
-        return layout_page5_content(fetch_connectivity_data())
+        return layout_page5_content(fetch_connectivity_countries())
     elif pathname == "/ru/local-connectivity" or pathname == "/page6":
-        return layout_page6_content(fetch_connectivity_data())
+        return layout_page6_content(fetch_connectivity_countries())
     elif pathname == "/total-share" or pathname == "/page7":
-        return layout_page7_content(fetch_connectivity_data())
+        return layout_page7_content(fetch_connectivity_countries())
     elif pathname == "/ru/total-share" or pathname == "/page8":
-        return layout_page8_content(fetch_connectivity_data())
+        return layout_page8_content(fetch_connectivity_countries())
     else:
         # Default to Page 1
-        return layout_page1_content(fetch_data())
+        return layout_page1_content(fetch_stats_countries())
 
 
 # --- Callbacks for Graphs ---
@@ -590,38 +481,11 @@ def display_page(pathname):
     [Input("interval-component-page1", "n_intervals"),
      Input("country-dropdown-page1", "value"),
      Input("global-date-picker", "start_date"),
-     Input("global-date-picker", "end_date")]
+     Input("global-date-picker", "end_date"),
+     Input("viewport-width", "data")]
 )
-def update_graph_page1(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_data(start_date, end_date)
-    current_df_melted = current_df.melt(
-        id_vars=["cs_country_iso2", "cs_stats_timestamp"],
-        value_vars=["cs_asns_ris", "cs_asns_stats"],
-        var_name="metric",
-        value_name="value",
-    )
-
-    if selected_country:
-        current_df_melted = current_df_melted[current_df_melted["cs_country_iso2"] == selected_country]
-
-    fig = px.scatter(
-        current_df_melted,
-        x="cs_stats_timestamp",
-        y="value",
-        color="metric",
-        category_orders={"metric": ["cs_asns_stats", "cs_asns_ris"]},
-        labels={
-            "cs_stats_timestamp": "",
-            "value": "Number of Autonomous Systems (ASN)",
-            "metric": "Metric",
-        },
-        template="plotly_white",
-    )
-
-    fig.for_each_trace(lambda t: t.update(name=t.name.replace("cs_asns_ris", "ASN RIS").replace("cs_asns_stats", "ASN Stat")))
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified", legend=dict(x=0.5, y=1.05, xanchor="center", yanchor="bottom", orientation="h"))
-    return fig
+def update_graph_page1(n_intervals, selected_country, start_date, end_date, viewport_width):
+    return get_figure("page1", selected_country, start_date, end_date, viewport_width)
 
 
 # Page 2 Callback
@@ -630,31 +494,11 @@ def update_graph_page1(n_intervals, selected_country, start_date, end_date):
     [Input("interval-component-page2", "n_intervals"),
      Input("country-dropdown-page2-single", "value"),
      Input("global-date-picker", "start_date"),
-     Input("global-date-picker", "end_date")]
+     Input("global-date-picker", "end_date"),
+     Input("viewport-width", "data")]
 )
-def update_graph_page2(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_data(start_date, end_date)
-    current_df_melted = current_df.melt(
-        id_vars=["cs_country_iso2", "cs_stats_timestamp"],
-        value_vars=["cs_asns_ris", "cs_asns_stats"],
-        var_name="metric",
-        value_name="value",
-    )
-
-    if selected_country:
-        current_df_melted = current_df_melted[current_df_melted["cs_country_iso2"] == selected_country]
-
-    fig = px.scatter(
-        current_df_melted,
-        x="cs_stats_timestamp",
-        y="value",
-        color="metric",
-        title=f'Country Statistics - Page 2 ({selected_country if selected_country else ""})',
-        labels={"cs_stats_timestamp": "Date", "value": "Value", "cs_country_iso2": "Country"},
-        height=600,
-    )
-    fig.update_layout(hovermode="x unified", legend=dict(x=0.01, y=0.99, xanchor="left", yanchor="top", bgcolor="rgba(255,255,255,0.5)"), yaxis_rangemode="tozero")
-    return fig
+def update_graph_page2(n_intervals, selected_country, start_date, end_date, viewport_width):
+    return get_figure("page2", selected_country, start_date, end_date, viewport_width)
 
 
 # Page 3 Callback
@@ -666,29 +510,7 @@ def update_graph_page2(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page3(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    # Filter by date range if dates are provided
-    if date_from and date_to:
-        current_df['date'] = pd.to_datetime(current_df['date'])
-        date_from_dt = pd.to_datetime(date_from)
-        date_to_dt = pd.to_datetime(date_to)
-        current_df = current_df[(current_df['date'] >= date_from_dt) & (current_df['date'] <= date_to_dt)]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="foreign_neighbour_count",
-        color_discrete_sequence=["#4285F4"],
-        labels={"date": "", "foreign_neighbour_count": "Foreign Neighbours"},
-        template="plotly_white",
-    )
-    fig.update_traces(name="Foreign Neighbours", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page3", selected_country, start_date, end_date)
 
 
 # Page 4 Callback
@@ -700,27 +522,7 @@ def update_graph_page3(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page4(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    if date_from and date_to:
-        current_df = current_df[
-            (current_df["date"] >= date_from) &
-            (current_df["date"] <= date_to)
-        ]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="foreign_neighbour_count",
-        color_discrete_sequence=["#4285F4"],
-        labels={"date": "", "foreign_neighbour_count": "Внешние соседи"},
-    )
-    fig.update_traces(name="Внешние соседи", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page4", selected_country, start_date, end_date)
 
 
 # Page 5 Callback
@@ -732,28 +534,7 @@ def update_graph_page4(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page5(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    if date_from and date_to:
-        current_df = current_df[
-            (current_df["date"] >= date_from) &
-            (current_df["date"] <= date_to)
-        ]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="local_neighbour_count",
-        color_discrete_sequence=["#EA4335"],
-        labels={"date": "", "local_neighbour_count": "Local Neighbours"},
-        template="plotly_white",
-    )
-    fig.update_traces(name="Local Neighbours", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page5", selected_country, start_date, end_date)
 
 
 # Page 6 Callback
@@ -765,28 +546,7 @@ def update_graph_page5(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page6(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    if date_from and date_to:
-        current_df = current_df[
-            (current_df["date"] >= date_from) &
-            (current_df["date"] <= date_to)
-        ]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="local_neighbour_count",
-        color_discrete_sequence=["#EA4335"],
-        labels={"date": "", "local_neighbour_count": "Внутренние соседи"},
-        template="plotly_white",
-    )
-    fig.update_traces(name="Внутренние соседи", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page6", selected_country, start_date, end_date)
 
 
 # Page 7 Callback
@@ -798,22 +558,7 @@ def update_graph_page6(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page7(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="foreign_share_pct",
-        color_discrete_sequence=["#34A853"],
-        labels={"date": "", "foreign_share_pct": "Foreign Neighbours Share %"},
-        template="plotly_white",
-    )
-    fig.update_traces(name="Foreign Share %", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page7", selected_country, start_date, end_date)
 
 
 # Page 8 Callback
@@ -825,22 +570,7 @@ def update_graph_page7(n_intervals, selected_country, start_date, end_date):
      Input("global-date-picker", "end_date")]
 )
 def update_graph_page8(n_intervals, selected_country, start_date, end_date):
-    current_df = fetch_connectivity_data(start_date, end_date)
-    if selected_country:
-        current_df = current_df[current_df["asn_country"] == selected_country]
-    
-    fig = px.area(
-        current_df,
-        x="date",
-        y="foreign_share_pct",
-        color_discrete_sequence=["#34A853"],
-        labels={"date": "", "foreign_share_pct": "Доля внешних соседей %"},
-        template="plotly_white",
-    )
-    fig.update_traces(name="Доля внешних %", showlegend=False)
-    fig.update_yaxes(rangemode="tozero")
-    fig.update_layout(hovermode="x unified")
-    return fig
+    return get_figure("page8", selected_country, start_date, end_date)
 
 if __name__ == "__main__":
     app.run_server(debug=True, host="0.0.0.0", port=8050)
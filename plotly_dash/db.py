@@ -0,0 +1,61 @@
+import os
+import threading
+import urllib.parse
+
+import sqlalchemy
+
+# Connections kept by every gunicorn worker; the overflow absorbs bursts
+DB_POOL_SIZE = int(os.environ.get("DASH_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DASH_DB_MAX_OVERFLOW", "5"))
+# Seconds a callback waits for a free connection before failing
+DB_POOL_TIMEOUT = int(os.environ.get("DASH_DB_POOL_TIMEOUT", "10"))
+# Dashboard queries running longer than this are cancelled by the server
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DASH_DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_database_url():
+    return (
+        f"postgresql://{os.environ.get('POSTGRES_OZI_USER', 'user')}:"
+        f"{urllib.parse.quote(os.environ.get('POSTGRES_OZI_PASSWORD', 'password'))}"
+        f"@{os.environ.get('DASH_DB_HOST', 'localhost')}:"
+        f"{os.environ.get('DASH_DB_PORT', '5432')}/"
+        f"{os.environ.get('DASH_DB_NAME', 'exampledb')}"
+    )
+
+
+def create_engine():
+    return sqlalchemy.create_engine(
+        get_database_url(),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,  # survive database restarts
+        pool_recycle=1800,
+        connect_args={
+            "application_name": "ozi-dash",
+            "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+        },
+    )
+
+
+def get_engine():
+    """
+    Engine shared by all callbacks of the current process. Connections must not
+    be shared across a fork, so a worker forked from a process that already
+    had an engine gets a new one.
+    """
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                if _engine is not None:
+                    # Drop the parent's connections without closing them for it
+                    _engine.dispose(close=False)
+                _engine = create_engine()
+                _engine_pid = pid
+    return _engine
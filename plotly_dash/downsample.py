@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Width assumed for a chart until the browser has reported its viewport
+DEFAULT_WIDTH_PX = int(os.environ.get("DASH_CHART_WIDTH_PX", "1200"))
+MIN_WIDTH_PX = 300
+MAX_WIDTH_PX = 3840
+# A bucket keeps its minimum and its maximum
+POINTS_PER_BUCKET = 2
+
+
+def max_points_for_width(width_px):
+    """
+    Number of points worth sending for a chart width_px pixels wide: the
+    selected date window is split into one bucket per pixel column, so the
+    bucket duration follows from the window and the width
+    """
+    width_px = int(width_px or DEFAULT_WIDTH_PX)
+    return min(max(width_px, MIN_WIDTH_PX), MAX_WIDTH_PX) * POINTS_PER_BUCKET
+
+
+def min_max_downsample(df, x, y, max_points, by=None):
+    """
+    Reduce every series of df to at most max_points rows by splitting its x
+    range into equal buckets and keeping the rows with the minimum and the
+    maximum of y in each bucket. Peaks and drops stay visible, which averaging
+    would hide. Series that already fit are returned unchanged.
+
+    Args:
+        df: frame sorted by x, x being datetimes or numbers
+        x, y: columns of the axes
+        max_points: maximum number of rows kept per series
+        by: column separating several series, e.g. the metric of a melted frame
+    """
+    if by is not None:
+        if df.empty:
+            return df
+        return pd.concat(
+            min_max_downsample(part, x, y, max_points)
+            for _, part in df.groupby(by, sort=False)
+        )
+
+    if len(df) <= max_points:
+        return df
+
+    df = df[df[y].notna()]
+    if len(df) <= max_points:
+        return df
+
+    n_buckets = max(max_points // POINTS_PER_BUCKET, 1)
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[ns]").astype(np.int64)
+    xs = xs.astype(np.float64)
+    span = xs[-1] - xs[0]
+    if span <= 0:
+        return df.iloc[:max_points]
+    buckets = np.minimum(((xs - xs[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+
+    values = df[y].reset_index(drop=True)
+    grouped = values.groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return df.iloc[keep]
@@ -0,0 +1,150 @@
+import json
+
+import plotly.express as px
+
+from cache import QUERY_CACHE
+from downsample import max_points_for_width, min_max_downsample
+from queries import fetch_connectivity, fetch_dataset_version, fetch_stats, parse_date
+
+
+def melt_stats(df, max_points):
+    df_melted = df.melt(
+        id_vars=["cs_country_iso2", "cs_stats_timestamp"],
+        value_vars=["cs_asns_ris", "cs_asns_stats"],
+        var_name="metric",
+        value_name="value",
+    )
+    # 5 minute data over long windows is far more than the graph can show
+    return min_max_downsample(df_melted, "cs_stats_timestamp", "value", max_points, by="metric")
+
+
+def stats_page1(df, country, max_points):
+    fig = px.scatter(
+        melt_stats(df, max_points),
+        x="cs_stats_timestamp",
+        y="value",
+        color="metric",
+        category_orders={"metric": ["cs_asns_stats", "cs_asns_ris"]},
+        labels={
+            "cs_stats_timestamp": "",
+            "value": "Number of Autonomous Systems (ASN)",
+            "metric": "Metric",
+        },
+        template="plotly_white",
+    )
+
+    fig.for_each_trace(lambda t: t.update(name=t.name.replace("cs_asns_ris", "ASN RIS").replace("cs_asns_stats", "ASN Stat")))
+    fig.update_yaxes(rangemode="tozero")
+    fig.update_layout(hovermode="x unified", legend=dict(x=0.5, y=1.05, xanchor="center", yanchor="bottom", orientation="h"))
+    return fig
+
+
+def stats_page2(df, country, max_points):
+    fig = px.scatter(
+        melt_stats(df, max_points),
+        x="cs_stats_timestamp",
+        y="value",
+        color="metric",
+        title=f'Country Statistics - Page 2 ({country if country else ""})',
+        labels={"cs_stats_timestamp": "Date", "value": "Value", "cs_country_iso2": "Country"},
+        height=600,
+    )
+    fig.update_layout(hovermode="x unified", legend=dict(x=0.01, y=0.99, xanchor="left", yanchor="top", bgcolor="rgba(255,255,255,0.5)"), yaxis_rangemode="tozero")
+    return fig
+
+
+def stats_static(df, country, max_points):
+    fig = px.line(
+        melt_stats(df, max_points),
+        x="cs_stats_timestamp",
+        y="value",
+        color="metric",
+        line_dash="metric",
+        title=f"Country Statistics Over Time ({country}) - ASNs RIS vs Stats",
+        labels={
+            "cs_stats_timestamp": "Date",
+            "value": "Value",
+            "cs_country_iso2": "Country",
+        },
+        height=600,
+    )
+
+    fig.update_layout(
+        hovermode="x unified",
+        legend_itemclick="toggleothers",
+        legend=dict(
+            x=0.01,
+            y=0.99,
+            xanchor="left",
+            yanchor="top",
+            bgcolor="rgba(255,255,255,0.5)",
+        ),
+    )
+    return fig
+
+
+def connectivity_area(y, color, label, trace_name, template="plotly_white"):
+    def build(df, country, max_points):
+        fig = px.area(
+            df,
+            x="date",
+            y=y,
+            color_discrete_sequence=[color],
+            labels={"date": "", y: label},
+            template=template,
+        )
+        fig.update_traces(name=trace_name, showlegend=False)
+        fig.update_yaxes(rangemode="tozero")
+        fig.update_layout(hovermode="x unified")
+        return fig
+
+    return build
+
+
+# page -> (dataset it is built from, builder)
+FIGURES = {
+    "page1": ("country_stat", stats_page1),
+    "page2": ("country_stat", stats_page2),
+    "page3": ("connectivity_index_distinct", connectivity_area(
+        "foreign_neighbour_count", "#4285F4", "Foreign Neighbours", "Foreign Neighbours")),
+    "page4": ("connectivity_index_distinct", connectivity_area(
+        "foreign_neighbour_count", "#4285F4", "Внешние соседи", "Внешние соседи", template=None)),
+    "page5": ("connectivity_index_distinct", connectivity_area(
+        "local_neighbour_count", "#EA4335", "Local Neighbours", "Local Neighbours")),
+    "page6": ("connectivity_index_distinct", connectivity_area(
+        "local_neighbour_count", "#EA4335", "Внутренние соседи", "Внутренние соседи")),
+    "page7": ("connectivity_index_distinct", connectivity_area(
+        "foreign_share_pct", "#34A853", "Foreign Neighbours Share %", "Foreign Share %")),
+    "page8": ("connectivity_index_distinct", connectivity_area(
+        "foreign_share_pct", "#34A853", "Доля внешних соседей %", "Доля внешних %")),
+    "static": ("country_stat", stats_static),
+}
+
+
+def get_figure(page, country, start_date=None, end_date=None, width_px=None, df=None):
+    """
+    Figure of a page for one country and date range, as a dict ready for
+    dcc.Graph or plotly.io.write_html.
+
+    The figure JSON is cached with the version of the country's data in
+    data.dataset_version, so it is built once per ETL load and then served
+    to every user of every page, and to generate_static_graph.
+
+    df may hold the data of the country when the caller already loaded it,
+    it is only used when the figure is not cached.
+    """
+    dataset, build = FIGURES[page]
+    start_date, end_date = parse_date(start_date), parse_date(end_date)
+    max_points = max_points_for_width(width_px) if dataset == "country_stat" else None
+    version = fetch_dataset_version(dataset, country)
+
+    def load():
+        data = df
+        if data is None and dataset == "country_stat":
+            data = fetch_stats(country, start_date, end_date, version=version)
+        elif data is None:
+            data = fetch_connectivity(country, start_date, end_date, version=version)
+        return build(data, country, max_points).to_json()
+
+    key = ("figure", page, country, start_date, end_date, max_points, version)
+    return json.loads(QUERY_CACHE.get_or_load("figure", key, load))
@@ -1,109 +1,83 @@
 import os
-import plotly.express as px
-import sqlalchemy
-import pandas as pd
-from datetime import datetime, timedelta
+import time
+import plotly.io as pio
+import plotly.offline
+from concurrent.futures import ProcessPoolExecutor
+from figures import get_figure
+from queries import fetch_stats_countries, fetch_stats_for_countries
 import argparse
+from functools import partial
 
-# Global variables for caching (though less critical for a one-off script, good practice)
-last_data_fetch_time = None
-cached_df = None
-country_names_ru = {}
-CACHE_TTL_SECONDS = 60  # Cache will be considered stale after 60 seconds
-
-
-def fetch_data():
-    global last_data_fetch_time, cached_df, country_names_ru
-
-    # Check if cached data is still fresh
-    if (
-        cached_df is not None
-        and last_data_fetch_time is not None
-        and (datetime.now() - last_data_fetch_time).total_seconds() < CACHE_TTL_SECONDS
-    ):
-        print("Serving data from cache.")
-        return cached_df
-
-    print("Fetching new data from database...")
-    db_url = (
-        f"postgresql://{os.environ.get('POSTGRES_OZI_USER', 'user')}:"
-        f"{os.environ.get('POSTGRES_OZI_PASSWORD', 'password')}"
-        f"@{os.environ.get('DASH_DB_HOST', 'localhost')}:"
-        f"{os.environ.get('DASH_DB_PORT', '5432')}/"
-        f"{os.environ.get('DASH_DB_NAME', 'exampledb')}"
-    )
-    engine = sqlalchemy.create_engine(db_url)
-
-    # Fetch country statistics data
-    query_stats = """SELECT
-                cs_country_iso2,
-                cs_stats_timestamp,
-                cs_asns_ris,
-                cs_asns_stats
-             FROM data.country_stat
-             ORDER BY cs_stats_timestamp;"""
-    df = pd.read_sql(query_stats, engine)
-
-    # Fetch country names in Russian
-    query_countries = "SELECT c_iso2, c_name_ru FROM data.country;"
-    df_countries = pd.read_sql(query_countries, engine)
-    engine.dispose()
-
-    # Populate country_names_ru dictionary
-    country_names_ru = {
-        row["c_iso2"]: row["c_name_ru"] for index, row in df_countries.iterrows()
-    }
-
-    # Update cache and timestamp
-    cached_df = df
-    last_data_fetch_time = datetime.now()
-
-    return df
-
-
-def generate_graph_for_country(country_code):
-    df = fetch_data()
-
-    df_melted = df.melt(
-        id_vars=["cs_country_iso2", "cs_stats_timestamp"],
-        value_vars=["cs_asns_ris", "cs_asns_stats"],
-        var_name="metric",
-        value_name="value",
-    )
+PLOTLYJS_FILENAME = "plotly.min.js"
 
-    if country_code:
-        df_melted = df_melted[df_melted["cs_country_iso2"] == country_code]
-    else:
+
+def generate_graph_for_country(country_code, df=None):
+    if not country_code:
         print("No country code provided. Cannot generate graph.")
         return None
+    # Shared with the dashboard through the cache, rebuilt after ETL loads only
+    return get_figure("static", country_code, df=df)
 
-    fig = px.line(
-        df_melted,
-        x="cs_stats_timestamp",
-        y="value",
-        color="metric",
-        line_dash="metric",
-        title=f"Country Statistics Over Time ({country_code}) - ASNs RIS vs Stats",
-        labels={
-            "cs_stats_timestamp": "Date",
-            "value": "Value",
-            "cs_country_iso2": "Country",
-        },
-        height=600,
-    )
 
-    fig.update_layout(
-        hovermode="x unified",
-        legend_itemclick="toggleothers",
-        legend=dict(
-            x=0.01,
-            y=0.99,
-            xanchor="left",
-            yanchor="top",
-            bgcolor="rgba(255,255,255,0.5)",
-        ),
-    )
-    return fig
+def write_graph_for_country(country_code, df, output_dir, include_plotlyjs):
+    fig = generate_graph_for_country(country_code, df)
+    if not fig:
+        return None
+    output_path = os.path.join(output_dir, f"country_stats_{country_code.lower()}.html")
+    html = pio.to_html(fig, include_plotlyjs=include_plotlyjs, full_html=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return output_path
+
+
+def write_plotlyjs(output_dir):
+    # One copy for all graphs, referenced by include_plotlyjs="directory"
+    path = os.path.join(output_dir, PLOTLYJS_FILENAME)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(plotly.offline.get_plotlyjs())
+    return path
+
+
+def graph_result(country_code, render):
+    # One failing country must not discard the graphs of the others
+    try:
+        return render()
+    except Exception as e:
+        print(f"Error generating graph for {country_code}: {e!r}")
+        return None
+
+
+def generate_graphs(countries, output_dir, workers, include_plotlyjs="directory"):
+    """
+    Load the series of all countries with one query, split them with a single
+    groupby and render the graphs on a pool of processes.
+    """
+    started = time.monotonic()
+    df = fetch_stats_for_countries(countries)
+    frames = dict(tuple(df.groupby("cs_country_iso2", sort=False)))
+    empty = df.iloc[0:0]
+    print(f"Fetched {len(df)} records for {len(frames)} countries in {time.monotonic() - started:.1f}s")
+
+    if include_plotlyjs == "directory":
+        write_plotlyjs(output_dir)
+
+    tasks = [(cc, frames.get(cc, empty), output_dir, include_plotlyjs) for cc in countries]
+    failed = []
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {task[0]: executor.submit(write_graph_for_country, *task) for task in tasks}
+            results = {cc: graph_result(cc, future.result) for cc, future in futures.items()}
+    else:
+        results = {task[0]: graph_result(task[0], partial(write_graph_for_country, *task)) for task in tasks}
+
+    for country_code, output_path in results.items():
+        if output_path:
+            print(f"Graph saved to {output_path}")
+        else:
+            print(f"Failed to generate graph for {country_code}.")
+            failed.append(country_code)
+    print(f"Generated {len(results) - len(failed)} graphs in {time.monotonic() - started:.1f}s")
+    return failed
 
 
 if __name__ == "__main__":
@@ -121,6 +95,18 @@ if __name__ == "__main__":
         default="./generated_graphs",
         help="Directory to save the generated HTML files.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes rendering graphs (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--plotlyjs",
+        choices=["directory", "cdn"],
+        default="directory",
+        help=f"Reference plotly.js as one shared {PLOTLYJS_FILENAME} in the output directory (default) or from the CDN.",
+    )
     args = parser.parse_args()
 
     output_dir = args.output_dir
@@ -129,19 +115,8 @@ if __name__ == "__main__":
     countries_to_process = []
     if "all" in [cc.lower() for cc in args.country_codes]:
         print("Generating graphs for all countries...")
-        # Fetch all country codes from the database
-        df_all_countries = fetch_data()  # This will also populate country_names_ru
-        countries_to_process = list(df_all_countries["cs_country_iso2"].unique())
+        countries_to_process = fetch_stats_countries()
     else:
         countries_to_process = [cc.upper() for cc in args.country_codes]
 
-    for country_code in countries_to_process:
-        print(f"Generating graph for {country_code}...")
-        fig = generate_graph_for_country(country_code)
-        if fig:
-            output_filename = f"country_stats_{country_code.lower()}.html"
-            output_path = os.path.join(output_dir, output_filename)
-            fig.write_html(output_path, auto_open=False, full_html=True)
-            print(f"Graph saved to {output_path}")
-        else:
-            print(f"Failed to generate graph for {country_code}.")
+    generate_graphs(countries_to_process, output_dir, args.workers, args.plotlyjs)
@@ -0,0 +1,177 @@
+import os
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from cache import QUERY_CACHE
+from db import get_engine
+
+# Resolution of data.country_stat shown on the ASN statistics pages and the
+# static graphs, e.g. 1d or 5m. Unset, all resolutions are shown
+STATS_RESOLUTION = os.environ.get("DASH_STATS_RESOLUTION") or None
+
+STATS_COLUMNS = ["cs_country_iso2", "cs_stats_timestamp", "cs_asns_ris", "cs_asns_stats"]
+CONNECTIVITY_COLUMNS = [
+    "asn_country",
+    "date",
+    "asn_count",
+    "foreign_neighbour_count",
+    "local_neighbour_count",
+    "total_neighbour_count",
+    "foreign_share_pct",
+]
+
+
+def parse_date(value):
+    # DatePickerRange sends 'YYYY-MM-DD', sometimes followed by a time
+    if not value:
+        return None
+    return pd.to_datetime(value).date()
+
+
+def date_filter(column, start_date, end_date, params):
+    # The end date is inclusive, whatever the time of the rows on that day
+    conditions = []
+    if start_date:
+        conditions.append(f"{column} >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append(f"{column} < :end_date")
+        params["end_date"] = end_date + timedelta(days=1)
+    return "".join(f" AND {c}" for c in conditions)
+
+
+def resolution_filter(resolution, params):
+    # No resolution for the rows of all resolutions
+    if not resolution:
+        return ""
+    params["resolution"] = resolution
+    return " AND cs_stats_resolution = :resolution"
+
+
+def fetch_country_names():
+    """
+    Returns two dictionaries mapping ISO2 codes to English and Russian names
+    """
+    def load():
+        df = pd.read_sql("SELECT c_iso2, c_name, c_name_ru FROM data.country;", get_engine())
+        return dict(zip(df["c_iso2"], df["c_name"])), dict(zip(df["c_iso2"], df["c_name_ru"]))
+
+    return QUERY_CACHE.get_or_load("lookup", ("country_names",), load)
+
+
+def fetch_stats_countries(resolution=STATS_RESOLUTION):
+    """
+    Countries with statistics of the given resolution, for the dropdowns
+    """
+    params = {}
+    query = text(
+        f"""SELECT c_iso2
+              FROM data.country c
+             WHERE EXISTS (SELECT 1 FROM data.country_stat
+                            WHERE cs_country_iso2 = c.c_iso2
+                              {resolution_filter(resolution, params)})
+             ORDER BY c_iso2;"""
+    )
+    return QUERY_CACHE.get_or_load(
+        "lookup",
+        ("stats_countries", resolution),
+        lambda: pd.read_sql(query, get_engine(), params=params)["c_iso2"].tolist(),
+    )
+
+
+def fetch_connectivity_countries():
+    """
+    Countries with a connectivity index, for the dropdowns
+    """
+    query = text(
+        """SELECT c_iso2
+             FROM data.country c
+            WHERE EXISTS (SELECT 1 FROM data.connectivity_index_distinct d
+                           WHERE d.asn_country = c.c_iso2)
+            ORDER BY c_iso2;"""
+    )
+    return QUERY_CACHE.get_or_load(
+        "lookup",
+        ("connectivity_countries",),
+        lambda: pd.read_sql(query, get_engine())["c_iso2"].tolist(),
+    )
+
+
+def fetch_dataset_version(dataset, country):
+    """
+    Version of the data of a country in data.dataset_version, bumped by every
+    ETL load of new rows. Looked up again after the "version" TTL only.
+    """
+    def load():
+        df = pd.read_sql("SELECT dataset, country_iso2, version FROM data.dataset_version;", get_engine())
+        return {(row.dataset, row.country_iso2): row.version for row in df.itertuples()}
+
+    return QUERY_CACHE.get_or_load("version", ("dataset_versions",), load).get((dataset, country), 0)
+
+
+def fetch_stats(country, start_date=None, end_date=None, resolution=STATS_RESOLUTION, version=None):
+    """
+    ASN counts of one country and resolution between two dates (inclusive)
+
+    Args:
+        country: ISO2 code, no country gives an empty frame
+        start_date, end_date: dates as sent by the date picker, None for no bound
+        resolution: '1d', '5m' or None for all resolutions
+        version: version of the data, see fetch_dataset_version, part of the cache key
+    """
+    if not country:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    start_date, end_date = parse_date(start_date), parse_date(end_date)
+
+    def load():
+        params = {"country": country}
+        query = f"""SELECT {", ".join(STATS_COLUMNS)}
+                      FROM data.country_stat
+                     WHERE cs_country_iso2 = :country
+                       {resolution_filter(resolution, params)}
+                       {date_filter("cs_stats_timestamp", start_date, end_date, params)}
+                     ORDER BY cs_stats_timestamp;"""
+        df = pd.read_sql(text(query), get_engine(), params=params)
+        print(f"Fetched {len(df)} stats records for {country} {resolution} {start_date} - {end_date}")
+        return df
+
+    return QUERY_CACHE.get_or_load("series", ("stats", country, resolution, start_date, end_date, version), load)
+
+
+def fetch_connectivity(country, start_date=None, end_date=None, version=None):
+    """
+    Connectivity index of one country between two dates (inclusive)
+    """
+    if not country:
+        return pd.DataFrame(columns=CONNECTIVITY_COLUMNS)
+    start_date, end_date = parse_date(start_date), parse_date(end_date)
+
+    def load():
+        params = {"country": country}
+        query = f"""SELECT {", ".join(CONNECTIVITY_COLUMNS)}
+                      FROM data.connectivity_index_distinct
+                     WHERE asn_country = :country
+                       {date_filter("date", start_date, end_date, params)}
+                     ORDER BY date;"""
+        df = pd.read_sql(text(query), get_engine(), params=params)
+        print(f"Fetched {len(df)} connectivity records for {country} {start_date} - {end_date}")
+        return df
+
+    return QUERY_CACHE.get_or_load("series", ("connectivity", country, start_date, end_date, version), load)
+
+
+def fetch_stats_for_countries(countries, resolution=STATS_RESOLUTION):
+    """
+    Whole series of several countries in one query, for batch jobs. Not cached.
+    """
+    params = {"countries": list(countries)}
+    query = text(
+        f"""SELECT {", ".join(STATS_COLUMNS)}
+              FROM data.country_stat
+             WHERE cs_country_iso2 = ANY(:countries)
+               {resolution_filter(resolution, params)}
+             ORDER BY cs_country_iso2, cs_stats_timestamp;"""
+    )
+    return pd.read_sql(query, get_engine(), params=params)
@@ -1,4 +1,5 @@
 REFRESH MATERIALIZED VIEW data.vm_current_asn;
 REFRESH MATERIALIZED VIEW data.vm_asn_neighbour;
-REFRESH MATERIALIZED VIEW data.vm_connectivity_index_by_country;
-REFRESH MATERIALIZED VIEW data.vm_connectivity_index_by_asn_top10;
+-- Full rebuild of the connectivity summaries; the ETL keeps them up to date
+-- for the dates it loads (see data.refresh_connectivity_summary)
+SELECT data.refresh_connectivity_summary();